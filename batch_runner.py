@@ -0,0 +1,272 @@
+"""
+Batch runner: execute a manifest of cases x backends x repeats on a process pool.
+
+Replaces the copy-pasted drivers (llama-violation-{,2..5}.py,
+test-llama-violation-*.py, gwen-violation-*.py, *-syntax.py), which differ
+only in hard-coded model paths, backend and scenario/property set. Each job
+runs main.run_refinement in its own process and working directory, so jobs
+never share model files, checkpoints or run records:
+
+    results/
+        manifest.yaml
+        summary.json, summary.csv
+        <backend>/<case>/rep-<n>/
+            log.txt  generated_model.smv  final_safe_model.smv  run_record.json
+            checkpoints/<case>.json
+
+Usage: python batch_runner.py batch_manifest.yaml [workers]
+
+With `workspace: tmpfs` (or `temp`) in the manifest, a job's model files live in
+a private workspace on /dev/shm (or the temporary directory) while it runs and
+are archived into its results directory when it ends; checkpoints and logs are
+always written to the results directory.
+
+Jobs that already finished are skipped and interrupted jobs resume from their
+checkpoints, so re-running a manifest completes the matrix.
+
+With `metrics_port` and/or `metrics_file` in the manifest, live counters (LLM calls in
+flight, tokens, NuSMV runs, cache hits, queue depth, iterations per case) are served
+in Prometheus format while the batch runs (see metrics.py).
+"""
+
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+import yaml
+
+import checkpoint
+import main
+import metrics
+from checkpoint import FINISHED, checkpoint_path, load_checkpoint
+from metrics import CASE_ITERATIONS, JOB_SECONDS, JOBS_COMPLETED, JOBS_RUNNING, JOBS_TOTAL, MetricsExporter
+from run_store import RunStore
+from token_budget import TokenLedger
+from workspace import Workspace
+
+SUMMARY_FIELDS = ["job", "case", "backend", "repeat", "status", "phase1_iterations", "phase2_iterations",
+                  "violations", "prompt_tokens", "completion_tokens", "elapsed", "model_hash", "error"]
+
+
+def load_manifest(path):
+    """
+    Read a batch manifest (YAML):
+    - cases: predefined case names (main.PREDEFINED_CASES) or dicts with
+      name, scenarios and safety_properties
+    - backends: backend names, e.g. [lambda, qwen]; "lambda,vllm" routes/hedges across both
+    - repeats: runs per case and backend (default 1)
+    - input_model: optional path template such as "Ground-Truth-NuSMV-llama-2/{case}.smv";
+      Process 2 then starts from that model instead of running Process 1
+    - edit_mode, session_mode, samples, pipelined: as in main()
+    - deadline: wall-clock seconds per job (default: none)
+    - workspace: "tmpfs" or "temp" to run jobs in a private workspace there (default:
+      run in the results directory)
+    - workers: size of the process pool (default: CPU count)
+    - output_dir: results tree root (default: results)
+    - run_store: event store file shared by all jobs, relative to output_dir
+      (e.g. runs.sqlite; see run_store.py; default: none)
+    - metrics_port: serve live metrics on http://127.0.0.1:<port>/metrics (default: none)
+    - metrics_file: Prometheus textfile rewritten every second, relative to output_dir
+      (e.g. for node_exporter's textfile collector; default: none)
+    """
+    with open(path, 'r') as f:
+        manifest = yaml.safe_load(f)
+    for key in ("cases", "backends"):
+        if not manifest.get(key):
+            raise ValueError(f"Manifest {path} has no {key}")
+    return manifest
+
+
+def expand_jobs(manifest, base_dir="."):
+    """
+    One job dict per (case, backend, repeat), with its own absolute working directory.
+    """
+    output_dir = os.path.abspath(os.path.join(base_dir, manifest.get("output_dir", "results")))
+    run_store = os.path.join(output_dir, manifest["run_store"]) if manifest.get("run_store") else None
+    jobs = []
+    for case in manifest["cases"]:
+        if isinstance(case, str):
+            if case not in main.PREDEFINED_CASES:
+                raise ValueError(f"Unknown case {case!r} (choose from {', '.join(main.PREDEFINED_CASES)})")
+            name = case
+            scenarios, safety_properties = main.PREDEFINED_CASES[case]
+        else:
+            name, scenarios, safety_properties = case["name"], case["scenarios"], case["safety_properties"]
+        input_model = None
+        if manifest.get("input_model"):
+            input_model = os.path.abspath(os.path.join(base_dir, manifest["input_model"].format(case=name)))
+        for backend in manifest["backends"]:
+            for repeat in range(1, manifest.get("repeats", 1) + 1):
+                backend_dir = backend.replace(",", "+")
+                jobs.append({
+                    "job": f"{backend_dir}/{name}/rep-{repeat}",
+                    "case": name,
+                    "backend": backend,
+                    "repeat": repeat,
+                    "scenarios": scenarios,
+                    "safety_properties": safety_properties,
+                    "input_model": input_model,
+                    "dir": os.path.join(output_dir, backend_dir, name, f"rep-{repeat}"),
+                    "edit_mode": manifest.get("edit_mode", "full"),
+                    "session_mode": manifest.get("session_mode", False),
+                    "samples": manifest.get("samples", 1),
+                    "pipelined": manifest.get("pipelined", False),
+                    "deadline": manifest.get("deadline"),
+                    "workspace": manifest.get("workspace"),
+                    "run_store": run_store
+                })
+    return output_dir, jobs
+
+
+def job_summary(job, error=None):
+    """
+    Summary row of a job, read from the run record and checkpoint in its directory.
+    """
+    record = {}
+    record_file = os.path.join(job["dir"], main.RUN_RECORD_FILE)
+    if os.path.exists(record_file):
+        with open(record_file, 'r') as f:
+            record = json.load(f)
+    state = load_checkpoint(checkpoint_path(job["case"], os.path.join(job["dir"], "checkpoints"))) or {}
+    phase2 = record.get("phase2", [])
+    totals = record.get("totals", {})
+    return {
+        "job": job["job"],
+        "case": job["case"],
+        "backend": job["backend"],
+        "repeat": job["repeat"],
+        "status": "error" if error else state.get("status", "not started"),
+        "phase1_iterations": len(record.get("phase1", [])),
+        "phase2_iterations": len(phase2),
+        "violations": phase2[-1].get("violations") if phase2 else None,
+        "prompt_tokens": totals.get("prompt_tokens", 0),
+        "completion_tokens": totals.get("completion_tokens", 0),
+        "elapsed": round(state.get("elapsed", 0.0), 1),
+        "model_hash": state.get("model_hash"),
+        "error": error
+    }
+
+
+def run_job(job):
+    """
+    Run one job in its directory or workspace (in a pool process); console output goes
+    to log.txt. Returns its summary row.
+    """
+    os.makedirs(job["dir"], exist_ok=True)
+    checkpoint.CHECKPOINT_DIR = os.path.join(job["dir"], "checkpoints")
+    state = load_checkpoint(checkpoint_path(job["case"]))
+    if state and state["status"] == FINISHED:
+        return job_summary(job)
+
+    JOBS_RUNNING.inc()
+    metrics.flush()
+    workspace = None
+    if job["workspace"]:
+        workspace = Workspace(prefix=job["job"].replace("/", "_") + "-",
+                              root="tmpfs" if job["workspace"] == "tmpfs" else None, archive_to=job["dir"])
+    os.chdir(workspace.path if workspace else job["dir"])
+    error = None
+    with open(os.path.join(job["dir"], "log.txt"), 'a', encoding="utf-8") as log, redirect_stdout(log):
+        try:
+            # Fresh per-job state: routing for this job's backend, its own token ledger and deadline
+            main.llm_router = main.make_llm_router(job["backend"])
+            main.token_ledger = TokenLedger(run_budget=main.RUN_TOKEN_BUDGET, case_budget=main.CASE_TOKEN_BUDGET)
+            main.CASE_DEADLINE = job["deadline"]
+            if job["run_store"] and (main.run_store is None or main.run_store.path != job["run_store"]):
+                # One connection per pool process; SQLite serializes the appends
+                main.run_store = RunStore(job["run_store"])
+            if state and state["phase"] == "phase2":
+                main.resume_case(job["case"])
+            else:
+                main.token_ledger.begin_case(job["case"])
+                main.run_clock.update(start=time.perf_counter(), offset=0.0)
+                run_record = {"case": job["case"], "backend": job["backend"], "repeat": job["repeat"],
+                              "edit_mode": job["edit_mode"], "session_mode": job["session_mode"],
+                              "samples": job["samples"], "pipelined": job["pipelined"]}
+                main.run_refinement(run_record, job["scenarios"], job["safety_properties"],
+                                    input_model=job["input_model"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"❌ Job failed: {error}")
+        finally:
+            if workspace:
+                os.chdir(job["dir"])
+                workspace.close()
+            JOBS_RUNNING.dec()
+            metrics.flush()
+    return job_summary(job, error)
+
+
+def write_summary(output_dir, rows):
+    rows = sorted(rows, key=lambda row: row["job"])
+    with open(os.path.join(output_dir, "summary.json"), 'w') as f:
+        json.dump(rows, f, indent=2)
+    with open(os.path.join(output_dir, "summary.csv"), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_batch(manifest_file, workers=None):
+    """
+    Run every job of a manifest on a process pool and write the summary tables.
+    Returns the summary rows.
+    """
+    manifest = load_manifest(manifest_file)
+    output_dir, jobs = expand_jobs(manifest, os.path.dirname(os.path.abspath(manifest_file)))
+    workers = workers or manifest.get("workers") or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copy(manifest_file, os.path.join(output_dir, "manifest.yaml"))
+
+    print(f"Running {len(jobs)} job(s) on {workers} worker(s); results in {output_dir}")
+    rows = []
+    start = time.perf_counter()
+    exporter = None
+    pool_options = {}
+    if manifest.get("metrics_port") or manifest.get("metrics_file"):
+        metrics_dir = os.path.join(output_dir, metrics.SNAPSHOT_DIR)
+        metrics_file = os.path.join(output_dir, manifest["metrics_file"]) if manifest.get("metrics_file") else None
+        exporter = MetricsExporter(metrics_dir, manifest.get("metrics_port"), metrics_file)
+        pool_options = {"initializer": metrics.start_worker, "initargs": (metrics_dir,)}
+        JOBS_TOTAL.set(len(jobs))
+    with ProcessPoolExecutor(max_workers=workers, **pool_options) as pool:
+        futures = {pool.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                # The worker process itself died
+                row = job_summary(job, f"{type(e).__name__}: {e}")
+            rows.append(row)
+            JOBS_COMPLETED.inc(status=row["status"])
+            CASE_ITERATIONS.observe(row["phase1_iterations"], phase="phase1")
+            CASE_ITERATIONS.observe(row["phase2_iterations"], phase="phase2")
+            JOB_SECONDS.observe(row["elapsed"])
+            mark = "✓" if row["status"] == FINISHED and row["violations"] == 0 else "⚠"
+            print(f"{mark} [{len(rows)}/{len(jobs)}] {row['job']}: {row['status']}, "
+                  f"{row['violations'] if row['violations'] is not None else '-'} violation(s), "
+                  f"{row['phase1_iterations']}+{row['phase2_iterations']} iteration(s)"
+                  + (f" ({row['error']})" if row["error"] else ""))
+            write_summary(output_dir, rows)
+    if exporter:
+        exporter.close()
+
+    solved = sum(1 for row in rows if row["status"] == FINISHED and row["violations"] == 0)
+    print(f"\n{solved}/{len(rows)} job(s) reached a safe model in {time.perf_counter() - start:.0f}s")
+    if jobs and jobs[0]["run_store"]:
+        import analytics  # pandas is only needed for the report
+        analytics.report(jobs[0]["run_store"])
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python batch_runner.py <manifest.yaml> [workers]")
+        sys.exit(1)
+    run_batch(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,356 @@
+"""
+End-to-end performance benchmark with replayed LLM transcripts.
+
+Measuring the pipeline used to require live LLM endpoints, so slowdowns in the
+NuSMV, parsing and refinement code went unnoticed. This benchmark replays the
+LLM responses recorded in a run store (run_store.py; historical console logs can
+be imported with log_import.py) through llm_backends.ReplayBackend and runs the
+real refinement loop (main.run_refinement), real NuSMV included, for every
+predefined scenario x property case that has a recorded run.
+
+For each case it reports the wall time, the exclusive time of each pipeline
+stage (summed over threads):
+
+    llm         replayed LLM calls (token accounting, response cleanup)
+    nusmv       NuSMV syntax checks and verification runs
+    parse       NuSMV output parsing (errors, counterexamples, verdicts)
+    autofix     rule-based syntax fixes (nusmv_autofix)
+    prompt      prompt construction and compaction
+    checkpoint  checkpoint and run record writes
+
+the CPU time of the NuSMV processes, and the peak traced memory of an extra run
+under tracemalloc. Timings are the median of REPEATS runs. Results are compared
+with a stored baseline: a case metric (or the total) more than TOLERANCE slower
+is reported as a regression and the benchmark exits with status 1. Baselines are
+machine specific; record one on the machine that runs the comparison.
+
+Runs started from an existing model (no Process 1 in the transcript) start from
+the model verified in their first iteration, or from INPUT_MODEL for imported
+logs, which do not contain it.
+
+Usage: python benchmark.py runs.sqlite [save] [baseline.json]
+       ("save" records the results as the new baseline)
+"""
+
+import functools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+import checkpoint
+import main
+import verifier
+from llm_backends import BackendRouter, ReplayBackend
+from run_store import connect
+from token_budget import TokenLedger
+from workspace import Workspace
+
+BASELINE_FILE = "benchmark_baseline.json"
+RESULTS_FILE = "benchmark_results.json"
+INPUT_MODEL = "Ground-Truth-NuSMV/{case}.smv"
+REPEATS = 3
+TRACE_ALLOCATIONS = True
+# A metric regresses when it is more than TOLERANCE slower than the baseline;
+# metrics below MIN_SECONDS in the baseline are too noisy to compare
+TOLERANCE = 0.20
+MIN_SECONDS = 0.05
+
+# Stage -> (owner, attribute) of the functions timed as that stage
+STAGES = {
+    "llm": [(main, "invoke_vllm_chat")],
+    "nusmv": [(main, "validate_nusmv_syntax"), (main, "validate_nusmv_model"), (verifier, "run_nusmv")],
+    "parse": [(main, "extract_nusmv_errors"), (main, "extract_nusmv_violations"), (main, "verdict_from_output"),
+              (verifier, "verdict_from_output"), (main, "parse_nusmv_model")],
+    "autofix": [(main, "autofix_model")],
+    "prompt": [(main, "build_regeneration_prompt"), (main, "build_cone_prompt"),
+               (main.RefinementSession, "build_messages")],
+    "checkpoint": [(main, "write_checkpoint"), (main, "save_run_record")],
+}
+COMPARED = ["wall", "verification", "nusmv_cpu"] + [f"stage_{stage}" for stage in STAGES]
+
+_TRANSCRIPT_RUNS_QUERY = """
+SELECT r.run_id, r.case_name, r.settings,
+       SUM(e.kind = 'iteration_start' AND e.phase = 'phase1') AS phase1_iterations,
+       SUM(e.kind = 'llm_call' AND json_extract(e.data, '$.response_hash') IS NOT NULL) AS responses
+FROM runs r JOIN events e ON e.run_id = r.run_id
+GROUP BY r.run_id
+HAVING responses > 0
+ORDER BY r.status = 'finished' DESC, r.started DESC
+"""
+
+_CALLS_QUERY = """
+SELECT json_extract(e.data, '$.prompt_hash'), b.text,
+       json_extract(e.data, '$.prompt_tokens'), json_extract(e.data, '$.completion_tokens')
+FROM events e JOIN blobs b ON b.hash = json_extract(e.data, '$.response_hash')
+WHERE e.run_id = ? AND e.kind = 'llm_call'
+ORDER BY e.seq
+"""
+
+_FIRST_MODEL_QUERY = """
+SELECT b.text FROM events e LEFT JOIN blobs b ON b.hash = e.model_hash
+WHERE e.run_id = ? AND e.kind = 'verifier_call'
+ORDER BY e.seq LIMIT 1
+"""
+
+
+def load_transcripts(store_file, cases=None):
+    """
+    The replay transcript of each case: its most recent finished run with recorded responses.
+    Returns {case: {"run_id", "settings", "calls", "input_model"}}; input_model is None
+    when the run started with Process 1.
+    """
+    connection = connect(store_file)
+    try:
+        transcripts = {}
+        for run_id, case, settings, phase1_iterations, _ in connection.execute(_TRANSCRIPT_RUNS_QUERY).fetchall():
+            if case in transcripts or case not in main.PREDEFINED_CASES or (cases and case not in cases):
+                continue
+            calls = [{"prompt_hash": prompt_hash, "response": response, "prompt_tokens": prompt_tokens,
+                      "completion_tokens": completion_tokens}
+                     for prompt_hash, response, prompt_tokens, completion_tokens
+                     in connection.execute(_CALLS_QUERY, (run_id,))]
+            input_model = None
+            if not phase1_iterations:
+                row = connection.execute(_FIRST_MODEL_QUERY, (run_id,)).fetchone()
+                input_model = row[0] if row and row[0] else None
+                if input_model is None and os.path.exists(INPUT_MODEL.format(case=case)):
+                    with open(INPUT_MODEL.format(case=case), 'r') as f:
+                        input_model = f.read()
+                if input_model is None:
+                    print(f"⚠ Case {case}: run {run_id} has no Process 1 and no input model; skipped")
+                    continue
+            transcripts[case] = {"run_id": run_id, "settings": json.loads(settings or "{}"), "calls": calls,
+                                 "input_model": input_model}
+        return transcripts
+    finally:
+        connection.close()
+
+
+class StageTimer:
+    """
+    While active, time every call of the STAGES functions. Times are exclusive: a stage
+    called inside another (e.g. parsing inside verification) is only counted once.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.stages = stages
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.originals = []
+
+    def _timed(self, stage, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            stack = self.local.__dict__.setdefault("stack", [])
+            stack.append(0.0)  # time spent in nested stages
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                with self.lock:
+                    self.times[stage] += elapsed - nested
+                    self.calls[stage] += 1
+        return timed
+
+    def __enter__(self):
+        for stage, functions in self.stages.items():
+            for owner, name in functions:
+                function = owner.__dict__[name]
+                self.originals.append((owner, name, function))
+                setattr(owner, name, self._timed(stage, function))
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, function in reversed(self.originals):
+            setattr(owner, name, function)
+        self.originals = []
+
+
+def replay_case(case, transcript, trace_allocations=False):
+    """
+    Run one case against its transcript in a fresh workspace; returns its measurements.
+    """
+    scenarios, safety_properties = main.PREDEFINED_CASES[case]
+    settings = transcript["settings"]
+    backend = ReplayBackend(transcript["calls"])
+    main.llm_router = BackendRouter([backend], limiter_options={"max_retries": 0})
+    main.token_ledger = TokenLedger(run_budget=main.RUN_TOKEN_BUDGET, case_budget=main.CASE_TOKEN_BUDGET)
+    main.token_ledger.begin_case(case)
+    run_record = {"case": case, "backend": "replay", "repeat": 1,
+                  "edit_mode": settings.get("edit_mode", "full"), "session_mode": settings.get("session_mode", False),
+                  "samples": settings.get("samples", 1), "pipelined": settings.get("pipelined", False)}
+
+    cwd, checkpoint_dir = os.getcwd(), checkpoint.CHECKPOINT_DIR
+    timer = StageTimer()
+    final_model, error = None, None
+    with Workspace(prefix=f"bench-{case}-") as workspace:
+        os.chdir(workspace.path)
+        checkpoint.CHECKPOINT_DIR = "checkpoints"
+        input_model = workspace.model_file(transcript["input_model"], "input") if transcript["input_model"] else None
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if trace_allocations:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with open(workspace.file("log.txt"), 'w', encoding="utf-8") as log, redirect_stdout(log), timer:
+                main.run_clock.update(start=time.perf_counter(), offset=0.0)
+                _, final_model, _ = main.run_refinement(run_record, scenarios, safety_properties,
+                                                        input_model=input_model)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if trace_allocations else None
+            tracemalloc.stop()
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            os.chdir(cwd)
+            checkpoint.CHECKPOINT_DIR = checkpoint_dir
+
+    phase2 = run_record.get("phase2", [])
+    result = {
+        "wall": wall,
+        "nusmv_cpu": (after.ru_utime + after.ru_stime) - (children.ru_utime + children.ru_stime),
+        "nusmv_runs": timer.calls["nusmv"],
+        "llm_calls": timer.calls["llm"],
+        "replay_matched": backend.matched,
+        "replay_unmatched": backend.unmatched,
+        "iterations": len(run_record.get("phase1", [])) + len(phase2),
+        "violations": phase2[-1].get("violations") if phase2 else None,
+        "solved": final_model is not None and bool(phase2) and phase2[-1].get("violations") == 0,
+        "error": error
+    }
+    for stage in STAGES:
+        result[f"stage_{stage}"] = timer.times[stage]
+    result["verification"] = result["stage_nusmv"] + result["stage_parse"]
+    if trace_allocations:
+        result["peak_memory_kb"] = peak / 1024
+    return result
+
+
+def benchmark_case(case, transcript, repeats=REPEATS, trace_allocations=TRACE_ALLOCATIONS):
+    """
+    Median timings of `repeats` replays of a case, plus the peak memory of a traced replay.
+    """
+    runs = [replay_case(case, transcript) for _ in range(repeats)]
+    result = dict(runs[-1])
+    for metric in COMPARED:
+        result[metric] = statistics.median(run[metric] for run in runs)
+    if trace_allocations:
+        result["peak_memory_kb"] = replay_case(case, transcript, trace_allocations=True)["peak_memory_kb"]
+    result["run_id"] = transcript["run_id"]
+    return result
+
+
+def run_benchmark(store_file, cases=None, repeats=REPEATS):
+    """
+    Benchmark every predefined case with a transcript in the store. Returns the results
+    document ({"machine", "created", "cases": {case: result}, "total": {...}}).
+    """
+    transcripts = load_transcripts(store_file, cases)
+    missing = [case for case in (cases or main.PREDEFINED_CASES) if case not in transcripts]
+    if missing:
+        print(f"⚠ No recorded run with LLM responses for case(s) {', '.join(missing)}")
+    # Replays must not write into the real run store or stop at the live deadline
+    main.run_store = None
+    main.CASE_DEADLINE = None
+
+    results = {}
+    for case in sorted(transcripts):
+        start = time.perf_counter()
+        results[case] = benchmark_case(case, transcripts[case], repeats)
+        result = results[case]
+        mark = "❌" if result["error"] else "✓"
+        print(f"{mark} {case}: {result['wall']:.2f}s, {result['nusmv_runs']} NuSMV run(s), "
+              f"{result['llm_calls']} LLM call(s) ({result['replay_unmatched']} unmatched), "
+              f"{time.perf_counter() - start:.0f}s for {repeats} replay(s)"
+              + (f" ({result['error']})" if result["error"] else ""))
+    total = {metric: sum(result[metric] for result in results.values()) for metric in COMPARED}
+    return {
+        "machine": {"host": platform.node(), "python": platform.python_version(), "nusmv": verifier.NUSMV_BINARY},
+        "created": time.time(),
+        "cases": results,
+        "total": total
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Regressions of results against a baseline document: a list of
+    (case or "total", metric, baseline value, current value).
+    """
+    regressions = []
+    rows = [(case, result, baseline["cases"].get(case)) for case, result in results["cases"].items()]
+    rows.append(("total", results["total"], baseline.get("total")))
+    for case, result, before in rows:
+        if not before:
+            continue
+        if case != "total" and result["nusmv_runs"] != before["nusmv_runs"]:
+            print(f"⚠ {case}: {result['nusmv_runs']} NuSMV run(s), baseline had {before['nusmv_runs']} "
+                  f"(the replayed workload changed)")
+        for metric in COMPARED:
+            if before.get(metric, 0) >= MIN_SECONDS and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append((case, metric, before[metric], result[metric]))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    stages = [f"stage_{stage}" for stage in STAGES]
+    print(f"\n{'Case':<7}{'Wall':>8}{'NuSMV CPU':>11}" + "".join(f"{stage[6:]:>11}" for stage in stages)
+          + f"{'Peak KB':>10}{'Runs':>6}  Change")
+    for case, result in list(results["cases"].items()) + [("total", results["total"])]:
+        before = (baseline or {}).get("total" if case == "total" else "cases", {})
+        before = before if case == "total" else before.get(case)
+        change = f"{(result['wall'] / before['wall'] - 1) * 100:+.0f}%" if before and before.get("wall") else "-"
+        peak = f"{result['peak_memory_kb']:.0f}" if result.get("peak_memory_kb") is not None else "-"
+        print(f"{case:<7}{result['wall']:>8.2f}{result['nusmv_cpu']:>11.2f}"
+              + "".join(f"{result[stage]:>11.3f}" for stage in stages)
+              + f"{peak:>10}{result.get('nusmv_runs', '-'):>6}  {change}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark.py <runs.sqlite> [save] [baseline.json]")
+        sys.exit(1)
+    store_file = os.path.abspath(sys.argv[1])
+    save = len(sys.argv) > 2 and sys.argv[2] == "save"
+    arguments = sys.argv[3:] if save else sys.argv[2:]
+    baseline_file = os.path.abspath(arguments[0] if arguments else BASELINE_FILE)
+
+    results = run_benchmark(store_file)
+    with open(RESULTS_FILE, 'w') as f:
+        json.dump(results, f, indent=2)
+    baseline = None
+    if not save and os.path.exists(baseline_file):
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\n✓ Results saved to {RESULTS_FILE}")
+
+    if save:
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Baseline saved to {baseline_file}")
+    elif baseline is None:
+        print(f"⚠ No baseline at {baseline_file}; run with 'save' to record one")
+    else:
+        regressions = compare_to_baseline(results, baseline)
+        for case, metric, before, after in regressions:
+            print(f"❌ {case} {metric}: {before:.3f}s -> {after:.3f}s ({(after / before - 1) * 100:+.0f}%)")
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) more than {TOLERANCE:.0%} slower than {baseline_file}")
+            sys.exit(1)
+        print(f"✓ No metric more than {TOLERANCE:.0%} slower than {baseline_file}")
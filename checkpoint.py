@@ -0,0 +1,78 @@
+"""
+Per-iteration checkpoints for long refinement runs.
+
+A 50-iteration Phase 2 run can take an hour. After every iteration the loop in
+main.py writes a compact JSON checkpoint per case: the model to verify next (text
+and fingerprint), the violation and fingerprint history, the cycle strategy, the
+tokens and wall time spent, and the RNG and LLM routing state. `python main.py
+resume <case>` continues an interrupted case from its checkpoint, and batch
+runners use is_case_finished() to skip cases that already completed.
+"""
+
+import json
+import os
+import random
+import re
+
+# Relative to the working directory unless set to an absolute path (the batch runner keeps
+# checkpoints in the job's results directory while models live in a tmpfs workspace)
+CHECKPOINT_DIR = "checkpoints"
+
+# Checkpoint status values
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+def checkpoint_path(case, directory=None):
+    """
+    Checkpoint file of a case, e.g. checkpoints/3-4.json.
+    """
+    return os.path.join(directory or CHECKPOINT_DIR, re.sub(r"[^\w.-]", "_", case) + ".json")
+
+
+def save_checkpoint(checkpoint, path):
+    """
+    Write a checkpoint atomically (temporary file + rename), so a crash while
+    writing never leaves a truncated checkpoint behind.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint; returns None if it does not exist or cannot be parsed.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read checkpoint {path}: {e}")
+        return None
+
+
+def is_case_finished(case, directory=None):
+    """
+    True if the case's checkpoint says it ran to completion (safe model or iteration limit).
+    """
+    checkpoint = load_checkpoint(checkpoint_path(case, directory))
+    return bool(checkpoint) and checkpoint.get("status") == FINISHED
+
+
+def rng_state():
+    """
+    The `random` module state as JSON-serializable lists (sampling and backoff jitter use it).
+    """
+    version, internal, gauss = random.getstate()
+    return [version, list(internal), gauss]
+
+
+def restore_rng_state(state):
+    version, internal, gauss = state
+    random.setstate((version, tuple(internal), gauss))
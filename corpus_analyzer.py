@@ -0,0 +1,151 @@
+"""
+Batch verification of NuSMV model corpora.
+
+run_nusmv_and_analyze() is copied into Ground-Truth/, Ground-Truth-gwen/,
+Ground-Truth -gwen/ and NuSMV/analyze.py, each checking one hard-coded file
+with a Windows NuSMV path. This analyzer walks whole corpus directories
+(Ground-Truth-NuSMV-llama, -llama-2, -gwen, -qwq, ...), verifies every .smv
+file in parallel through verifier.VerifierPool with a persistent VerdictCache,
+and writes one row per file and specification:
+
+    corpus, file, case, repeat, syntax_ok, timed_out, elapsed, cached,
+    spec_index, specification, status (true / false / error)
+
+Files without specification results (syntax errors, timeouts) get a single row
+with status "error". The table is written as CSV, and as Parquet next to it
+when pyarrow is installed. Copies of the same model (identical up to comments
+and whitespace, see nusmv_model.canonical_model) are verified once, and after a
+specification change only the edited models are re-verified; the rest come
+from the cache.
+
+Usage: python corpus_analyzer.py <output.csv> [corpus directory ...]
+       (default: every Ground-Truth-NuSMV* directory)
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+from nusmv_model import model_fingerprint
+from verifier import NUSMV_BINARY, VerdictCache, VerifierPool
+
+DEFAULT_CORPORA = "Ground-Truth-NuSMV*"
+CACHE_FILE = "verdict_cache.sqlite"
+NUSMV_TIMEOUT = 120
+
+# 1-1-10-regen.smv, 3-4.smv, ...: scenario set - property set [- repeat]
+_CASE_NAME = re.compile(r"^(\d+-\d+)(?:-(\d+))?")
+
+COLUMNS = ["corpus", "file", "case", "repeat", "syntax_ok", "timed_out", "elapsed", "cached", "spec_index",
+           "specification", "status"]
+
+
+def find_models(corpora):
+    """
+    (corpus, path) for every .smv file below the given directories, in a stable order.
+    """
+    models = []
+    for corpus in corpora:
+        for path in sorted(glob.glob(os.path.join(corpus, "**", "*.smv"), recursive=True)):
+            models.append((os.path.basename(os.path.normpath(corpus)), path))
+    return models
+
+
+def spec_rows(corpus, path, verdict):
+    """
+    Table rows of one verified file (see the module docstring).
+    """
+    name = _CASE_NAME.match(os.path.basename(path))
+    base = {
+        "corpus": corpus,
+        "file": path,
+        "case": name.group(1) if name else None,
+        "repeat": int(name.group(2)) if name and name.group(2) else None,
+        "syntax_ok": verdict["syntax_ok"],
+        "timed_out": verdict["timed_out"],
+        "elapsed": round(verdict["elapsed"], 3),
+        "cached": verdict.get("cached", False)
+    }
+    specs = verdict["specs"]
+    if not specs or not verdict["syntax_ok"]:
+        return [{**base, "spec_index": None, "specification": None, "status": "error"}]
+    return [{**base, "spec_index": i, "specification": spec["specification"], "status": spec["status"]}
+            for i, spec in enumerate(specs, 1)]
+
+
+def analyze_corpora(corpora, workers=None, cache_file=CACHE_FILE, timeout=NUSMV_TIMEOUT):
+    """
+    Verify every model of the corpora and return the per-file, per-spec table as a DataFrame.
+    """
+    models = find_models(corpora)
+    print(f"Verifying {len(models)} model(s) from {len(corpora)} corpus director(ies) with {NUSMV_BINARY}...")
+    texts = []
+    for _, path in models:
+        with open(path, 'r', encoding="utf-8", errors="replace") as f:
+            texts.append(f.read())
+
+    # One verification per canonical model; the verdict is shared by all copies
+    unique = {}
+    for text in texts:
+        unique.setdefault(model_fingerprint(text), text)
+
+    start = time.perf_counter()
+    cache = VerdictCache(cache_file) if cache_file else None
+    try:
+        with VerifierPool(workers=workers, timeout=timeout, cache=cache) as pool:
+            verdicts = dict(zip(unique, pool.verify_many(list(unique.values()))))
+    finally:
+        if cache:
+            cache.close()
+
+    rows = []
+    for (corpus, path), text in zip(models, texts):
+        rows.extend(spec_rows(corpus, path, verdicts[model_fingerprint(text)]))
+    table = pd.DataFrame(rows, columns=COLUMNS).astype({"repeat": "Int64", "spec_index": "Int64"})
+    cached = f", {cache.hits} from cache" if cache else ""
+    print(f"✓ {len(models)} model(s) ({len(unique)} unique), {len(table)} row(s) in "
+          f"{time.perf_counter() - start:.1f}s{cached}")
+    return table
+
+
+def corpus_summary(table):
+    """
+    Per-corpus counts: files, files with errors, true and false specifications, safe files.
+    """
+    files = table.groupby(["corpus", "file"]).agg(
+        error=("status", lambda s: (s == "error").any()),
+        true=("status", lambda s: (s == "true").sum()),
+        false=("status", lambda s: (s == "false").sum())
+    )
+    files["safe"] = ~files["error"] & (files["false"] == 0) & (files["true"] > 0)
+    return files.groupby("corpus").agg(files=("safe", "size"), errors=("error", "sum"), true_specs=("true", "sum"),
+                                       false_specs=("false", "sum"), safe_files=("safe", "sum"))
+
+
+def write_table(table, output_file):
+    """
+    Write the table as CSV and, if pyarrow is available, as Parquet with the same stem.
+    """
+    table.to_csv(output_file, index=False)
+    print(f"✓ Table saved to {output_file}")
+    parquet_file = os.path.splitext(output_file)[0] + ".parquet"
+    try:
+        table.to_parquet(parquet_file, index=False)
+        print(f"✓ Table saved to {parquet_file}")
+    except ImportError:
+        print("Warning: pyarrow not installed. Parquet output skipped.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python corpus_analyzer.py <output.csv> [corpus directory ...]")
+        sys.exit(1)
+    corpora = sys.argv[2:] or sorted(path for path in glob.glob(DEFAULT_CORPORA) if os.path.isdir(path))
+    table = analyze_corpora(corpora)
+    write_table(table, sys.argv[1])
+    print()
+    print(corpus_summary(table).to_string())
@@ -0,0 +1,334 @@
+"""
+Content-addressed store for NuSMV models.
+
+Many -N-regen.smv outputs in the Ground-Truth-NuSMV-* directories are identical
+or nearly identical across repeats and across Llama/Qwen/QwQ. The corpus store
+keeps every model once under the SHA-256 of its canonical text
+(nusmv_model.canonical_model: comments and whitespace ignored), compressed with
+zstd (zlib if the zstandard package is not installed), and records where each
+copy came from (source, case, backend, repeat, iteration) as provenance rows.
+
+Near-duplicates are found with MinHash signatures over token shingles, indexed
+with LSH bands: similar(text) returns stored models whose estimated Jaccard
+similarity is above a threshold, without comparing against every model.
+
+Usage: python corpus_store.py corpus.sqlite add <directory or .smv file ...>
+       python corpus_store.py corpus.sqlite import-runs runs.sqlite
+       python corpus_store.py corpus.sqlite similar <model.smv> [threshold]
+       python corpus_store.py corpus.sqlite stats
+"""
+
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from nusmv_model import canonical_model
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    hash TEXT PRIMARY KEY,
+    codec TEXT,
+    size INTEGER,
+    stored_size INTEGER,
+    data BLOB,
+    signature BLOB
+);
+CREATE TABLE IF NOT EXISTS provenance (
+    hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    case_name TEXT,
+    backend TEXT,
+    repeat INTEGER,
+    iteration INTEGER,
+    added REAL,
+    PRIMARY KEY (hash, source)
+);
+CREATE INDEX IF NOT EXISTS provenance_case ON provenance (case_name, backend);
+CREATE TABLE IF NOT EXISTS lsh (
+    band INTEGER,
+    bucket TEXT,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS lsh_bucket ON lsh (band, bucket);
+"""
+
+# MinHash: NUM_PERMUTATIONS hash functions, split into LSH_BANDS bands for the index.
+# With 16 bands of 4 rows, pairs with Jaccard similarity 0.5 become candidates ~64% of the time,
+# pairs at 0.8 ~99.9% of the time.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(20240601)  # fixed, so signatures are comparable across runs
+_PERM_A = _rng.randint(1, 2**31, NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2**31, NUM_PERMUTATIONS).astype(np.uint64)
+
+_TOKEN = re.compile(r"\w+|[^\s\w]")
+# 1-1-10-regen.smv, 3-4.smv, ...: scenario set - property set [- repeat]
+_CASE_NAME = re.compile(r"^(\d+-\d+)(?:-(\d+))?")
+ZSTD_LEVEL = 19
+
+
+def canonical_hash(model_text):
+    """
+    Full SHA-256 of the canonical model text (model_fingerprint is its 16-character prefix).
+    """
+    return hashlib.sha256(canonical_model(model_text).encode("utf-8")).hexdigest()
+
+
+def compress(text):
+    """
+    (codec, bytes): zstd if available, else zlib.
+    """
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("model was stored with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def shingles(model_text, size=SHINGLE_SIZE):
+    """
+    Set of 32-bit hashes of the token shingles (runs of `size` tokens) of the canonical text.
+    """
+    tokens = _TOKEN.findall(canonical_model(model_text))
+    if len(tokens) < size:
+        tokens = tokens + [""] * (size - len(tokens))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(tokens[i:i + size]).encode("utf-8"), digest_size=4).digest(), "big")
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+def minhash(model_text):
+    """
+    MinHash signature (NUM_PERMUTATIONS uint64 values) of the model's shingles.
+    """
+    values = np.fromiter(shingles(model_text), dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle; a, b < 2**31 and x < 2**32 cannot overflow
+    hashed = (np.outer(_PERM_A, values) + _PERM_B[:, None]) % _PRIME
+    return hashed.min(axis=1)
+
+
+def similarity(signature, other):
+    """
+    Estimated Jaccard similarity of two MinHash signatures.
+    """
+    return float(np.mean(signature == other))
+
+
+def band_buckets(signature):
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [(band, hashlib.sha1(signature[band * rows:(band + 1) * rows].tobytes()).hexdigest()[:16])
+            for band in range(LSH_BANDS)]
+
+
+def corpus_provenance(path):
+    """
+    Provenance of a corpus file: case and repeat from the file name, backend from the
+    directory suffix (Ground-Truth-NuSMV-llama-2/1-1-3-regen.smv -> 1-1, llama-2, 3).
+    """
+    name = _CASE_NAME.match(os.path.basename(path))
+    directory = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    backend = directory.split("Ground-Truth-NuSMV-", 1)[1] if "Ground-Truth-NuSMV-" in directory else None
+    return {
+        "case": name.group(1) if name else None,
+        "backend": backend,
+        "repeat": int(name.group(2)) if name and name.group(2) else None
+    }
+
+
+class CorpusStore:
+    """
+    SQLite-backed content-addressed model store (see module docstring). Thread-safe.
+    """
+
+    def __init__(self, path="corpus.sqlite"):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        if zstandard is None:
+            print("Warning: zstandard not installed. New models are compressed with zlib.")
+
+    def add(self, model_text, source, case=None, backend=None, repeat=None, iteration=None):
+        """
+        Store a model (once per canonical hash) and record where this copy came from.
+        Returns (hash, is_new_model).
+        """
+        digest = canonical_hash(model_text)
+        with self.lock:
+            known = self.connection.execute("SELECT 1 FROM models WHERE hash = ?", (digest,)).fetchone()
+            if not known:
+                codec, data = compress(model_text)
+                signature = minhash(model_text)
+                self.connection.execute(
+                    "INSERT INTO models (hash, codec, size, stored_size, data, signature) VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, codec, len(model_text.encode("utf-8")), len(data), data, signature.tobytes())
+                )
+                self.connection.executemany("INSERT INTO lsh (band, bucket, hash) VALUES (?, ?, ?)",
+                                            [(band, bucket, digest) for band, bucket in band_buckets(signature)])
+            self.connection.execute(
+                "INSERT OR REPLACE INTO provenance (hash, source, case_name, backend, repeat, iteration, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, source, case, backend, repeat, iteration, time.time())
+            )
+            self.connection.commit()
+        return digest, not known
+
+    def get(self, digest):
+        """
+        The stored model text for a hash (or unique hash prefix), or None.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT codec, data FROM models WHERE hash LIKE ? LIMIT 2",
+                                          (digest + "%",)).fetchall()
+        return decompress(*row[0]) if len(row) == 1 else None
+
+    def provenance(self, digest):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT source, case_name, backend, repeat, iteration FROM provenance WHERE hash = ? ORDER BY source",
+                (digest,)
+            ).fetchall()
+        return [dict(zip(("source", "case", "backend", "repeat", "iteration"), row)) for row in rows]
+
+    def similar(self, model_text, threshold=0.8, limit=10):
+        """
+        Stored models similar to model_text: [(hash, estimated Jaccard similarity)], best first.
+        Only models sharing an LSH bucket with it are compared.
+        """
+        signature = minhash(model_text)
+        buckets = band_buckets(signature)
+        with self.lock:
+            candidates = set()
+            for band, bucket in buckets:
+                candidates.update(row[0] for row in self.connection.execute(
+                    "SELECT hash FROM lsh WHERE band = ? AND bucket = ?", (band, bucket)))
+            scored = []
+            for digest in candidates:
+                stored = self.connection.execute("SELECT signature FROM models WHERE hash = ?", (digest,)).fetchone()
+                score = similarity(signature, np.frombuffer(stored[0], dtype=np.uint64))
+                if score >= threshold:
+                    scored.append((digest, score))
+        return sorted(scored, key=lambda item: -item[1])[:limit]
+
+    def unique_models(self):
+        """
+        (hash, text) of every stored model, e.g. to verify or analyze each unique model once.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT hash, codec, data FROM models ORDER BY hash").fetchall()
+        return [(digest, decompress(codec, data)) for digest, codec, data in rows]
+
+    def stats(self):
+        with self.lock:
+            models, size, stored = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM models").fetchone()
+            copies, copy_size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(m.size), 0) FROM provenance p JOIN models m ON m.hash = p.hash"
+            ).fetchone()
+        return {"copies": copies, "unique_models": models, "copy_bytes": copy_size, "unique_bytes": size,
+                "stored_bytes": stored}
+
+    def close(self):
+        self.connection.close()
+
+
+def add_corpora(store, paths):
+    """
+    Add every .smv file of the given directories (or the files themselves) with corpus provenance.
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "**", "*.smv"), recursive=True))
+                     if os.path.isdir(path) else [path])
+    new = 0
+    for path in files:
+        with open(path, 'r', encoding="utf-8", errors="replace") as f:
+            _, is_new = store.add(f.read(), os.path.relpath(path), **corpus_provenance(path))
+        new += is_new
+    print(f"✓ Added {len(files)} file(s): {new} new model(s), {len(files) - new} duplicate(s)")
+
+
+def import_run_store(store, run_store_file):
+    """
+    Add every model verified in a run store (run_store.py) with its case, backend, repeat
+    and iteration; the source is "<run_id>#<iteration>".
+    """
+    from run_store import connect
+    connection = connect(run_store_file)
+    try:
+        rows = connection.execute("""
+            SELECT DISTINCT r.run_id, r.case_name, r.backend, r.repeat, e.iteration, b.text
+            FROM events e JOIN runs r ON r.run_id = e.run_id JOIN blobs b ON b.hash = e.model_hash
+            WHERE e.kind = 'verifier_call'
+        """).fetchall()
+    finally:
+        connection.close()
+    new = 0
+    for run_id, case, backend, repeat, iteration, text in rows:
+        _, is_new = store.add(text, f"{run_id}#{iteration}", case=case, backend=backend, repeat=repeat,
+                              iteration=iteration)
+        new += is_new
+    print(f"✓ Imported {len(rows)} verified model(s) from {run_store_file}: {new} new")
+
+
+def print_stats(store):
+    stats = store.stats()
+    ratio = stats["copy_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0.0
+    print(f"{stats['copies']} cop(ies) of {stats['unique_models']} unique model(s): "
+          f"{stats['copy_bytes'] / 1024:.0f} KB as files, {stats['unique_bytes'] / 1024:.0f} KB unique, "
+          f"{stats['stored_bytes'] / 1024:.0f} KB stored ({ratio:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    commands = ("add", "import-runs", "similar", "stats")
+    if len(sys.argv) < 3 or sys.argv[2] not in commands:
+        print("Usage: python corpus_store.py <corpus.sqlite> add <directory or .smv file ...>\n"
+              "       python corpus_store.py <corpus.sqlite> import-runs <runs.sqlite>\n"
+              "       python corpus_store.py <corpus.sqlite> similar <model.smv> [threshold]\n"
+              "       python corpus_store.py <corpus.sqlite> stats")
+        sys.exit(1)
+    corpus = CorpusStore(sys.argv[1])
+    command, arguments = sys.argv[2], sys.argv[3:]
+    if command == "add":
+        add_corpora(corpus, arguments)
+        print_stats(corpus)
+    elif command == "import-runs":
+        import_run_store(corpus, arguments[0])
+        print_stats(corpus)
+    elif command == "similar":
+        with open(arguments[0], 'r') as f:
+            query = f.read()
+        threshold = float(arguments[1]) if len(arguments) > 1 else 0.8
+        matches = corpus.similar(query, threshold)
+        if not matches:
+            print(f"No stored model with similarity >= {threshold}")
+        for digest, score in matches:
+            sources = corpus.provenance(digest)
+            print(f"{digest[:16]}  {score:.2f}  {len(sources)} cop(ies): "
+                  + ", ".join(source["source"] for source in sources[:5]) + (" ..." if len(sources) > 5 else ""))
+    else:
+        print_stats(corpus)
+    corpus.close()
@@ -0,0 +1,73 @@
+"""
+Wall-clock deadlines for a whole case or batch.
+
+`with deadline(seconds):` sets a deadline that every LLM call and NuSMV run
+inside it honors: each call gets at most the remaining time as its timeout
+(NuSMV is killed when it expires), and DeadlineExceeded is raised once no time
+is left. Refinement loops save the current model every iteration, so the caller
+catches DeadlineExceeded and returns the last model as a partial result.
+
+The deadline is process-wide (not per thread), so worker threads of beam mode,
+hedged requests and the verifier pool see it as well. Nested deadlines only
+shorten the remaining time.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_deadlines = []  # absolute time.monotonic() deadlines, innermost last
+_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the wall-clock deadline of the current case or batch has passed."""
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Run the body under a deadline `seconds` from now (None = no deadline).
+    """
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    with _lock:
+        _deadlines.append(at)
+    try:
+        yield
+    finally:
+        with _lock:
+            _deadlines.remove(at)
+
+
+def remaining():
+    """
+    Seconds left before the nearest deadline, or None if there is none.
+    """
+    with _lock:
+        if not _deadlines:
+            return None
+        return min(_deadlines) - time.monotonic()
+
+
+def check(what="operation"):
+    """
+    Raise DeadlineExceeded if the deadline has passed.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline reached before {what}")
+
+
+def time_limit(timeout=None, what="operation"):
+    """
+    Timeout for a call: `timeout` capped by the remaining time (None if neither is set).
+    Raises DeadlineExceeded if no time is left.
+    """
+    check(what)
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
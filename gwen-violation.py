@@ -756,7 +756,7 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
 
 
 def extract_nusmv_errors(nusmv_output, model_content):
-    errors = re.findall(r"file generated_model.smv: line (\d+): (.+)", nusmv_output)
+    errors = re.findall(r"file .*?: line (\d+): (.+)", nusmv_output)
     if not errors:
         return None  # No errors found
 
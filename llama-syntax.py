@@ -393,7 +393,7 @@ def parse_safety_property_to_ltl(safety_property):
 # Function to extract specific syntax errors from NuSMV logs
 def extract_nusmv_errors(nusmv_output, model_content):
     """Extracts the exact failed line from NuSMV error logs."""
-    errors = re.findall(r"file generated_model.smv: line (\d+): (.+)", nusmv_output)
+    errors = re.findall(r"file .*?: line (\d+): (.+)", nusmv_output)
     if not errors:
         return None  # No errors found
 
@@ -718,7 +718,7 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
 
 
 def extract_nusmv_errors(nusmv_output, model_content):
-    errors = re.findall(r"file generated_model.smv: line (\d+): (.+)", nusmv_output)
+    errors = re.findall(r"file .*?: line (\d+): (.+)", nusmv_output)
     if not errors:
         return None  # No errors found
 
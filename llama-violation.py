@@ -8,6 +8,12 @@ import os
 import subprocess
 import yaml
 import re
+from deadline import DeadlineExceeded, check, deadline, time_limit
+from llm_backends import LambdaBackend
+from rate_limit import AIMDLimiter
+from token_budget import TokenBudgetExceeded, TokenLedger, count_message_tokens, count_tokens
+from nusmv_model import EDIT_PROTOCOL_INSTRUCTIONS, ModelEditError, apply_llm_edits, numbered_specs
+from verifier import parse_error_lines
 
 # Load environment variables from .env
 load_dotenv()
@@ -104,37 +110,73 @@ client = OpenAI(
     base_url=openai_api_base,
 )
 
-def invoke_vllm(prompt):
+# Throttled/transient API failures are retried here instead of costing a refinement iteration
+llm_backend = LambdaBackend(client)
+llm_limiter = AIMDLimiter(name="lambda", max_retries=5)
+
+# Timeouts in seconds; CASE_DEADLINE (None = none) bounds a whole run, and every call gets at most the time left
+LLM_TIMEOUT = 600
+NUSMV_TIMEOUT = 60
+CASE_DEADLINE = float(os.getenv("TAPASSURE_DEADLINE")) if os.getenv("TAPASSURE_DEADLINE") else None
+
+# Completion limit per LLM call, capped by the token budget left (RUN_TOKEN_BUDGET, None = unlimited)
+MAX_COMPLETION_TOKENS = 8000
+RUN_TOKEN_BUDGET = None
+token_ledger = TokenLedger(run_budget=RUN_TOKEN_BUDGET)
+
+# Repair replies: "full" regenerates the whole model, "patch" asks only for the changed blocks
+# (falling back to a whole model when they cannot be applied), e.g. TAPASSURE_EDIT_MODE=patch
+EDIT_MODE = "patch" if os.getenv("TAPASSURE_EDIT_MODE", "full").lower() == "patch" else "full"
+
+def invoke_vllm(prompt, require_model=True):
     """
     Sends a prompt to the LLM and returns the generated response.
     Cleans the response to remove markdown formatting and ensure it's a valid NuSMV model.
+    Pass require_model=False for replies that are block edits rather than a whole model.
     """
     try:
         # Send the prompt to the LLM
-        response = client.chat.completions.create(
-            model="llama3.3-70b-instruct-fp8",  # Adjust the model as needed
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that strictly follows the user's instructions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0  # Minimal randomness
-        )
-        
-        # Extract the generated content
-        generated_content = response.choices[0].message.content
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant that strictly follows the user's instructions."},
+            {"role": "user", "content": prompt}
+        ]
+        timeout = time_limit(LLM_TIMEOUT, "LLM call")
+        prompt_tokens = count_message_tokens(messages)
+        max_tokens = token_ledger.reserve(prompt_tokens, MAX_COMPLETION_TOKENS)
+        try:
+            response = llm_limiter.call(
+                lambda: llm_backend.complete(messages, max_tokens=max_tokens, temperature=0.0,  # Minimal randomness
+                                             timeout=timeout)
+            )
+            
+            # Extract the generated content
+            generated_content = response["text"]
+            # Prefer the server's token counts when it reports them
+            if response["prompt_tokens"] is not None:
+                token_ledger.record(response["prompt_tokens"], response["completion_tokens"])
+            else:
+                token_ledger.record(prompt_tokens, count_tokens(generated_content))
+        finally:
+            token_ledger.release(prompt_tokens, max_tokens)
         
         # Clean the response to remove markdown formatting
         cleaned_content = re.sub(r"```(?:nusmv|plaintext)?\n", "", generated_content)
         cleaned_content = re.sub(r"\n```", "", cleaned_content)
         
         # Ensure the cleaned content is a valid NuSMV model
-        if not is_valid_nusmv_code(cleaned_content):
+        if require_model and not is_valid_nusmv_code(cleaned_content):
             print("❌ LLM returned invalid NuSMV code after cleaning. Retrying...")
             return None
         
         return cleaned_content.strip()
     
+    except DeadlineExceeded:
+        raise
+    except TokenBudgetExceeded as e:
+        print(f"❌ Token budget exhausted: {e}")
+        return None
     except Exception as e:
+        check("LLM call finished")
         print(f"Error invoking LLM: {e}")
         return None
 
@@ -703,25 +745,31 @@ def generate_nusmv_model(scenarios, safety_properties):
         scenarios="\n- ".join(scenarios),
         safety_properties="\n- ".join(safety_properties))
     response = invoke_vllm(prompt)
+    if not response:
+        return None
     cleaned_model = clean_nusmv_model(response.strip())
     
     return cleaned_model
 
-def generate_valid_nusmv_model(scenarios, safety_properties, output_file="generated_model.smv"):
+def generate_valid_nusmv_model(scenarios, safety_properties, output_file="generated_model.smv", max_iterations=10):
     iteration = 0
     last_error_log = None
     nusmv_model = None
 
-    while True:  # Run indefinitely until no syntax errors
+    while iteration < max_iterations:
         iteration += 1
         print(f"\n=== Iteration {iteration}: Generating & Validating NuSMV Model ===")
 
-        if iteration == 1:
+        if nusmv_model is None:
             # Generate the initial NuSMV model
-            nusmv_model = generate_nusmv_model(scenarios, safety_properties)
+            new_model = generate_nusmv_model(scenarios, safety_properties)
         else:
             # Refine the model based on the last error log
-            nusmv_model = refine_nusmv_model(nusmv_model, last_error_log)
+            new_model = refine_nusmv_model(nusmv_model, last_error_log)
+        if not new_model:
+            print("❌ LLM returned no model; retrying.")
+            continue
+        nusmv_model = new_model
 
         # Print the NuSMV model for debugging
         print(f"\n🔍 NuSMV Model (Iteration {iteration}):\n{nusmv_model}\n")
@@ -750,9 +798,12 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
 
         last_error_log = error_log
 
+    print(f"\n❌ No syntactically valid NuSMV model after {max_iterations} iterations.")
+    return None
+
 
 def extract_nusmv_errors(nusmv_output, model_content):
-    errors = re.findall(r"file generated_model.smv: line (\d+): (.+)", nusmv_output)
+    errors = parse_error_lines(nusmv_output)
     if not errors:
         return None  # No errors found
 
@@ -772,11 +823,13 @@ def extract_nusmv_errors(nusmv_output, model_content):
 # =============================================
 
 def validate_nusmv_model(model_file):
+    timeout = time_limit(NUSMV_TIMEOUT, "NuSMV run")
     try:
         result = subprocess.run(
             ["NuSMV", model_file],
             capture_output=True,
-            text=True
+            text=True,
+            timeout=timeout
         )
 
         # If the command succeeds, return True and the output
@@ -786,6 +839,13 @@ def validate_nusmv_model(model_file):
         # If the command fails, return False and the error message
         return False, result.stderr
 
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed NuSMV
+        check("NuSMV finished")
+        error_message = f"NuSMV timed out after {timeout:.0f}s"
+        print(error_message)
+        return False, error_message
+
     except FileNotFoundError:
         error_message = "NuSMV not found. Ensure it is installed and available in your PATH."
         print(error_message)
@@ -815,7 +875,7 @@ def is_valid_nusmv_code(content):
     required_keywords = ["MODULE main", "VAR", "ASSIGN", "LTLSPEC"]
     return all(keyword in content for keyword in required_keywords)
 
-def minimize_violations_with_llm(input_model, output_model, scenarios, safety_properties, max_iterations=50):
+def minimize_violations_with_llm(input_model, output_model, scenarios, safety_properties, max_iterations=50, edit_mode="full"):
     print("\n🔄 Starting iterative violation minimization...")
 
     iteration = 0
@@ -957,7 +1017,26 @@ def minimize_violations_with_llm(input_model, output_model, scenarios, safety_pr
 
         try:
             # Invoke the LLM to refine the transition rules
-            response = invoke_vllm(prompt)
+            response = None
+            if edit_mode == "patch":
+                # Ask only for the changed blocks and splice them into the current model
+                patch_prompt = prompt.replace(
+                    "- Return only the corrected NuSMV model—no explanations, no extra text.",
+                    "- Return only the blocks you change, in the edit format below."
+                ).replace(
+                    "**Return only the corrected NuSMV model.**",
+                    f"**Numbered specifications:**\n{numbered_specs(model_content)}\n{EDIT_PROTOCOL_INSTRUCTIONS}"
+                )
+                edits = invoke_vllm(patch_prompt, require_model=False)
+                try:
+                    response = apply_llm_edits(model_content, edits)
+                except ModelEditError as e:
+                    print(f"\n❌ Could not apply model edits: {e}")
+                if response is None:
+                    print("\n🔄 Falling back to whole-model regeneration.")
+
+            if response is None:
+                response = invoke_vllm(prompt)
 
             if response is None:
                 print("\n❌ Error: No response received from LLM.")
@@ -1189,8 +1268,13 @@ while True:
     input_model = "./Ground-Truth-NuSMV-llama-2/3-4.smv"
     output_model = "./Ground-Truth-NuSMV-llama-2/3-4-8-regen.smv"
 
-    # Run the iterative violation minimization
-    minimize_violations_with_llm(input_model, output_model, scenarios3, safety_properties4)
+    # Run the iterative violation minimization; at the deadline the last written model is the result
+    try:
+        with deadline(CASE_DEADLINE):
+            minimize_violations_with_llm(input_model, output_model, scenarios3, safety_properties4,
+                                         edit_mode=EDIT_MODE)
+    except DeadlineExceeded as e:
+        print(f"\n⏱ Deadline reached ({e}). Partial result: {output_model}")
 
 
     # Step 6: Convert scenarios to YAML
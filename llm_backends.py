@@ -0,0 +1,581 @@
+"""
+Interchangeable LLM backends and a latency-aware router.
+
+The scripts in this repository each hard-code one endpoint: Lambda Labs
+(llama3.3-70b-instruct-fp8), a local vLLM server on :5000, the UNC Charlotte
+Qwen cluster, or a local Hugging Face model (llama.py / deepseek.py). Each of
+these is wrapped here as a backend with the same `complete(messages, ...)` call,
+and BackendRouter picks the backend with the best recent latency and error rate.
+
+With hedging enabled, a duplicate request is sent to the next-best backend when
+the primary has not answered within its p95 latency; the first answer wins and
+the other request is cancelled (local generation is stopped, remote requests
+that already started are abandoned and their result discarded).
+
+ReplayBackend answers from a recorded transcript instead of a model, for
+benchmarks that must not depend on a live endpoint (benchmark.py).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from rate_limit import AIMDLimiter, RequestCancelled, parse_retry_after
+
+LAMBDA_API_BASE = "https://api.lambdalabs.com/v1"
+LAMBDA_MODEL = "llama3.3-70b-instruct-fp8"
+VLLM_API_URL = "http://localhost:5000/v1/completions"
+VLLM_MODEL = "meta-llama/Llama-3.3-70B-Instruct"
+QWEN_API_URL = "http://cci-siscluster1.charlotte.edu:8080/api/chat/completions"
+QWEN_MODEL = "Qwen/Qwen2.5-14B-Instruct-1M"
+HF_MODEL = "meta-llama/Llama-2-8b-instruct"
+
+# Seconds between checks of a caller's cancel event while a routed request is waiting
+CANCEL_POLL = 0.5
+
+
+class BackendError(RuntimeError):
+    """
+    Raised when a backend call fails. `status` is the HTTP status code (None for
+    connection errors) and `retry_after` the server's Retry-After in seconds, if any.
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def messages_to_prompt(messages):
+    """
+    Flatten a chat history into a plain prompt for completion-style endpoints.
+    """
+    parts = [f"{m['role'].upper()}:\n{m['content']}" for m in messages]
+    return "\n\n".join(parts) + "\n\nASSISTANT:\n"
+
+
+def _post_json(url, payload, headers, timeout):
+    """
+    POST a JSON payload and return the decoded response, raising BackendError on failure.
+    """
+    try:
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+    except requests.RequestException as e:
+        raise BackendError(f"request to {url} failed: {e}") from e
+    if response.status_code != 200:
+        raise BackendError(f"{url} returned {response.status_code}: {response.text[:200]}",
+                           status=response.status_code,
+                           retry_after=parse_retry_after(response.headers.get("Retry-After")))
+    return response.json()
+
+
+class LambdaBackend:
+    """
+    Lambda Labs OpenAI-compatible chat endpoint (the default backend of main.py).
+    """
+
+    def __init__(self, client=None, model=LAMBDA_MODEL, name="lambda"):
+        self.name = name
+        self.model = model
+        self.client = client
+
+    def _client(self):
+        if self.client is None:
+            from openai import OpenAI
+            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""), base_url=LAMBDA_API_BASE)
+        return self.client
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        import openai
+        options = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        try:
+            response = self._client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                timeout=timeout,
+                **options
+            )
+        except openai.APIStatusError as e:
+            raise BackendError(f"{self.name} returned {e.status_code}: {e}", status=e.status_code,
+                               retry_after=parse_retry_after(e.response.headers.get("Retry-After"))) from e
+        except openai.APIError as e:
+            raise BackendError(f"{self.name} request failed: {e}") from e
+        usage = getattr(response, "usage", None)
+        return {
+            "text": response.choices[0].message.content,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "completion_tokens": usage.completion_tokens if usage else None
+        }
+
+
+class VLLMBackend:
+    """
+    Local vLLM server exposing the plain /v1/completions endpoint (llama-server.py).
+    """
+
+    def __init__(self, url=VLLM_API_URL, model=VLLM_MODEL, name="vllm"):
+        self.name = name
+        self.url = url
+        self.model = model
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        payload = {
+            "model": self.model,
+            "prompt": messages_to_prompt(messages),
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        result = _post_json(self.url, payload, {"Content-Type": "application/json"}, timeout)
+        usage = result.get("usage") or {}
+        return {
+            "text": result["choices"][0]["text"].strip(),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens")
+        }
+
+
+class QwenClusterBackend:
+    """
+    UNC Charlotte Open WebUI cluster serving Qwen (gwen-violation.py).
+    The bearer key is read from the UNC_API_KEY environment variable.
+    """
+
+    def __init__(self, url=QWEN_API_URL, model=QWEN_MODEL, api_key=None, name="qwen"):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.getenv("UNC_API_KEY", "")
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        result = _post_json(self.url, payload, headers, timeout)
+        usage = result.get("usage") or {}
+        return {
+            "text": result["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens")
+        }
+
+
+class HuggingFaceBackend:
+    """
+    Local transformers model (llama.py / deepseek.py). The model is loaded on first use;
+    a cancelled hedge stops generation at the next token.
+    """
+
+    def __init__(self, model_name=HF_MODEL, name="hf"):
+        self.name = name
+        self.model_name = model_name
+        self.tokenizer = None
+        self.model = None
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        with self._load_lock:
+            if self.model is None:
+                import torch
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float16,
+                                                                  device_map="auto")
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        started = time.monotonic()
+
+        class _Cancelled(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                timed_out = timeout is not None and time.monotonic() - started > timeout
+                return timed_out or (cancel_event is not None and cancel_event.is_set())
+
+        self._load()
+        if getattr(self.tokenizer, "chat_template", None):
+            prompt = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        else:
+            prompt = messages_to_prompt(messages)
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        sampling = {"do_sample": True, "temperature": temperature, "top_p": 0.9} if temperature > 0 else {"do_sample": False}
+        outputs = self.model.generate(
+            inputs.input_ids,
+            max_new_tokens=max_tokens,
+            stopping_criteria=StoppingCriteriaList([_Cancelled()]),
+            **sampling
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled(f"{self.name} generation cancelled")
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"{self.name} generation exceeded {timeout:.0f}s")
+        prompt_tokens = inputs.input_ids.shape[1]
+        new_tokens = outputs[0][prompt_tokens:]
+        return {
+            "text": self.tokenizer.decode(new_tokens, skip_special_tokens=True),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(new_tokens)
+        }
+
+
+class ReplayBackend:
+    """
+    Deterministic backend answering from a recorded transcript (see benchmark.py), so
+    the refinement loop can run without any LLM endpoint.
+
+    `transcript` is a list of recorded calls {"prompt_hash", "response", "prompt_tokens",
+    "completion_tokens"}, where prompt_hash is the run store hash of json.dumps(messages).
+    A call whose prompt was recorded gets that call's response (in recorded order when a
+    prompt repeats); any other call gets the next response not used yet. BackendError is
+    raised once every response has been used.
+    """
+
+    def __init__(self, transcript=(), name="replay"):
+        self.name = name
+        self.calls = list(transcript)
+        self.used = [False] * len(self.calls)
+        self.by_prompt = {}
+        for i, call in enumerate(self.calls):
+            self.by_prompt.setdefault(call.get("prompt_hash"), []).append(i)
+        self.matched = 0
+        self.unmatched = 0
+        self.lock = threading.Lock()
+
+    def _next_call(self, prompt_hash):
+        for i in self.by_prompt.get(prompt_hash, []):
+            if not self.used[i]:
+                self.matched += 1
+                return i
+        for i, used in enumerate(self.used):
+            if not used:
+                self.unmatched += 1
+                return i
+        return None
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        prompt_hash = hashlib.sha256(json.dumps(messages).encode("utf-8")).hexdigest()
+        with self.lock:
+            i = self._next_call(prompt_hash)
+            if i is None:
+                raise BackendError(f"{self.name}: transcript exhausted after {len(self.calls)} call(s)")
+            self.used[i] = True
+        call = self.calls[i]
+        return {
+            "text": call["response"],
+            "prompt_tokens": call.get("prompt_tokens"),
+            "completion_tokens": call.get("completion_tokens")
+        }
+
+
+BACKEND_TYPES = {
+    "lambda": LambdaBackend,
+    "vllm": VLLMBackend,
+    "qwen": QwenClusterBackend,
+    "hf": HuggingFaceBackend,
+    "replay": ReplayBackend,
+}
+
+
+def make_backends(names, options=None):
+    """
+    Build backends from a comma-separated string or list of names (see BACKEND_TYPES).
+    `options` maps a backend name to its constructor keyword arguments, e.g.
+    make_backends("lambda,vllm", {"lambda": {"client": client}}).
+    """
+    options = options or {}
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(",") if n.strip()]
+    backends = []
+    for name in names:
+        if name not in BACKEND_TYPES:
+            raise ValueError(f"Unknown LLM backend {name!r} (choose from {', '.join(BACKEND_TYPES)})")
+        backends.append(BACKEND_TYPES[name](**options.get(name, {})))
+    return backends
+
+
+def _earliest(*values):
+    """
+    Smallest of the values that are not None (None if all are).
+    """
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def percentile(values, p):
+    """
+    Linear-interpolated percentile (0-100) of a non-empty sequence.
+    """
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class LatencyStats:
+    """
+    Rolling window of call latencies and outcomes for one backend.
+    """
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.calls = 0
+        self.errors = 0
+        self.races_won = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.calls += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def record_cancelled(self, elapsed):
+        """
+        A hedged loser ran at least `elapsed` seconds; keep it so the tail is not hidden.
+        """
+        with self.lock:
+            self.latencies.append(elapsed)
+
+    def percentile(self, p):
+        with self.lock:
+            return percentile(self.latencies, p) if self.latencies else None
+
+    def error_rate(self):
+        with self.lock:
+            return 1.0 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def samples(self):
+        return len(self.latencies)
+
+
+class BackendRouter:
+    """
+    Send each request to the backend with the best recent latency and error rate.
+
+    Backends are scored by p50 latency scaled by 1 / (1 - error_rate); a backend with
+    fewer than `min_samples` successful calls is tried first so every backend gets
+    measured. With hedge=True, a duplicate request goes to the next-best backend once
+    the primary exceeds its p95 latency (or `hedge_after` seconds before it has
+    enough samples); the first successful answer is returned.
+
+    Each backend has its own AIMDLimiter (rate_limit.py), which bounds concurrent
+    calls and retries throttled/transient failures before the router fails over.
+    `limiter_options` are passed to every AIMDLimiter.
+    """
+
+    def __init__(self, backends, hedge=False, hedge_percentile=95, hedge_after=None, min_samples=5,
+                 window=100, timeout=None, limiter_options=None):
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.backends = list(backends)
+        self.stats = {b.name: LatencyStats(window) for b in self.backends}
+        self.limiters = {b.name: AIMDLimiter(name=b.name, **(limiter_options or {})) for b in self.backends}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.timeout = timeout
+        self.hedged_requests = 0
+        self.demoted = None
+        self.executor = ThreadPoolExecutor(max_workers=8 * len(self.backends), thread_name_prefix="llm")
+
+    def score(self, backend):
+        stats = self.stats[backend.name]
+        if stats.calls < self.min_samples:
+            return (0, stats.calls)
+        if not stats.samples():
+            return (2, stats.error_rate())
+        error_rate = min(stats.error_rate(), 0.99)
+        return (1, stats.percentile(50) / (1.0 - error_rate))
+
+    def ranked(self):
+        """
+        Backends ordered from best to worst score (a demoted backend goes last).
+        """
+        return sorted(self.backends, key=lambda b: (b.name == self.demoted, self.score(b)))
+
+    def switch_backend(self):
+        """
+        Demote the current best backend so that requests go elsewhere.
+        Returns the name of the backend now ranked first (unchanged with a single backend).
+        """
+        if len(self.backends) > 1:
+            self.demoted = self.ranked()[0].name
+        return self.ranked()[0].name
+
+    def hedge_delay(self, backend):
+        stats = self.stats[backend.name]
+        if stats.samples() >= self.min_samples:
+            return stats.percentile(self.hedge_percentile)
+        return self.hedge_after
+
+    def _call(self, backend, messages, max_tokens, temperature, cancel_event, timeout):
+        if cancel_event.is_set():
+            raise RequestCancelled(f"{backend.name} request cancelled before sending")
+        start = time.perf_counter()
+        try:
+            result = self.limiters[backend.name].call(
+                lambda: backend.complete(messages, max_tokens=max_tokens, temperature=temperature,
+                                         cancel_event=cancel_event, timeout=timeout),
+                cancel_event
+            )
+        except Exception as e:
+            if cancel_event.is_set():
+                self.stats[backend.name].record_cancelled(time.perf_counter() - start)
+            elif not isinstance(e, RequestCancelled):
+                self.stats[backend.name].record(time.perf_counter() - start, False)
+            raise
+        latency = time.perf_counter() - start
+        self.stats[backend.name].record(latency, True)
+        result["backend"] = backend.name
+        result["latency"] = latency
+        return result
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, timeout=None, cancel_event=None):
+        """
+        Run one chat completion and return a dict with text, backend, latency and token counts.
+        Raises the last BackendError if every attempted backend fails.
+
+        `timeout` bounds the whole request, hedges and retries included (the router's own
+        timeout applies per HTTP call); in-flight calls are cancelled and TimeoutError is
+        raised when it expires. Setting `cancel_event` cancels the in-flight calls the same
+        way and raises RequestCancelled (checked every CANCEL_POLL seconds).
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled("LLM request cancelled before sending")
+        ranked = self.ranked()
+        pending = {}
+        errors = []
+        ends = time.monotonic() + timeout if timeout is not None else None
+        call_timeout = _earliest(self.timeout, timeout)
+
+        def launch(backend):
+            call_cancel = threading.Event()
+            future = self.executor.submit(self._call, backend, messages, max_tokens, temperature, call_cancel,
+                                          call_timeout)
+            pending[future] = (backend, call_cancel)
+            if self.hedge and fallbacks:
+                delay = self.hedge_delay(backend)
+                return time.monotonic() + delay if delay is not None else None
+            return None
+
+        fallbacks = ranked[1:]
+        hedge_at = launch(ranked[0])
+
+        while pending:
+            now = time.monotonic()
+            if ends is not None and now >= ends:
+                for other, (_, call_cancel) in pending.items():
+                    call_cancel.set()
+                    other.cancel()
+                raise TimeoutError(f"LLM request exceeded its {timeout:.0f}s limit")
+            if cancel_event is not None and cancel_event.is_set():
+                for other, (_, call_cancel) in pending.items():
+                    call_cancel.set()
+                    other.cancel()
+                raise RequestCancelled("LLM request cancelled by the caller")
+            wake_at = _earliest(hedge_at, ends, now + CANCEL_POLL if cancel_event is not None else None)
+            done, _ = wait(list(pending), timeout=wake_at - now if wake_at is not None else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    # Primary is slower than its tail latency: hedge to the next-best backend
+                    self.hedged_requests += 1
+                    launch(fallbacks.pop(0))
+                    hedge_at = None
+                continue
+            for future in done:
+                backend, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠ LLM backend {backend.name} failed: {e}")
+                    errors.append(e)
+                    continue
+                for other, (_, call_cancel) in pending.items():
+                    call_cancel.set()
+                    other.cancel()
+                if pending:
+                    self.stats[backend.name].races_won += 1
+                return result
+            if not pending and fallbacks:
+                # Every in-flight request failed: fail over to the next backend
+                hedge_at = launch(fallbacks.pop(0))
+
+        raise errors[-1] if errors else BackendError("no LLM backend available")
+
+    def state(self):
+        """
+        JSON-serializable routing state (latency windows, limiter windows, demoted backend)
+        so that a resumed run routes requests the way the interrupted one did.
+        """
+        state = {"demoted": self.demoted, "hedged_requests": self.hedged_requests, "backends": {}}
+        for backend in self.backends:
+            stats = self.stats[backend.name]
+            with stats.lock:
+                state["backends"][backend.name] = {
+                    "latencies": list(stats.latencies),
+                    "outcomes": list(stats.outcomes),
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "races_won": stats.races_won,
+                    "limit": self.limiters[backend.name].limit
+                }
+        return state
+
+    def restore(self, state):
+        """
+        Restore a state() snapshot; backends that are no longer configured are ignored.
+        """
+        self.hedged_requests = state.get("hedged_requests", 0)
+        if any(b.name == state.get("demoted") for b in self.backends):
+            self.demoted = state["demoted"]
+        for backend in self.backends:
+            saved = state.get("backends", {}).get(backend.name)
+            if not saved:
+                continue
+            stats = self.stats[backend.name]
+            with stats.lock:
+                stats.latencies.extend(saved["latencies"])
+                stats.outcomes.extend(saved["outcomes"])
+                stats.calls = saved["calls"]
+                stats.errors = saved["errors"]
+                stats.races_won = saved["races_won"]
+            self.limiters[backend.name].limit = float(saved["limit"])
+
+    def report(self):
+        """
+        Per-backend latency percentiles, error rates and hedge counts.
+        """
+        report = {"hedged_requests": self.hedged_requests, "backends": {}}
+        for backend in self.backends:
+            stats = self.stats[backend.name]
+            report["backends"][backend.name] = {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "error_rate": round(stats.error_rate(), 3),
+                "p50": stats.percentile(50),
+                "p95": stats.percentile(95),
+                "p99": stats.percentile(99),
+                "races_won": stats.races_won,
+                "limiter": self.limiters[backend.name].report()
+            }
+        return report
@@ -0,0 +1,234 @@
+"""
+Import the historical violation logs into the run store.
+
+The Phase 2 experiments before run_store.py only left PowerShell console
+captures: UTF-16 LE files with CRLF line endings named
+<model>-violation-result-<scenarios>-<properties>[-<repeat>].txt in
+Llama-Violation-Result*/, Gwen-Violation-Result/ and result-violation/. Each
+file holds one or more runs (a run restarted in the same console is appended)
+made of blocks like
+
+    === Iteration 3 ===
+    **Detected 12 failing LTL properties.**
+    **Violations:** ['-- specification  G (...)  is false', ...]
+    LLM Response:
+    MODULE main
+    ...
+    Model successfully regenerated and saved to `...`.
+
+Files are read line by line through the UTF-16 codec (never whole) and parsed
+on a process pool; the parsed runs are written to the store by the parent
+process, one transaction per run. Run ids are derived from the file path, so
+importing the same archive again adds nothing.
+
+Usage: python log_import.py runs.sqlite [file or directory ...]
+       (default: every *-violation-result-*.txt below the current directory)
+"""
+
+import glob
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from run_store import ITERATION_END, ITERATION_START, LLM_CALL, VERIFIER_CALL, RunStore
+from token_budget import count_tokens
+
+LOG_PATTERN = "*-violation-result-*.txt"
+# result-violation/ has a single run per case, without the repeat number
+_LOG_NAME = re.compile(r"(?P<model>[A-Za-z0-9]+)-violation-result-(?P<case>\d+-\d+)(?:-(?P<repeat>\d+))?\.txt$")
+
+_RUN_START = re.compile(r"^Starting iterative violation minimization")
+_ITERATION = re.compile(r"=== Iteration (\d+) ===")
+_DETECTED = re.compile(r"\*\*Detected (\d+) failing LTL propert")
+_VIOLATIONS = re.compile(r"\*\*Violations:\*\*\s*(.*)")
+_FAILED_SPEC = re.compile(r"-- specification\s+(.*?)\s+is false")
+_RESPONSE = re.compile(r"LLM Response.*:\s*$")
+_SYNTAX_FIXED_MODEL = re.compile(r"Syntax-corrected model:\s*$")
+_SYNTAX_ERROR = re.compile(r"Model contains syntax errors|Model still contains syntax errors|"
+                           r"Newly generated model still contains errors")
+_SAFE = re.compile(r"No violations detected")
+_GAVE_UP = re.compile(r"Failed to minimize violations after (\d+) iterations")
+# Console lines that end an embedded model (the emoji in front of them are mangled by the capture)
+_MODEL_END = re.compile(r"Model successfully regenerated|Syntax errors corrected|=== Iteration|"
+                        r"No violations detected|Failed to minimize|Starting iterative|contains syntax errors|"
+                        r"still contains errors|No reduction in violations|Violations reduced")
+
+
+def find_logs(paths):
+    """
+    Log files among the given files and directories (searched recursively).
+    """
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(glob.glob(os.path.join(path, "**", LOG_PATTERN), recursive=True))
+        elif _LOG_NAME.search(os.path.basename(path)):
+            logs.append(path)
+    return sorted(set(logs))
+
+
+def open_log(path):
+    """
+    Open a console capture for line-by-line reading: UTF-16 if it starts with a BOM, else UTF-8.
+    """
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    encoding = "utf-16" if bom in (b"\xff\xfe", b"\xfe\xff") else "utf-8"
+    return open(path, 'r', encoding=encoding, errors="replace", newline=None)
+
+
+def parse_log(path):
+    """
+    Parse one log file into a list of runs: {"attempt", "status", "iterations", "events"}
+    (events as accepted by RunStore.add_run). The model verified in an iteration is the
+    previous LLM response, so the first iteration's verifier event has no model.
+    """
+    runs = []
+    run = None
+    iteration = None
+    model = None
+    block = None  # ("response" | "syntax-fix", lines) while an embedded model is being read
+
+    def emit(kind, **fields):
+        run["events"].append({"kind": kind, "phase": "phase2", "iteration": iteration, **fields})
+
+    def end_block():
+        nonlocal block, model
+        if block is None:
+            return
+        label, lines = block
+        block = None
+        text = "\n".join(lines).strip()
+        if text:
+            emit(LLM_CALL, texts={"response": text},
+                 data={"label": label, "completion_tokens": count_tokens(text), "estimated": True})
+            model = text
+
+    def end_iteration():
+        if run and iteration is not None:
+            emit(ITERATION_END, data={"violations": run["violations"]})
+
+    with open_log(path) as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if block is not None:
+                if not _MODEL_END.search(line):
+                    block[1].append(line)
+                    continue
+                end_block()
+
+            if _RUN_START.search(line):
+                if run is None or run["iterations"]:
+                    end_iteration()
+                    run = {"attempt": len(runs) + 1, "status": "running", "iterations": 0, "violations": None,
+                           "events": []}
+                    runs.append(run)
+                    iteration = None
+                    model = None
+                continue
+            if run is None:
+                continue
+
+            match = _ITERATION.search(line)
+            if match:
+                end_iteration()
+                iteration = int(match.group(1))
+                run["iterations"] = iteration
+                emit(ITERATION_START)
+                continue
+            match = _DETECTED.search(line)
+            if match:
+                run["violations"] = int(match.group(1))
+                continue
+            match = _VIOLATIONS.search(line)
+            if match:
+                failed = _FAILED_SPEC.findall(match.group(1))
+                emit(VERIFIER_CALL, model=model,
+                     data={"syntax_ok": True, "timed_out": False, "failed": failed, "passed": [],
+                           "detected": run["violations"]})
+                continue
+            if _SYNTAX_ERROR.search(line):
+                emit(VERIFIER_CALL, model=model, data={"syntax_ok": False, "timed_out": False, "failed": [],
+                                                       "passed": []})
+                run["violations"] = None
+                continue
+            if _SAFE.search(line):
+                emit(VERIFIER_CALL, model=model, data={"syntax_ok": True, "timed_out": False, "failed": [],
+                                                       "passed": []})
+                run["violations"] = 0
+                run["status"] = "finished"
+                continue
+            if _GAVE_UP.search(line):
+                run["status"] = "finished"
+                continue
+            if _RESPONSE.search(line):
+                block = ("regenerate", [])
+            elif _SYNTAX_FIXED_MODEL.search(line):
+                block = ("fix-syntax", [])
+        end_block()
+        end_iteration()
+    for run in runs:
+        run.pop("violations")
+    return runs
+
+
+def import_job(path):
+    """
+    Parse a log in a pool process; returns (path, runs) or (path, error message).
+    """
+    try:
+        return path, parse_log(path)
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}"
+
+
+def log_run_id(path, attempt):
+    """
+    Stable run id for the attempt-th run of a log file (relative paths keep it stable across hosts).
+    """
+    key = f"{os.path.relpath(path).replace(os.sep, '/')}#{attempt}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def import_logs(store_file, paths=(".",), workers=None):
+    """
+    Import every log found under `paths` into the run store at store_file.
+    Returns {"files", "runs", "skipped", "errors"}.
+    """
+    logs = find_logs(paths)
+    print(f"Importing {len(logs)} log file(s) into {store_file}...")
+    store = RunStore(store_file)
+    counts = {"files": len(logs), "runs": 0, "skipped": 0, "errors": 0}
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, runs in pool.map(import_job, logs, chunksize=4):
+                if isinstance(runs, str):
+                    print(f"❌ {path}: {runs}")
+                    counts["errors"] += 1
+                    continue
+                name = _LOG_NAME.search(os.path.basename(path))
+                modified = os.path.getmtime(path)
+                for run in runs:
+                    added = store.add_run(
+                        log_run_id(path, run["attempt"]), name.group("case"), run["events"],
+                        backend=name.group("model"), repeat=int(name.group("repeat") or 1), status=run["status"],
+                        started=modified, finished=modified, source=os.path.relpath(path),
+                        attempt=run["attempt"], imported=True
+                    )
+                    counts["runs" if added else "skipped"] += 1
+    finally:
+        store.close()
+    print(f"✓ Imported {counts['runs']} run(s) from {counts['files']} file(s) in "
+          f"{time.perf_counter() - start:.1f}s ({counts['skipped']} already imported, {counts['errors']} failed)")
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python log_import.py <runs.sqlite> [file or directory ...]")
+        sys.exit(1)
+    import_logs(sys.argv[1], sys.argv[2:] or ["."])
@@ -23,11 +23,34 @@ from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from openai import OpenAI
+import atexit
 import os
 import subprocess
 import yaml
 import re
 import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from deadline import DeadlineExceeded, check, deadline, time_limit
+from checkpoint import (FAILED, FINISHED, RUNNING, checkpoint_path, is_case_finished, load_checkpoint,
+                        restore_rng_state, rng_state, save_checkpoint)
+from llm_backends import BackendRouter, make_backends
+from rate_limit import RequestCancelled
+from nusmv_autofix import autofix_model
+from run_store import ITERATION_END, ITERATION_START, LLM_CALL, VERIFIER_CALL, RunStore
+from scheduler import IterationScheduler
+from nusmv_model import (EDIT_PROTOCOL_INSTRUCTIONS, ModelEditError, apply_llm_edits, apply_model_edits,
+                         cone_of_influence, model_fingerprint, numbered_specs, parse_model_edits, parse_nusmv_model,
+                         spec_variables)
+from verifier import (FALSIFIER_OPTIONS, NUSMV_FAILED, NUSMV_NOT_FOUND, VerifierPool, extract_nusmv_violations, is_safe,
+                      is_tool_error, rank_key, verdict_from_output)
+from token_budget import (TokenBudgetExceeded, TokenLedger, count_message_tokens, count_tokens, fit_prompt,
+                          truncate_trace)
+import tracing
+from tracing import span, text_hash, traced
+from metrics import CACHE_LOOKUPS, LLM_CALLS, LLM_IN_FLIGHT, LLM_SECONDS, LLM_TOKENS, NUSMV_RUNS, NUSMV_SECONDS
 
 # Load environment variables
 load_dotenv()
@@ -59,6 +82,64 @@ client = OpenAI(
     base_url=openai_api_base,
 )
 
+# LLM backends, best first by recent latency/error rate: lambda, vllm, qwen, hf (comma separated).
+# With TAPASSURE_HEDGE=yes a duplicate request goes to the next backend after the primary's p95 latency.
+LLM_BACKENDS = os.getenv("TAPASSURE_BACKENDS", "lambda")
+HEDGE_REQUESTS = os.getenv("TAPASSURE_HEDGE", "no").lower() == "yes"
+# Throttled (429/503) and transient failures are retried inside the client, up to this many times per backend
+LLM_MAX_RETRIES = 5
+
+def make_llm_router(backend_names):
+    """
+    Router over the given backends (comma-separated names) with this module's hedging and retry settings.
+    """
+    return BackendRouter(make_backends(backend_names, {"lambda": {"client": client}}), hedge=HEDGE_REQUESTS,
+                         limiter_options={"max_retries": LLM_MAX_RETRIES})
+
+llm_router = make_llm_router(LLM_BACKENDS)
+
+# Token budgets (None = unlimited). Prompts above MAX_PROMPT_TOKENS are compacted before sending.
+MAX_PROMPT_TOKENS = 16000
+CASE_TOKEN_BUDGET = None
+RUN_TOKEN_BUDGET = None
+
+# Wall-clock limit per case in seconds (None = none); every LLM call and NuSMV run gets the remaining time
+CASE_DEADLINE = float(os.getenv("TAPASSURE_DEADLINE")) if os.getenv("TAPASSURE_DEADLINE") else None
+# Upper bound for a single LLM request, retries and hedges included
+LLM_TIMEOUT = 600
+
+# Records prompt/completion tokens of every LLM call, per case
+token_ledger = TokenLedger(run_budget=RUN_TOKEN_BUDGET, case_budget=CASE_TOKEN_BUDGET)
+
+RUN_RECORD_FILE = "run_record.json"
+
+# Structured event store (see run_store.py), e.g. TAPASSURE_RUN_STORE=runs.sqlite; None = console output only
+RUN_STORE_FILE = os.getenv("TAPASSURE_RUN_STORE")
+run_store = RunStore(RUN_STORE_FILE) if RUN_STORE_FILE else None
+
+# Stage tracing (see tracing.py), e.g. TAPASSURE_TRACE=traces/run writes traces/run.json and
+# traces/run.folded on exit; None = tracing off
+TRACE_PREFIX = os.getenv("TAPASSURE_TRACE")
+if TRACE_PREFIX:
+    tracing.enable()
+    atexit.register(tracing.export, TRACE_PREFIX)
+
+# Wall time of the current case; offset carries the time spent before a resume
+run_clock = {"start": time.perf_counter(), "offset": 0.0}
+
+# Beam mode: extra candidates are sampled at this temperature and model-checked in parallel
+BEAM_TEMPERATURE = 0.7
+NUSMV_WORKERS = os.cpu_count() or 1
+
+# When Phase 2 returns to a model it already tried, escalate one step further each time:
+# perturb the prompt, then also sample at CYCLE_TEMPERATURE, then also switch backends.
+CYCLE_STRATEGIES = ["perturb-prompt", "raise-temperature", "switch-backend"]
+CYCLE_TEMPERATURE = 0.7
+CYCLE_HINT = """
+IMPORTANT: Your recent repairs led back to a model that was already tried and still violates the
+properties above. Do not repeat earlier fixes. Change a different transition rule or guard condition,
+and make sure the change addresses the counterexample directly."""
+
 #############################
 # SAMPLE SCENARIOS & PROPERTIES
 #############################
@@ -123,6 +204,15 @@ safety_properties4 = [
     "Virtual Fan 1 must deactivate when Virtual A/C 2 is running."
 ]
 
+# Predefined test cases: "<scenario set>-<property set>" -> (scenarios, safety properties),
+# named like the models in Ground-Truth-NuSMV-*/ (main() offers 1-1, 2-2, 3-3 and 3-4)
+PREDEFINED_CASES = {
+    f"{s}-{p}": (scenarios, safety_properties)
+    for s, scenarios in enumerate([scenarios1, scenarios2, scenarios3], 1)
+    for p, safety_properties in enumerate([safety_properties1, safety_properties2, safety_properties3,
+                                           safety_properties4], 1)
+}
+
 #############################
 # SMARTTHINGS API FUNCTIONS
 #############################
@@ -146,34 +236,81 @@ def get_smartthings_devices():
 # LLM INVOCATION FUNCTIONS
 #############################
 
-def invoke_vllm(prompt, max_tokens=5000):
+SYSTEM_PROMPT = "You are a helpful assistant that strictly follows the user's instructions."
+
+def invoke_vllm(prompt, max_tokens=5000, label="", temperature=0.0, cancel_event=None):
     """
     Send a request to the OpenAI-compatible API (Lambda Labs) to generate a response.
     This is the primary method used for both processes.
     Cleans the response to remove markdown formatting and ensure valid NuSMV code.
     """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    return invoke_vllm_chat(messages, max_tokens=max_tokens, label=label, temperature=temperature,
+                            cancel_event=cancel_event)
+
+def invoke_vllm_chat(messages, max_tokens=5000, label="", temperature=0.0, cancel_event=None):
+    """
+    Send a full chat history (system/user/assistant messages) to the LLM.
+    Used by conversation sessions, where earlier turns are resent as context.
+    Token usage is recorded in token_ledger; raises TokenBudgetExceeded if the
+    prompt does not fit the remaining case/run budget, and DeadlineExceeded if the
+    case deadline passes before or during the call. Setting `cancel_event` abandons
+    the call and raises RequestCancelled.
+    """
+    timeout = time_limit(LLM_TIMEOUT, "LLM call")
+    prompt_tokens = count_message_tokens(messages)
+    max_tokens = token_ledger.reserve(prompt_tokens, max_tokens)
+    reservation = (prompt_tokens, max_tokens)
+    start = time.perf_counter()
+
     try:
-        response = client.chat.completions.create(
-            model="llama3.3-70b-instruct-fp8",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that strictly follows the user's instructions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0,
-            max_tokens=max_tokens
-        )
+        LLM_IN_FLIGHT.inc()
+        try:
+            with span("llm", label=label, temperature=temperature, max_tokens=max_tokens) as sp:
+                response = llm_router.complete(messages, max_tokens=max_tokens, temperature=temperature,
+                                               timeout=timeout, cancel_event=cancel_event)
+        finally:
+            LLM_IN_FLIGHT.dec()
+            LLM_SECONDS.observe(time.perf_counter() - start)
         
-        generated_content = response.choices[0].message.content
+        generated_content = response["text"]
+
+        # Prefer the server's token counts when it reports them
+        if response["prompt_tokens"] is not None:
+            prompt_tokens, completion_tokens = response["prompt_tokens"], response["completion_tokens"]
+        else:
+            completion_tokens = count_tokens(generated_content)
+        token_ledger.record(prompt_tokens, completion_tokens, label)
+        sp.set(backend=response["backend"], prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        LLM_CALLS.inc(backend=response["backend"], outcome="ok")
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        record_event(LLM_CALL, elapsed=time.perf_counter() - start, label=label, backend=response["backend"],
+                     latency=response["latency"], temperature=temperature, prompt_tokens=prompt_tokens,
+                     completion_tokens=completion_tokens,
+                     texts={"prompt": json.dumps(messages), "response": generated_content})
         
         # Clean the response to remove markdown formatting
-        cleaned_content = re.sub(r"```(?:nusmv|plaintext|smv)?\n", "", generated_content)
-        cleaned_content = re.sub(r"\n```", "", cleaned_content)
+        with span("clean"):
+            cleaned_content = re.sub(r"```(?:nusmv|plaintext|smv)?\n", "", generated_content)
+            cleaned_content = re.sub(r"\n```", "", cleaned_content)
         
         return cleaned_content.strip()
     
     except Exception as e:
+        LLM_CALLS.inc(backend="", outcome=type(e).__name__)
+        record_event(LLM_CALL, elapsed=time.perf_counter() - start, label=label, temperature=temperature,
+                     error=f"{type(e).__name__}: {e}")
+        if isinstance(e, RequestCancelled):
+            raise
+        check("LLM call finished")
         print(f"Error invoking LLM: {e}")
         return None
+    finally:
+        token_ledger.release(*reservation)
 
 #############################
 # PROCESS 1: CONTEXT & SCENARIO VALIDATION
@@ -226,7 +363,7 @@ Your response should include:
 
         while True:
             prompt = template.format(scenario=scenario, device_list=", ".join(devices))
-            result = invoke_vllm(prompt)
+            result = invoke_vllm(prompt, label="validation")
 
             if not result:
                 print("\nError communicating with LLM. Please try again.")
@@ -295,7 +432,7 @@ Your response must explicitly include:
 
         while True:
             prompt = safety_template.format(property=safety_property, device_list=", ".join(devices))
-            result = invoke_vllm(prompt)
+            result = invoke_vllm(prompt, label="validation")
 
             if not result:
                 print("\nError communicating with LLM. Please try again.")
@@ -335,6 +472,17 @@ def is_valid_nusmv_code(content):
     required_keywords = ["MODULE", "VAR", "ASSIGN"]
     return any(keyword in content for keyword in required_keywords)
 
+def write_model_file(model_file, model_content):
+    """
+    Write a model text to model_file (traced as a "write" span).
+    """
+    with span("write") as sp:
+        if sp:
+            sp.set(model_hash=text_hash(model_content), chars=len(model_content))
+        with open(model_file, 'w') as f:
+            f.write(model_content)
+
+@traced("clean")
 def clean_nusmv_model(model_content):
     """
     Clean NuSMV model content by removing markdown formatting.
@@ -375,7 +523,7 @@ Generate a complete NuSMV model that:
 Return ONLY the NuSMV model code without any explanations or markdown formatting.
 """
     
-    result = invoke_vllm(prompt, max_tokens=8000)
+    result = invoke_vllm(prompt, max_tokens=8000, label="generate")
     return clean_nusmv_model(result) if result else None
 
 def validate_nusmv_syntax(model_file):
@@ -383,29 +531,42 @@ def validate_nusmv_syntax(model_file):
     Validate NuSMV model syntax using the NuSMV model checker.
     Returns (is_valid, error_message)
     """
+    timeout = time_limit(30, "syntax check")
+    start = time.perf_counter()
     try:
-        result = subprocess.run(
-            ["NuSMV", model_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+        with span("nusmv", check="syntax") as sp:
+            trace_model_file(sp, model_file)
+            result = subprocess.run(
+                ["NuSMV", model_file],
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
         
         output = result.stdout + result.stderr
+        record_verification(model_file, output, time.perf_counter() - start)
+        count_nusmv_run("syntax", "ok", start)
         
         # Check for syntax errors
-        if "syntax error" in output.lower() or ("error:" in output.lower() and "line" in output.lower()):
+        with span("parse"):
+            syntax_error = "syntax error" in output.lower() or ("error:" in output.lower() and "line" in output.lower())
+        sp.set(syntax_ok=not syntax_error)
+        if syntax_error:
             return False, output
         
         return True, "Model is syntactically valid"
         
     except subprocess.TimeoutExpired:
+        record_verification(model_file, "", time.perf_counter() - start, timed_out=True)
+        count_nusmv_run("syntax", "timeout", start)
+        check("syntax check finished")
         return False, "NuSMV execution timeout"
     except FileNotFoundError:
         return False, "NuSMV not found. Please install NuSMV and add it to PATH."
     except Exception as e:
         return False, f"Error running NuSMV: {str(e)}"
 
+@traced("parse")
 def extract_nusmv_errors(nusmv_output, model_content):
     """
     Extract and parse syntax errors from NuSMV output.
@@ -418,10 +579,36 @@ def extract_nusmv_errors(nusmv_output, model_content):
     
     return errors if errors else ["Unknown syntax error"]
 
-def refine_nusmv_model(nusmv_model, error_log):
+FULL_MODEL_INSTRUCTIONS = "Return ONLY the corrected NuSMV model code without any explanations or markdown formatting."
+
+# Output budget for edit-protocol replies; only the changed blocks come back
+PATCH_MAX_TOKENS = 2000
+
+def return_instructions(model_content, edit_mode):
+    """
+    Closing instructions of a repair prompt: whole model, or targeted block edits.
+    """
+    if edit_mode == "patch":
+        return f"Numbered specifications:\n{numbered_specs(model_content)}\n{EDIT_PROTOCOL_INSTRUCTIONS}"
+    return FULL_MODEL_INSTRUCTIONS
+
+def resolve_model_response(model_content, response):
+    """
+    Apply an edit-protocol response to model_content (or accept a whole model).
+    Returns the new model, or None if the edits cannot be applied.
+    """
+    try:
+        return apply_llm_edits(model_content, response)
+    except ModelEditError as e:
+        print(f"❌ Could not apply model edits: {e}")
+        return None
+
+def refine_nusmv_model(nusmv_model, error_log, edit_mode="full"):
     """
     PROCESS 1 - Step 4: Refine NuSMV model based on syntax errors.
     Uses LLM to fix syntax errors iteratively.
+    With edit_mode="patch" the LLM returns only the blocks it changes; if they cannot
+    be applied, the whole model is regenerated instead.
     """
     errors_text = '\n'.join(error_log)
     
@@ -437,16 +624,138 @@ Errors detected:
 
 Fix the syntax errors and return the corrected NuSMV model.
 Ensure the model adheres to proper NuSMV syntax.
-Return ONLY the corrected NuSMV model code without any explanations or markdown formatting.
+{return_instructions(nusmv_model, "patch" if edit_mode == "cone" else edit_mode)}
 """
     
-    result = invoke_vllm(prompt, max_tokens=8000)
+    if edit_mode in ("patch", "cone"):
+        # Syntax errors have no failing spec, so cone mode uses plain block edits here
+        result = invoke_vllm(prompt, max_tokens=PATCH_MAX_TOKENS, label="refine-patch")
+        new_model = resolve_model_response(nusmv_model, clean_nusmv_model(result)) if result else None
+        if new_model:
+            return new_model
+        print("Falling back to whole-model regeneration...")
+        return refine_nusmv_model(nusmv_model, error_log, edit_mode="full")
+
+    result = invoke_vllm(prompt, max_tokens=8000, label="refine")
     return clean_nusmv_model(result) if result else None
 
-def generate_valid_nusmv_model(scenarios, safety_properties, output_file="generated_model.smv", max_iterations=10):
+def record_event(kind, **fields):
+    """
+    Append an event for the current case to run_store (see run_store.RunStore.emit).
+    """
+    if run_store is not None:
+        run_store.emit(token_ledger.case, kind, **fields)
+
+def record_verdict(model, verdict, options=()):
+    """
+    Record a NuSMV run (verdict dict from verifier.verdict_from_output) as a verifier_call event.
+    """
+    record_event(VERIFIER_CALL, model=model, elapsed=verdict["elapsed"], options=list(options),
+                 syntax_ok=verdict["syntax_ok"], timed_out=verdict["timed_out"], passed=verdict["passed"],
+                 failed=verdict["failed"])
+
+def count_nusmv_run(check_name, outcome, start):
+    """
+    Count a finished NuSMV run (started at perf_counter `start`) in the live metrics.
+    """
+    NUSMV_RUNS.inc(check=check_name, outcome=outcome)
+    NUSMV_SECONDS.observe(time.perf_counter() - start, check=check_name)
+
+def trace_model_file(sp, model_file):
+    """
+    Add the model's hash and specification count to a tracing span (no-op when tracing is off).
+    """
+    if not sp:
+        return
+    try:
+        with open(model_file, 'r') as f:
+            model = f.read()
+    except OSError:
+        return
+    sp.set(model_hash=text_hash(model), spec_count=len(parse_nusmv_model(model)["specs"]))
+
+def record_verification(model_file, output, elapsed, timed_out=False):
+    """
+    record_verdict for a NuSMV run on a model file.
+    """
+    if run_store is None:
+        return
+    with open(model_file, 'r') as f:
+        model = f.read()
+    record_verdict(model, verdict_from_output(output, timed_out, elapsed))
+
+def begin_stored_run(run_record, resume=None):
+    """
+    Start a run of the case in run_store; settings are taken from run_record.
+    """
+    if run_store is None:
+        return
+    settings = {key: value for key, value in run_record.items()
+                if key not in ("case", "backend", "repeat") and isinstance(value, (str, int, float, bool))}
+    if resume:
+        settings["resumed_after"] = resume["iteration"]
+    run_store.begin_run(run_record["case"], backend=run_record.get("backend", LLM_BACKENDS),
+                        repeat=run_record.get("repeat"), **settings)
+
+def end_stored_run(case, status=None):
+    """
+    Close the case's run in run_store with `status` (default: its checkpoint status).
+    """
+    if run_store is None:
+        return
+    if status is None:
+        status = (load_checkpoint(checkpoint_path(case)) or {}).get("status", FAILED)
+    run_store.end_run(case, status)
+
+def record_iteration(run_record, phase, iteration, marker, **fields):
+    """
+    Append per-iteration token usage (calls made since `marker`) to run_record[phase],
+    and record the end of the iteration in run_store.
+    """
+    usage = token_ledger.usage_since(marker)
+    record_event(ITERATION_END, phase=phase, iteration=iteration, **fields, **usage)
+    if run_record is None:
+        return
+    entry = {"iteration": iteration}
+    entry.update(fields)
+    entry.update(usage)
+    run_record.setdefault(phase, []).append(entry)
+
+def write_checkpoint(checkpoint_file, run_record, status, **state):
+    """
+    Persist the state of a case after an iteration (see checkpoint.py).
+    `state` holds the loop state: phase, iteration, model, violation history, ...;
+    tokens, wall time, RNG and LLM routing state are added here.
+    """
+    if not checkpoint_file or run_record is None:
+        return
+    case = run_record["case"]
+    model = state.get("model")
+    save_checkpoint({
+        "case": case,
+        "status": status,
+        **state,
+        "model_hash": model_fingerprint(model) if model else None,
+        "tokens": token_ledger.totals.get(case, [0, 0]),
+        "elapsed": run_clock["offset"] + time.perf_counter() - run_clock["start"],
+        "rng_state": rng_state(),
+        "llm_backends": llm_router.state(),
+        "run_record": run_record
+    }, checkpoint_file)
+
+# Validate/autofix rounds per LLM output before the remaining errors go back to the LLM
+AUTOFIX_ROUNDS = 3
+
+@traced("phase1")
+def generate_valid_nusmv_model(scenarios, safety_properties, output_file="generated_model.smv", max_iterations=10,
+                               edit_mode="full", run_record=None):
     """
     PROCESS 1 - Complete: Generate syntactically valid NuSMV model through iterative refinement.
     This ensures the model is ready for formal verification in Process 2.
+    When NuSMV rejects an LLM output, the rule-based fixer (nusmv_autofix) first tries the
+    rules tied to the reported error, so the LLM is only asked to refine errors that the
+    rules cannot repair. Models NuSMV accepts are never changed by the rules.
+    Per-iteration token usage is appended to run_record["phase1"] when given.
     """
     print("\n" + "="*70)
     print("PROCESS 1: GENERATING SYNTACTICALLY VALID NUSMV MODEL")
@@ -459,21 +768,31 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
     while iteration < max_iterations:
         iteration += 1
         print(f"\n--- Iteration {iteration} ---")
+        marker = token_ledger.snapshot()
+        record_event(ITERATION_START, phase="phase1", iteration=iteration)
         
-        if iteration == 1:
-            print("Generating initial NuSMV model...")
-            model_content = generate_nusmv_model(scenarios, safety_properties)
-        else:
-            print("Refining NuSMV model based on errors...")
-            model_content = refine_nusmv_model(model_content, error_log)
+        try:
+            if model_content is None:
+                print("Generating initial NuSMV model...")
+                new_model = generate_nusmv_model(scenarios, safety_properties)
+            else:
+                print("Refining NuSMV model based on errors...")
+                new_model = refine_nusmv_model(model_content, error_log, edit_mode=edit_mode)
+        except TokenBudgetExceeded as e:
+            print(f"❌ Token budget exhausted: {e}")
+            record_iteration(run_record, "phase1", iteration, marker, errors=None, budget_exhausted=True)
+            return None
         
-        if not model_content:
+        if not new_model:
+            # The LLM client already retried; keep the last model for the next attempt
             print("❌ Failed to generate model content")
+            record_iteration(run_record, "phase1", iteration, marker, errors=None)
             continue
         
+        model_content = new_model
+        
         # Save model to file
-        with open(output_file, 'w') as f:
-            f.write(model_content)
+        write_model_file(output_file, model_content)
         
         print(f"✓ Model saved to {output_file}")
         
@@ -481,13 +800,31 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
         print("Validating syntax with NuSMV...")
         is_valid, error_message = validate_nusmv_syntax(output_file)
         
+        # NuSMV stops at the first error, so re-check after each round of rule-based fixes
+        fixes = []
+        for _ in range(AUTOFIX_ROUNDS):
+            if is_valid:
+                break
+            fixed, applied = autofix_model(model_content, error_message)
+            if fixed == model_content:
+                break
+            print(f"🔧 Applied {len(applied)} automatic fix(es):")
+            for fix in applied:
+                print(f"   - {fix}")
+            fixes.extend(applied)
+            model_content = fixed
+            write_model_file(output_file, model_content)
+            is_valid, error_message = validate_nusmv_syntax(output_file)
+        
         if is_valid:
+            record_iteration(run_record, "phase1", iteration, marker, errors=0, autofixes=len(fixes))
             print(f"\n✅ SUCCESS! Syntactically valid model generated after {iteration} iteration(s)")
             print(f"✅ Process 1 completed. Model ready for formal verification.")
             return model_content
         else:
             print(f"❌ Syntax errors detected:")
             error_log = extract_nusmv_errors(error_message, model_content)
+            record_iteration(run_record, "phase1", iteration, marker, errors=len(error_log), autofixes=len(fixes))
             for err in error_log[:3]:
                 print(f"   - {err}")
     
@@ -498,60 +835,72 @@ def generate_valid_nusmv_model(scenarios, safety_properties, output_file="genera
 # PROCESS 2: VIOLATION DETECTION & MINIMIZATION
 #############################
 
+# Output of validate_nusmv_model when NuSMV ran out of time
+VERIFICATION_TIMEOUT = "Timeout"
+
 def validate_nusmv_model(model_file):
     """
     PROCESS 2 - Step 1: Run NuSMV formal verification to detect violations.
     Returns (has_violations, violations, output)
     """
+    timeout = time_limit(60, "verification")
+    start = time.perf_counter()
     try:
-        result = subprocess.run(
-            ["NuSMV", model_file],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        with span("nusmv", check="verification") as sp:
+            trace_model_file(sp, model_file)
+            result = subprocess.run(
+                ["NuSMV", model_file],
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
         
         output = result.stdout + result.stderr
+        if result.returncode < 0:
+            output = f"{NUSMV_FAILED}: killed by signal {-result.returncode}\n" + output
+        record_verification(model_file, output, time.perf_counter() - start)
+        count_nusmv_run("verification", "ok", start)
         
         # Check for specification violations
-        has_violations = "is false" in output or "violation" in output.lower()
-        
-        violations = []
-        if has_violations:
-            violations = extract_nusmv_violations(output)
+        with span("parse"):
+            has_violations = "is false" in output or "violation" in output.lower()
+            
+            violations = []
+            if has_violations:
+                violations = extract_nusmv_violations(output)
+        if sp:
+            sp.set(specs=output.count("-- specification"), failed=output.count("is false"))
         
         return has_violations, violations, output
         
     except subprocess.TimeoutExpired:
-        return True, ["Timeout during verification"], "Timeout"
+        record_verification(model_file, "", time.perf_counter() - start, timed_out=True)
+        count_nusmv_run("verification", "timeout", start)
+        check("verification finished")
+        return True, ["Timeout during verification"], VERIFICATION_TIMEOUT
     except FileNotFoundError:
-        return True, ["NuSMV not found"], "NuSMV not installed"
+        return True, ["NuSMV not found"], NUSMV_NOT_FOUND
     except Exception as e:
-        return True, [f"Error: {str(e)}"], str(e)
+        return True, [f"Error: {str(e)}"], f"{NUSMV_FAILED}: {e}"
 
-def extract_nusmv_violations(nusmv_output):
+def is_model_verdict(output):
     """
-    Extract violation information and counterexamples from NuSMV output.
+    False for validate_nusmv_model outputs that say nothing about the model (timeouts,
+    NuSMV missing or crashed); like verifier.VerdictCache, such verdicts are never reused.
     """
-    violations = []
-    lines = nusmv_output.split('\n')
-    
-    for i, line in enumerate(lines):
-        if "is false" in line.lower() or "specification" in line.lower():
-            # Extract context around the violation
-            context_start = max(0, i - 2)
-            context_end = min(len(lines), i + 15)
-            violation_context = '\n'.join(lines[context_start:context_end])
-            violations.append(violation_context)
-    
-    return violations if violations else ["Violation detected but could not extract details"]
+    return output != VERIFICATION_TIMEOUT and not is_tool_error(output)
 
-def regenerate_model_from_violations(model_content, violations, scenarios, safety_properties):
+@traced("prompt")
+def build_regeneration_prompt(model_content, violations, scenarios, safety_properties, edit_mode="full",
+                              trace_lines=17, max_violations=3, hint=""):
     """
-    PROCESS 2 - Step 2: Regenerate NuSMV model to address detected violations.
-    Uses counterexamples to guide model refinement.
+    Build the single-turn prompt used to regenerate a model from its violations.
+    trace_lines and max_violations bound the counterexample text (see token_budget.fit_prompt).
+    `hint` is appended to the task description (used to break refinement cycles).
     """
-    violations_text = '\n\n'.join(f"Violation {i+1}:\n{v}" for i, v in enumerate(violations[:3]))  # Limit to 3 violations
+    violations_text = '\n\n'.join(
+        f"Violation {i+1}:\n{truncate_trace(v, trace_lines)}" for i, v in enumerate(violations[:max_violations])
+    )
     scenarios_text = '\n'.join(f"- {s}" for s in scenarios)
     properties_text = '\n'.join(f"- {p}" for p in safety_properties)
     
@@ -576,47 +925,505 @@ Focus on:
 1. Adjusting transition rules to prevent unsafe states
 2. Adding constraints to enforce safety properties
 3. Ensuring the model still implements the desired scenarios
+{hint}
+{return_instructions(model_content, edit_mode)}
+"""
+    return prompt
+
+def regenerate_model_from_violations(model_content, violations, scenarios, safety_properties, edit_mode="full",
+                                     temperature=0.0, hint="", cancel_event=None):
+    """
+    PROCESS 2 - Step 2: Regenerate NuSMV model to address detected violations.
+    Uses counterexamples to guide model refinement.
+    With edit_mode="patch" the LLM returns only the blocks it changes; if they cannot
+    be applied, the whole model is regenerated instead.
+    With edit_mode="cone" each failing spec's cone of influence is repaired separately
+    (see repair_cone_of_influence), falling back to block edits and then the whole model.
+    Setting `cancel_event` abandons the repair's LLM calls (RequestCancelled is raised).
+    """
+    if edit_mode == "cone":
+        new_model = repair_cone_of_influence(model_content, violations, safety_properties, temperature, hint,
+                                             cancel_event)
+        if new_model:
+            return new_model
+        print("Falling back to block edits on the whole model...")
+
+    def build(mode):
+        prompt, _, _ = fit_prompt(
+            lambda trace_lines, max_violations: build_regeneration_prompt(
+                model_content, violations, scenarios, safety_properties, mode, trace_lines, max_violations, hint),
+            MAX_PROMPT_TOKENS
+        )
+        return prompt
+
+    if edit_mode in ("patch", "cone"):
+        result = invoke_vllm(build("patch"), max_tokens=PATCH_MAX_TOKENS, label="regenerate-patch",
+                             temperature=temperature, cancel_event=cancel_event)
+        new_model = resolve_model_response(model_content, clean_nusmv_model(result)) if result else None
+        if new_model:
+            return new_model
+        print("Falling back to whole-model regeneration...")
+
+    result = invoke_vllm(build("full"), max_tokens=8000, label="regenerate", temperature=temperature,
+                         cancel_event=cancel_event)
+    return clean_nusmv_model(result) if result else None
+
+#############################
+# PROCESS 2: CONE-OF-INFLUENCE REPAIR
+#############################
 
-Return ONLY the corrected NuSMV model code without any explanations or markdown formatting.
+# Assignment dependencies followed from a failing spec's variables (1 = their direct guards)
+CONE_DEPTH = 1
+
+CONE_EDIT_INSTRUCTIONS = """
+Change only the assignments shown above. Return only the blocks you change, using this exact format:
+
+@@ REPLACE next(<variable>)
+next(<variable>) := case
+    <condition> : <value>;
+    TRUE : <variable>;
+esac;
+@@ END
+
+Allowed headers: @@ REPLACE next(<variable>), @@ REPLACE init(<variable>).
+Do not change specifications or declarations. No explanations, no markdown.
 """
+
+_FAILED_SPEC = re.compile(r"-- specification\s+(.*?)\s+is false")
+
+def cone_repair_jobs(model_content, violations):
+    """
+    Group failing specifications by cone of influence.
+
+    Returns a list of jobs, each a dict with the specs and counterexamples it covers and
+    the set of variables whose init()/next() blocks it may change. Specs whose cones
+    overlap are merged into one job, so concurrent repairs never touch the same block.
+    """
+    model = parse_nusmv_model(model_content)
+    jobs = []
+    for violation in violations:
+        match = _FAILED_SPEC.search(violation)
+        if not match:
+            continue
+        spec = match.group(1)
+        cone = cone_of_influence(model, spec_variables(model, spec), depth=CONE_DEPTH)
+        # Only existing assignments are editable: unassigned variables are environment inputs
+        editable = {name for name in cone if name in model["next"] or name in model["init"]}
+        if not editable:
+            continue
+        job = {"specs": [spec], "violations": [violation], "variables": editable}
+        for other in [j for j in jobs if j["variables"] & editable]:
+            jobs.remove(other)
+            job["specs"] = other["specs"] + job["specs"]
+            job["violations"] = other["violations"] + job["violations"]
+            job["variables"] |= other["variables"]
+        jobs.append(job)
+    return jobs
+
+@traced("prompt")
+def build_cone_prompt(model_content, job, safety_properties, hint=""):
+    """
+    Prompt for one cone-of-influence job: the failing specs, their counterexamples,
+    the relevant declarations and only the assignments in the cone.
+    """
+    model = parse_nusmv_model(model_content)
+    blocks = [model[kind][name]["text"].strip("\n") for name in sorted(job["variables"])
+              for kind in ("init", "next") if name in model[kind]]
+    referenced = set()
+    for text in blocks + job["specs"]:
+        referenced |= spec_variables(model, text)
+    declarations = '\n'.join(f"    {name} : {model['variables'][name]['type']};" for name in sorted(referenced))
+    specs_text = '\n'.join(f"- {spec}" for spec in job["specs"])
+    traces_text = '\n\n'.join(truncate_trace(v, 17) for v in job["violations"])
+    properties_text = '\n'.join(f"- {p}" for p in safety_properties)
     
-    result = invoke_vllm(prompt, max_tokens=8000)
-    return clean_nusmv_model(result) if result else None
+    return f"""
+You are an expert in NuSMV formal verification and IoT safety analysis.
+
+These specifications of a smart-home NuSMV model are violated:
+{specs_text}
+
+Counterexamples:
+{traces_text}
+
+Relevant variable declarations:
+VAR
+{declarations}
+
+Assignments that influence these specifications (the rest of the model is not shown and stays unchanged):
+{chr(10).join(blocks)}
+
+Safety Properties:
+{properties_text}
+
+Fix the violations while keeping the intended behaviour of the assignments.
+{hint}
+{CONE_EDIT_INSTRUCTIONS}
+"""
 
-def minimize_violations_with_llm(input_model, output_model, scenarios, safety_properties, max_iterations=50):
+def repair_cone_of_influence(model_content, violations, safety_properties, temperature=0.0, hint="",
+                             cancel_event=None):
     """
-    PROCESS 2 - Complete: Iteratively minimize violations until all safety properties are satisfied.
-    This is the core of the violation minimization process.
+    PROCESS 2 - Localized repair: send each failing spec's cone of influence to the LLM
+    as a separate, concurrent request and splice the returned blocks back into the model.
+    Edits outside a job's cone are ignored, so unrelated blocks cannot regress.
+    Returns the new model, or None if no usable edits came back.
+    """
+    jobs = cone_repair_jobs(model_content, violations)
+    if not jobs:
+        return None
+    print(f"Repairing {len(jobs)} cone(s) of influence concurrently "
+          f"({', '.join(str(len(job['variables'])) for job in jobs)} editable variable(s))...")
+    
+    def run(job):
+        prompt = build_cone_prompt(model_content, job, safety_properties, hint)
+        result = invoke_vllm(prompt, max_tokens=PATCH_MAX_TOKENS, label="regenerate-cone", temperature=temperature,
+                             cancel_event=cancel_event)
+        edits = parse_model_edits(clean_nusmv_model(result)) if result else []
+        allowed = [(op, kind, target, body) for op, kind, target, body in edits
+                   if op in ("REPLACE", "ADD") and kind in ("init", "next") and target in job["variables"]]
+        if len(allowed) < len(edits):
+            print(f"   Ignored {len(edits) - len(allowed)} edit(s) outside the cone of influence")
+        return allowed
+    
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        edits = [edit for job_edits in executor.map(run, jobs) for edit in job_edits]
+    if not edits:
+        return None
+    try:
+        return apply_model_edits(model_content, edits)
+    except ModelEditError as e:
+        print(f"❌ Could not apply cone edits: {e}")
+        return None
+
+#############################
+# PROCESS 2: CONVERSATION SESSIONS
+#############################
+
+def summarize_counterexample(violation, max_lines=12):
+    """
+    Reduce a NuSMV violation block to the failing specification and the start of its trace.
+    """
+    lines = [line.rstrip() for line in violation.split('\n') if line.strip()]
+    failing = [i for i, line in enumerate(lines) if "is false" in line]
+    if failing:
+        lines = lines[failing[0]:]
+    return '\n'.join(lines[:max_lines])
+
+SESSION_FULL_MODEL_FALLBACK = f"""
+Those edits could not be applied to the model. Return the complete revised NuSMV model instead.
+{FULL_MODEL_INSTRUCTIONS}
+"""
+
+class RefinementSession:
+    """
+    Multi-turn conversation used by Process 2 in session mode.
+
+    The first turn sends the full model, scenarios and safety properties. Every later
+    turn appends only the new counterexample summary and asks for a revision of the
+    model the LLM returned in its previous reply. The history is append-only, so an
+    inference server with prefix caching (e.g. vLLM) only processes the new suffix of
+    each request. When the history would exceed `context_tokens` (or `max_turns`
+    exchanges), the oldest exchanges are dropped and the oldest remaining turn is
+    restated against the model it started from, with a one-line summary of what was
+    dropped.
+
+    Sessions pay off most with edit_mode="patch": each turn then adds only a short
+    counterexample summary and the LLM's block edits to the history.
+    """
+
+    def __init__(self, scenarios, safety_properties, context_tokens=32000, max_tokens=8000, max_turns=None,
+                 edit_mode="full"):
+        self.scenarios = scenarios
+        self.safety_properties = safety_properties
+        self.context_tokens = context_tokens
+        self.max_tokens = PATCH_MAX_TOKENS if edit_mode == "patch" else max_tokens
+        self.full_max_tokens = max_tokens  # for whole-model replies when block edits cannot be applied
+        self.max_turns = max_turns
+        self.edit_mode = edit_mode
+        self.turns = []  # dicts with model_before, violations_text, violation_count, reply
+        self.dropped_counts = []  # violation counts of turns removed from the history
+        self.previous_messages = []
+        self.tokens_sent = 0
+        self.tokens_new = 0
+        self.tokens_full_equivalent = 0
+        self.calls = 0
+
+    def _task_message(self, model_content, violations_text):
+        scenarios_text = '\n'.join(f"- {s}" for s in self.scenarios)
+        properties_text = '\n'.join(f"- {p}" for p in self.safety_properties)
+        omitted = ""
+        if self.dropped_counts:
+            counts = ' -> '.join(str(c) for c in self.dropped_counts)
+            omitted = f"\n(Earlier repair turns omitted; violation counts were {counts}.)\n"
+        return f"""
+You are an expert in NuSMV formal verification and IoT safety analysis.
+We will fix the following NuSMV model over several turns.
+
+{model_content}
+
+Original Scenarios:
+{scenarios_text}
+
+Safety Properties:
+{properties_text}
+{omitted}
+Violations detected by NuSMV:
+{violations_text}
+
+Regenerate the NuSMV model to eliminate these violations while maintaining the intended scenarios.
+{return_instructions(model_content, self.edit_mode)}
+"""
+
+    def _followup_message(self, model_before, model_content, violations_text):
+        if self.edit_mode != "patch":
+            closing = FULL_MODEL_INSTRUCTIONS
+        elif numbered_specs(model_before).count("\n") != numbered_specs(model_content).count("\n"):
+            # Specifications were added or deleted, so the numbering has shifted
+            closing = f"Use the same edit format. The specifications are now numbered:\n{numbered_specs(model_content)}"
+        else:
+            closing = "Use the same edit format; specification numbers are unchanged."
+        return f"""
+NuSMV still reports these violations for the model after your previous reply:
+{violations_text}
+
+Revise that model to eliminate them. Keep every part that is not involved in these violations unchanged.
+{closing}
+"""
+
+    def _messages(self, model_content, violations_text):
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        previous_model = None
+        for i, turn in enumerate(self.turns):
+            if i == 0:
+                user_message = self._task_message(turn["model_before"], turn["violations_text"])
+            else:
+                user_message = self._followup_message(previous_model, turn["model_before"], turn["violations_text"])
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": turn["reply"]})
+            previous_model = turn["model_before"]
+
+        if self.turns:
+            user_message = self._followup_message(previous_model, model_content, violations_text)
+        else:
+            user_message = self._task_message(model_content, violations_text)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    @traced("prompt")
+    def build_messages(self, model_content, violations):
+        """
+        Build the chat history for the next repair request, truncating it to fit the context window.
+        """
+        violations_text = '\n\n'.join(
+            f"Violation {i+1}:\n{summarize_counterexample(v)}" for i, v in enumerate(violations[:3])
+        )
+
+        while self.max_turns is not None and len(self.turns) > self.max_turns:
+            self.dropped_counts.append(self.turns.pop(0)["violation_count"])
+
+        # Once the window is full, truncate down to half of it so the next few turns
+        # append to a stable prefix instead of re-truncating on every call
+        budget = self.context_tokens - self.max_tokens
+        messages = self._messages(model_content, violations_text)
+        if count_message_tokens(messages) > budget:
+            while self.turns and count_message_tokens(messages) > budget // 2:
+                self.dropped_counts.append(self.turns.pop(0)["violation_count"])
+                messages = self._messages(model_content, violations_text)
+
+        return messages, violations_text
+
+    def _record_usage(self, messages, model_content, violations):
+        # Messages shared with the previous request form a prefix the server can reuse
+        shared = 0
+        for old, new in zip(self.previous_messages, messages):
+            if old != new:
+                break
+            shared += 1
+        self.previous_messages = messages
+
+        self.calls += 1
+        self.tokens_sent += count_message_tokens(messages)
+        self.tokens_new += count_message_tokens(messages[shared:])
+        self.tokens_full_equivalent += count_message_tokens([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_regeneration_prompt(
+                model_content, violations, self.scenarios, self.safety_properties)}
+        ])
+
+    def request_repair(self, model_content, violations, temperature=0.0, hint=""):
+        """
+        Ask the LLM to repair the model for the given violations within the session.
+        `hint` is added to this request only (it is not kept in the history).
+        In patch mode, if the reply's edits cannot be applied, the LLM is asked once more
+        in the same conversation for the whole model (as regenerate_model_from_violations
+        falls back to whole-model regeneration).
+        Returns the repaired model or None.
+        """
+        messages, violations_text = self.build_messages(model_content, violations)
+        if hint:
+            messages[-1] = {"role": "user", "content": messages[-1]["content"] + "\n" + hint}
+        self._record_usage(messages, model_content, violations)
+
+        result = invoke_vllm_chat(messages, max_tokens=self.max_tokens, label=f"session-{self.edit_mode}",
+                                  temperature=temperature)
+        if not result:
+            return None
+
+        reply = clean_nusmv_model(result)
+        new_model = resolve_model_response(model_content, reply) if self.edit_mode == "patch" else reply
+        if not new_model and self.edit_mode == "patch":
+            print("Falling back to a whole-model reply within the session...")
+            messages = messages + [{"role": "assistant", "content": reply},
+                                   {"role": "user", "content": SESSION_FULL_MODEL_FALLBACK}]
+            self._record_usage(messages, model_content, violations)
+            result = invoke_vllm_chat(messages, max_tokens=self.full_max_tokens, label="session-full",
+                                      temperature=temperature)
+            reply = clean_nusmv_model(result) if result else ""
+            new_model = reply if is_valid_nusmv_code(reply) else None
+        if not new_model:
+            return None
+
+        self.turns.append({
+            "model_before": model_content,
+            "violations_text": violations_text,
+            "violation_count": len(violations),
+            "reply": reply
+        })
+        return new_model
+
+    def token_report(self):
+        """
+        Summarize prompt tokens compared with resending the full prompt every iteration.
+        `prompt_tokens_new` excludes the history prefix shared with the previous request,
+        which a prefix-caching server does not recompute.
+        """
+        saved = self.tokens_full_equivalent - self.tokens_new
+        percent = (saved / self.tokens_full_equivalent * 100) if self.tokens_full_equivalent else 0.0
+        return {
+            "calls": self.calls,
+            "prompt_tokens_sent": self.tokens_sent,
+            "prompt_tokens_new": self.tokens_new,
+            "prompt_tokens_full_resend": self.tokens_full_equivalent,
+            "prompt_tokens_saved": saved,
+            "savings_percent": round(percent, 1),
+            "truncated_turns": len(self.dropped_counts)
+        }
+
+def print_session_report(session):
+    """
+    Print prompt-token accounting for a session-mode run.
+    """
+    if not session:
+        return
+    report = session.token_report()
+    print(f"\nSession token usage over {report['calls']} call(s): {report['prompt_tokens_new']} new prompt tokens "
+          f"({report['prompt_tokens_sent']} including cached history) vs {report['prompt_tokens_full_resend']} "
+          f"with full resends ({report['savings_percent']}% saved, {report['truncated_turns']} turn(s) truncated)")
+
+def escalate_cycle_strategy(strategy):
+    """
+    Move a cycling refinement loop to the next strategy in CYCLE_STRATEGIES.
+    `strategy` is a dict with "level", "hint" and "temperature"; it is updated in place.
+    """
+    strategy["level"] += 1
+    applied = CYCLE_STRATEGIES[:strategy["level"]]
+    strategy["hint"] = CYCLE_HINT
+    if "raise-temperature" in applied:
+        strategy["temperature"] = CYCLE_TEMPERATURE
+    if "switch-backend" in applied:
+        # Rotate again on every further cycle
+        print(f"   Switching LLM backend (now preferring {llm_router.switch_backend()})")
+    print(f"   Strategy: {', '.join(applied)}")
+
+def reset_cycle_strategy(strategy):
+    """
+    Return `strategy` (see escalate_cycle_strategy) to its initial state after progress.
+    """
+    strategy.update(level=0, hint="", temperature=0.0)
+    print("   Violations improved; cycle strategy reset")
+
+def minimize_violations_steps(input_model, output_model, scenarios, safety_properties, max_iterations=50,
+                               session_mode=False, context_tokens=32000, edit_mode="full", run_record=None,
+                               checkpoint_file=None, resume=None):
+    """
+    Generator form of minimize_violations_with_llm: yields {"iteration", "violations",
+    "model"} after every iteration ("done": True once the model is safe), and returns
+    the final model. Used by the cross-case scheduler to interleave cases.
     """
     print("\n" + "="*70)
     print("PROCESS 2: MINIMIZING VIOLATIONS THROUGH ITERATIVE REFINEMENT")
     print("="*70)
     
-    # Read initial model
-    with open(input_model, 'r') as f:
-        model_content = f.read()
-    
     iteration = 0
     violation_history = []
+    fingerprints = []  # model fingerprint per iteration
+    verdict_cache = {}  # fingerprint -> (has_violations, violations)
+    strategy = {"level": 0, "hint": "", "temperature": 0.0}
+    cycles = 0
+    if resume:
+        model_content = resume["model"]
+        iteration = resume["iteration"]
+        violation_history = resume["violation_history"]
+        fingerprints = resume["fingerprints"]
+        strategy = resume["strategy"]
+        cycles = resume["cycles"]
+        print(f"↻ Resuming after iteration {iteration} (model {resume['model_hash']})")
+    else:
+        # Read initial model
+        with open(input_model, 'r') as f:
+            model_content = f.read()
+    
+    def checkpoint(status):
+        write_checkpoint(checkpoint_file, run_record, status, phase="phase2", iteration=iteration,
+                         model=model_content, violation_history=violation_history, fingerprints=fingerprints,
+                         strategy=strategy, cycles=cycles, scenarios=scenarios, safety_properties=safety_properties)
+    session = RefinementSession(scenarios, safety_properties, context_tokens=context_tokens,
+                                edit_mode="patch" if edit_mode == "cone" else edit_mode) if session_mode else None
     
     while iteration < max_iterations:
         iteration += 1
         print(f"\n--- Iteration {iteration} ---")
+        marker = token_ledger.snapshot()
+        record_event(ITERATION_START, phase="phase2", iteration=iteration)
         
         # Save current model
-        with open(output_model, 'w') as f:
-            f.write(model_content)
+        write_model_file(output_model, model_content)
+        
+        fingerprint = model_fingerprint(model_content)
+        if fingerprint in verdict_cache:
+            CACHE_LOOKUPS.inc(cache="phase2", result="hit")
+            print(f"↺ Model {fingerprint} was verified before; reusing its verdict")
+            has_violations, violations = verdict_cache[fingerprint]
+        else:
+            CACHE_LOOKUPS.inc(cache="phase2", result="miss")
+            print(f"Running NuSMV verification...")
+            has_violations, violations, output = validate_nusmv_model(output_model)
+            if is_model_verdict(output):
+                verdict_cache[fingerprint] = (has_violations, violations)
         
-        print(f"Running NuSMV verification...")
-        has_violations, violations, output = validate_nusmv_model(output_model)
+        if fingerprint in fingerprints:
+            cycles += 1
+            last_seen = max(i for i, seen in enumerate(fingerprints) if seen == fingerprint)
+            period = len(fingerprints) - last_seen
+            print(f"⟳ Cycle detected: model {fingerprint} repeats after {period} iteration(s)")
+            escalate_cycle_strategy(strategy)
+        fingerprints.append(fingerprint)
         
         if not has_violations:
+            record_iteration(run_record, "phase2", iteration, marker, violations=0, fingerprint=fingerprint)
+            checkpoint(FINISHED)
             print(f"\n✅ SUCCESS! All safety properties satisfied after {iteration} iteration(s)")
             print(f"✅ Process 2 completed. Safe TAP rules generated.")
             print(f"✅ Final model saved to: {output_model}")
+            print_session_report(session)
+            yield {"iteration": iteration, "violations": 0, "model": model_content, "done": True}
             return model_content
         
         print(f"❌ {len(violations)} violation(s) detected")
+        if strategy["level"] and violation_history and len(violations) < min(violation_history):
+            # A new best model: the cycle is broken, so later cycles escalate from the start again
+            reset_cycle_strategy(strategy)
         violation_history.append(len(violations))
         
         # Show violation trend
@@ -637,24 +1444,330 @@ def minimize_violations_with_llm(input_model, output_model, scenarios, safety_pr
         
         # Regenerate model
         print("\nRegenerating model to address violations...")
-        new_model = regenerate_model_from_violations(model_content, violations, scenarios, safety_properties)
+        try:
+            if session:
+                new_model = None
+                if edit_mode == "cone":
+                    new_model = repair_cone_of_influence(model_content, violations, safety_properties,
+                                                         strategy["temperature"], strategy["hint"])
+                if not new_model:
+                    new_model = session.request_repair(model_content, violations,
+                                                       temperature=strategy["temperature"], hint=strategy["hint"])
+            else:
+                new_model = regenerate_model_from_violations(model_content, violations, scenarios, safety_properties,
+                                                             edit_mode=edit_mode, temperature=strategy["temperature"],
+                                                             hint=strategy["hint"])
+        except TokenBudgetExceeded as e:
+            print(f"❌ Token budget exhausted: {e}")
+            record_iteration(run_record, "phase2", iteration, marker, violations=len(violations),
+                             fingerprint=fingerprint, budget_exhausted=True)
+            checkpoint(FAILED)
+            break
+        record_iteration(run_record, "phase2", iteration, marker, violations=len(violations),
+                         fingerprint=fingerprint, strategy_level=strategy["level"])
         
         if not new_model:
             print("❌ Failed to regenerate model")
+            checkpoint(FAILED)
             break
         
         model_content = new_model
         print("✓ Model regenerated")
-    
-    print(f"\n⚠ Maximum iterations ({max_iterations}) reached")
+        checkpoint(RUNNING)
+        yield {"iteration": iteration, "violations": len(violations), "model": model_content}
+    else:
+        checkpoint(FINISHED)
+        print(f"\n⚠ Maximum iterations ({max_iterations}) reached")
     print(f"Final violation count: {violation_history[-1] if violation_history else 'unknown'}")
+    if cycles:
+        print(f"Cycles detected: {cycles} ({len(set(fingerprints))} distinct models in {len(fingerprints)} iterations)")
+    print_session_report(session)
     
     # Save final model even if violations remain
-    with open(output_model, 'w') as f:
-        f.write(model_content)
+    write_model_file(output_model, model_content)
     
     return model_content
 
+def run_steps(steps):
+    """
+    Drive a step generator to completion and return its return value.
+    """
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+@traced("phase2")
+def minimize_violations_with_llm(input_model, output_model, scenarios, safety_properties, max_iterations=50,
+                                 session_mode=False, context_tokens=32000, edit_mode="full", run_record=None,
+                                 checkpoint_file=None, resume=None):
+    """
+    PROCESS 2 - Complete: Iteratively minimize violations until all safety properties are satisfied.
+    This is the core of the violation minimization process.
+
+    With session_mode=True the LLM is driven through a RefinementSession: after the
+    first iteration only the new counterexamples are sent, and the history is
+    truncated to fit context_tokens.
+
+    With edit_mode="patch" the LLM returns targeted `next()`/`LTLSPEC` edits that are
+    applied to the current model, falling back to whole-model regeneration; with
+    edit_mode="cone" each failing spec's cone of influence is repaired concurrently.
+
+    Every candidate is fingerprinted (nusmv_model.model_fingerprint): revisited models
+    reuse their cached NuSMV verdict (timeouts and NuSMV failures are not cached), and a
+    revisit (e.g. A -> B -> A) escalates the repair strategy (see escalate_cycle_strategy)
+    instead of repeating the same request. A new lowest violation count resets it.
+
+    Per-iteration violation counts and token usage are appended to run_record["phase2"]
+    when given. If the token budget runs out, the current model is saved and returned.
+
+    After every iteration the loop state is written to checkpoint_file; passing that
+    checkpoint back as `resume` continues from the iteration where it stopped (a
+    session-mode conversation restarts from the checkpointed model).
+    """
+    return run_steps(minimize_violations_steps(
+        input_model, output_model, scenarios, safety_properties, max_iterations=max_iterations,
+        session_mode=session_mode, context_tokens=context_tokens, edit_mode=edit_mode, run_record=run_record,
+        checkpoint_file=checkpoint_file, resume=resume
+    ))
+
+@traced("phase2")
+def minimize_violations_with_beam(input_model, output_model, scenarios, safety_properties, max_iterations=50,
+                                  samples=4, beam_width=2, edit_mode="full", run_record=None, checkpoint_file=None,
+                                  resume=None):
+    """
+    PROCESS 2 (beam mode): request `samples` candidate repairs per iteration, model-check
+    them concurrently and keep the `beam_width` best models (syntax validity first, then
+    fewest failed specifications).
+
+    Samples are spread over the models in the beam; the first sample of the best model
+    is greedy (temperature 0), the others use BEAM_TEMPERATURE for diversity.
+
+    The beam is checkpointed after every iteration; `resume` restarts from the
+    checkpointed models.
+    """
+    print("\n" + "="*70)
+    print(f"PROCESS 2: MINIMIZING VIOLATIONS (BEAM MODE: {samples} samples, beam width {beam_width})")
+    print("="*70)
+    
+    iteration = 0
+    if resume:
+        models = resume["beam"]
+        iteration = resume["iteration"]
+        print(f"↻ Resuming after iteration {iteration} (model {resume['model_hash']})")
+    else:
+        with open(input_model, 'r') as f:
+            models = [f.read()]
+    
+    def checkpoint(status):
+        write_checkpoint(checkpoint_file, run_record, status, phase="phase2", iteration=iteration,
+                         model=beam[0][0], beam=[model for model, _ in beam], scenarios=scenarios,
+                         safety_properties=safety_properties)
+    
+    with VerifierPool(workers=NUSMV_WORKERS, on_verdict=record_verdict) as pool:
+        beam = sorted(zip(models, pool.verify_many(models)), key=lambda item: rank_key(item[1]))
+        
+        while not is_safe(beam[0][1]) and iteration < max_iterations:
+            iteration += 1
+            marker = token_ledger.snapshot()
+            record_event(ITERATION_START, phase="phase2", iteration=iteration)
+            print(f"\n--- Iteration {iteration} ---")
+            print(f"Beam: " + ", ".join(f"{len(v['failed'])} violation(s)" if v["syntax_ok"] else "syntax errors"
+                                         for _, v in beam))
+            
+            jobs = []
+            for i in range(samples):
+                parent, verdict = beam[i % len(beam)]
+                jobs.append((parent, verdict["violations"], 0.0 if i == 0 else BEAM_TEMPERATURE))
+            
+            print(f"Requesting {samples} candidate repairs...")
+            try:
+                with ThreadPoolExecutor(max_workers=samples) as executor:
+                    candidates = list(executor.map(
+                        lambda job: regenerate_model_from_violations(job[0], job[1], scenarios, safety_properties,
+                                                                     edit_mode=edit_mode, temperature=job[2]),
+                        jobs
+                    ))
+            except TokenBudgetExceeded as e:
+                print(f"❌ Token budget exhausted: {e}")
+                record_iteration(run_record, "phase2", iteration, marker, violations=len(beam[0][1]["failed"]),
+                                 budget_exhausted=True)
+                checkpoint(FAILED)
+                break
+            
+            known = {model for model, _ in beam}
+            candidates = list(dict.fromkeys(c for c in candidates if c and c not in known))
+            print(f"Verifying {len(candidates)} new candidate(s) in parallel...")
+            verdicts = pool.verify_many(candidates)
+            
+            beam = sorted(beam + list(zip(candidates, verdicts)), key=lambda item: rank_key(item[1]))[:beam_width]
+            record_iteration(run_record, "phase2", iteration, marker, violations=len(beam[0][1]["failed"]),
+                             candidates=len(candidates))
+            print(f"✓ Best candidate: {len(beam[0][1]['failed'])} violation(s)")
+            checkpoint(RUNNING)
+        else:
+            checkpoint(FINISHED)
+    
+    best_model, best_verdict = beam[0]
+    write_model_file(output_model, best_model)
+    
+    if is_safe(best_verdict):
+        print(f"\n✅ SUCCESS! All safety properties satisfied after {iteration} iteration(s)")
+        print(f"✅ Final model saved to: {output_model}")
+    else:
+        print(f"\n⚠ Stopped after {iteration} iteration(s)")
+        print(f"Final violation count: {len(best_verdict['failed'])}")
+    return best_model
+
+def print_speculation_report(stats):
+    """
+    Print hit/miss counts, discarded repairs and stage overlap for a pipelined run.
+    """
+    sequential = stats["llm_seconds"] + stats["verify_seconds"]
+    decided = stats["hits"] + stats["misses"]
+    hit_rate = f" ({100 * stats['hits'] / decided:.0f}% hit rate)" if decided else ""
+    print(f"\nSpeculation: {stats['hits']} hit(s), {stats['misses']} miss(es){hit_rate}, {stats['skipped']} skipped; "
+          f"wall time {stats['wall_seconds']:.1f}s vs {sequential:.1f}s of LLM + NuSMV time")
+    if stats["cancelled"] or stats["wasted"]:
+        print(f"Discarded speculative repairs: {stats['cancelled']} cancelled, {stats['wasted']} finished unused "
+              f"({stats['wasted_seconds']:.1f}s of LLM time)")
+
+@traced("phase2")
+def minimize_violations_pipelined(input_model, output_model, scenarios, safety_properties, max_iterations=50,
+                                  edit_mode="full", run_record=None, checkpoint_file=None, resume=None):
+    """
+    PROCESS 2 (pipelined mode): overlap LLM generation with NuSMV verification.
+
+    Each candidate first goes through the cheap falsifier (bounded model checking,
+    FALSIFIER_OPTIONS). Its counterexamples are used to start the next repair
+    speculatively while full verification runs. If full verification fails exactly the
+    specifications the falsifier found, the speculative repair is used (hit); otherwise
+    it is discarded and a repair is requested from the full verdict (miss). A speculative
+    repair of a model that turns out to be safe counts as skipped. Discarded repairs are
+    cancelled; those that had already finished are reported as wasted.
+
+    The current model is checkpointed after every iteration; `resume` continues from it.
+    """
+    print("\n" + "="*70)
+    print("PROCESS 2: MINIMIZING VIOLATIONS (PIPELINED MODE)")
+    print("="*70)
+    
+    iteration = 0
+    if resume:
+        model_content = resume["model"]
+        iteration = resume["iteration"]
+        print(f"↻ Resuming after iteration {iteration} (model {resume['model_hash']})")
+    else:
+        with open(input_model, 'r') as f:
+            model_content = f.read()
+    
+    def checkpoint(status):
+        write_checkpoint(checkpoint_file, run_record, status, phase="phase2", iteration=iteration,
+                         model=model_content, scenarios=scenarios, safety_properties=safety_properties)
+    
+    stats = {"hits": 0, "misses": 0, "skipped": 0, "cancelled": 0, "wasted": 0, "wasted_seconds": 0.0,
+             "llm_seconds": 0.0, "verify_seconds": 0.0, "wall_seconds": 0.0}
+    start = time.perf_counter()
+    
+    def repair(model, violations, cancel_event=None):
+        # Runs on the LLM thread for speculative repairs: return the timing instead of updating stats
+        began = time.perf_counter()
+        new_model = regenerate_model_from_violations(model, violations, scenarios, safety_properties,
+                                                     edit_mode=edit_mode, cancel_event=cancel_event)
+        return new_model, time.perf_counter() - began
+    
+    discarded = []  # (future, cancel event) of speculative repairs that were not used
+    
+    def discard(speculative):
+        speculative[1].set()
+        speculative[0].cancel()
+        discarded.append(speculative)
+    
+    verdict = None
+    with VerifierPool(workers=2, on_verdict=record_verdict) as pool, ThreadPoolExecutor(max_workers=1) as llm:
+        while iteration < max_iterations:
+            iteration += 1
+            marker = token_ledger.snapshot()
+            record_event(ITERATION_START, phase="phase2", iteration=iteration)
+            print(f"\n--- Iteration {iteration} ---")
+            
+            write_model_file(output_model, model_content)
+            
+            full = pool.submit(model_content)
+            falsifier = pool.verify(model_content, FALSIFIER_OPTIONS)
+            speculative = None
+            if falsifier["syntax_ok"] and falsifier["failed"]:
+                print(f"Falsifier found {len(falsifier['failed'])} violation(s); starting speculative repair...")
+                cancel_event = threading.Event()
+                speculative = (llm.submit(repair, model_content, falsifier["violations"], cancel_event), cancel_event)
+            else:
+                stats["skipped"] += 1
+            
+            verdict = full.result()
+            stats["verify_seconds"] += falsifier["elapsed"] + verdict["elapsed"]
+            
+            if is_safe(verdict):
+                if speculative:
+                    # Nothing left to repair: neither a hit nor a miss
+                    discard(speculative)
+                    stats["skipped"] += 1
+                record_iteration(run_record, "phase2", iteration, marker, violations=0)
+                checkpoint(FINISHED)
+                print(f"\n✅ SUCCESS! All safety properties satisfied after {iteration} iteration(s)")
+                print(f"✅ Final model saved to: {output_model}")
+                break
+            
+            print(f"❌ {len(verdict['failed'])} violation(s) detected")
+            try:
+                if speculative and set(verdict["failed"]) == set(falsifier["failed"]):
+                    stats["hits"] += 1
+                    print("✓ Speculative repair matches the full verdict")
+                    new_model, seconds = speculative[0].result()
+                else:
+                    if speculative:
+                        # Full verification disagrees with the falsifier: discard the speculative repair
+                        stats["misses"] += 1
+                        discard(speculative)
+                        print("✗ Speculative repair discarded; repairing from the full verdict...")
+                    new_model, seconds = repair(model_content, verdict["violations"])
+                stats["llm_seconds"] += seconds
+            except TokenBudgetExceeded as e:
+                print(f"❌ Token budget exhausted: {e}")
+                record_iteration(run_record, "phase2", iteration, marker, violations=len(verdict["failed"]),
+                                 budget_exhausted=True)
+                checkpoint(FAILED)
+                break
+            record_iteration(run_record, "phase2", iteration, marker, violations=len(verdict["failed"]))
+            
+            if not new_model:
+                print("❌ Failed to regenerate model")
+                checkpoint(FAILED)
+                break
+            model_content = new_model
+            print("✓ Model regenerated")
+            checkpoint(RUNNING)
+        else:
+            checkpoint(FINISHED)
+    
+    # The LLM thread has finished here; count what the discarded repairs cost
+    for future, _ in discarded:
+        if future.cancelled() or isinstance(future.exception(), RequestCancelled):
+            stats["cancelled"] += 1
+        elif future.exception() is None:
+            stats["wasted"] += 1
+            stats["wasted_seconds"] += future.result()[1]
+            stats["llm_seconds"] += future.result()[1]
+    stats["wall_seconds"] = time.perf_counter() - start
+    print_speculation_report(stats)
+    if run_record is not None:
+        run_record["speculation"] = stats
+    
+    if verdict is not None and not is_safe(verdict):
+        print(f"Final violation count: {len(verdict['failed'])}")
+        write_model_file(output_model, model_content)
+    return model_content
+
 #############################
 # YAML GENERATION & SMARTTHINGS DEPLOYMENT
 #############################
@@ -712,10 +1825,260 @@ def apply_scenarios_to_smartthings(yaml_file):
     except Exception as e:
         print(f"Error applying scenarios: {str(e)}")
 
+#############################
+# SCHEDULED BATCH RUNS
+#############################
+
+def case_steps(run_record, scenarios, safety_properties, workdir, resume=None):
+    """
+    Step generator for one case: Process 1 runs as a single step (yielding the number
+    of syntax iterations it used), then Process 2 yields after every iteration.
+    Returns the final model, or None if Process 1 failed.
+    """
+    checkpoint_file = checkpoint_path(run_record["case"])
+    model_file = os.path.join(workdir, "generated_model.smv")
+    output_model = os.path.join(workdir, "final_safe_model.smv")
+    if not resume:
+        valid_model = generate_valid_nusmv_model(scenarios, safety_properties, model_file, max_iterations=10,
+                                                 edit_mode=run_record["edit_mode"], run_record=run_record)
+        if not valid_model:
+            write_checkpoint(checkpoint_file, run_record, FAILED, phase="phase1", iteration=0, model=None,
+                             scenarios=scenarios, safety_properties=safety_properties)
+            save_run_record(run_record, os.path.join(workdir, RUN_RECORD_FILE))
+            return None
+        yield {"iterations": len(run_record.get("phase1", [])), "violations": None, "model": valid_model}
+    final_model = yield from minimize_violations_steps(
+        model_file, output_model, scenarios, safety_properties, max_iterations=50,
+        session_mode=run_record["session_mode"], edit_mode=run_record["edit_mode"], run_record=run_record,
+        checkpoint_file=checkpoint_file, resume=resume
+    )
+    save_run_record(run_record, os.path.join(workdir, RUN_RECORD_FILE))
+    return final_model
+
+def run_scheduled_batch(case_names, iteration_budget=None, deadline_seconds=None, edit_mode="full",
+                        output_dir="batch-results"):
+    """
+    Refine several predefined cases with a shared iteration budget (see scheduler.py):
+    each next iteration goes to the case most likely to make progress, and nothing new
+    starts after `deadline_seconds` (calls still running then are cut off). Cases
+    already finished are skipped; interrupted cases resume from their checkpoints.
+    Outputs go to output_dir/<case>/.
+    """
+    print("\n" + "="*70)
+    print(f"SCHEDULED BATCH: {len(case_names)} case(s), iteration budget {iteration_budget or 'unlimited'}, "
+          f"deadline {f'{deadline_seconds:.0f}s' if deadline_seconds else 'none'}")
+    print("="*70)
+    
+    def on_step(case):
+        token_ledger.begin_case(case)
+        run_clock.update(start=time.perf_counter(), offset=scheduler.cases[case].elapsed)
+    
+    scheduler = IterationScheduler(iteration_budget=iteration_budget, deadline=deadline_seconds, on_step=on_step)
+    for case in case_names:
+        if is_case_finished(case):
+            print(f"✓ Skipping {case}: already finished")
+            continue
+        scenarios, safety_properties = PREDEFINED_CASES[case]
+        checkpoint = load_checkpoint(checkpoint_path(case))
+        resume = checkpoint if checkpoint and checkpoint["phase"] == "phase2" else None
+        run_record = resume["run_record"] if resume else {
+            "case": case, "edit_mode": edit_mode, "session_mode": False, "samples": 1, "pipelined": False
+        }
+        if resume:
+            token_ledger.totals[case] = list(resume["tokens"])
+        workdir = os.path.join(output_dir, case)
+        os.makedirs(workdir, exist_ok=True)
+        begin_stored_run(run_record, resume)
+        scheduler.add(case, case_steps(run_record, scenarios, safety_properties, workdir, resume))
+    
+    with deadline(deadline_seconds):
+        results = scheduler.run()
+    for case, result in results.items():
+        end_stored_run(case, result["status"])
+    print("\nCase    Status    Iterations  Violations  Time")
+    for case, result in results.items():
+        violations = "-" if result["violations"] is None else result["violations"]
+        print(f"{case:<8}{result['status']:<10}{result['iterations']:<12}{violations:<12}{result['elapsed']:.1f}s")
+    with open(os.path.join(output_dir, "schedule.json"), 'w') as f:
+        json.dump({case: {k: v for k, v in result.items() if k != "model"} for case, result in results.items()},
+                  f, indent=2)
+    return results
+
 #############################
 # MAIN WORKFLOW
 #############################
 
+def save_run_record(run_record, output_file=RUN_RECORD_FILE):
+    """
+    Write the per-iteration token record of a run, with case totals, to a JSON file.
+    """
+    case = run_record["case"]
+    prompt_tokens, completion_tokens = token_ledger.totals.get(case, [0, 0])
+    run_record["totals"] = {
+        "llm_calls": sum(1 for call in token_ledger.calls if call["case"] == case),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens
+    }
+    run_record["llm_backends"] = llm_router.report()
+    with open(output_file, 'w') as f:
+        json.dump(run_record, f, indent=2)
+    print(f"\nToken usage for case {case}: {prompt_tokens} prompt + {completion_tokens} completion tokens "
+          f"over {run_record['totals']['llm_calls']} call(s) (record saved to {output_file})")
+
+def run_refinement(run_record, scenarios, safety_properties, model_file="generated_model.smv",
+                   output_model="final_safe_model.smv", resume=None, input_model=None):
+    """
+    Run Process 1 and Process 2 for one case with the settings in run_record
+    (edit_mode, session_mode, samples, pipelined), checkpointing to
+    checkpoints/<case>.json. With `resume` (a Phase 2 checkpoint) Process 1 is skipped
+    and Process 2 continues where it stopped; with `input_model` (a model file) Process 1
+    is skipped and Process 2 starts from that model.
+
+    The case runs under CASE_DEADLINE: when it expires, in-flight LLM and NuSMV calls
+    are abandoned and the last checkpointed model is returned as a partial result
+    (the checkpoint stays resumable).
+    Returns (valid_model, final_model, status); valid_model is None if Process 1 failed.
+    status is "safe" (final_model satisfies every property), "violations" (Process 2
+    ended with violations left), "stopped" (deadline reached; final_model is partial)
+    or "failed" (Process 1 failed).
+
+    With run_store set, the case's iterations, LLM calls and NuSMV runs are recorded
+    as one run there.
+    """
+    begin_stored_run(run_record, resume)
+    status = None
+    try:
+        with deadline(CASE_DEADLINE), span("case", case=run_record["case"], edit_mode=run_record["edit_mode"],
+                                           samples=run_record["samples"]):
+            return refine_case(run_record, scenarios, safety_properties, model_file, output_model, resume,
+                               input_model)
+    except DeadlineExceeded as e:
+        status = "stopped"
+        print(f"\n⏱ Case deadline reached ({e}); returning the last completed iteration")
+        save_run_record(run_record)
+        checkpoint = load_checkpoint(checkpoint_path(run_record["case"]))
+        if not checkpoint or checkpoint["phase"] != "phase2":
+            return None, None, status
+        write_model_file(output_model, checkpoint["model"])
+        return checkpoint["model"], checkpoint["model"], status
+    finally:
+        end_stored_run(run_record["case"], status)
+
+def refine_case(run_record, scenarios, safety_properties, model_file, output_model, resume=None,
+                input_model=None):
+    """
+    Process 1 and Process 2 of run_refinement, without the deadline handling.
+    Returns (valid_model, final_model, status) like run_refinement.
+    """
+    checkpoint_file = checkpoint_path(run_record["case"])
+    edit_mode = run_record["edit_mode"]
+    samples = run_record["samples"]
+    
+    if resume:
+        valid_model = resume["model"]
+    elif input_model:
+        # Start Process 2 from an existing model (e.g. a Ground-Truth-NuSMV-* file)
+        with open(input_model, 'r') as f:
+            valid_model = f.read()
+        write_model_file(model_file, valid_model)
+        print(f"✓ Skipping Process 1: starting from {input_model}")
+    else:
+        # PROCESS 1: Generate syntactically valid NuSMV model
+        write_checkpoint(checkpoint_file, run_record, RUNNING, phase="phase1", iteration=0, model=None,
+                         scenarios=scenarios, safety_properties=safety_properties)
+        valid_model = generate_valid_nusmv_model(
+            scenarios, 
+            safety_properties, 
+            model_file,
+            max_iterations=10,
+            edit_mode=edit_mode,
+            run_record=run_record
+        )
+        
+        if not valid_model:
+            write_checkpoint(checkpoint_file, run_record, FAILED, phase="phase1", iteration=0, model=None,
+                             scenarios=scenarios, safety_properties=safety_properties)
+            save_run_record(run_record)
+            print("\n❌ Process 1 failed. Cannot proceed to Process 2.")
+            print("The system could not generate a syntactically valid NuSMV model.")
+            return None, None, "failed"
+    if not resume:
+        write_checkpoint(checkpoint_file, run_record, RUNNING, phase="phase2", iteration=0, model=valid_model,
+                         violation_history=[], fingerprints=[], strategy={"level": 0, "hint": "", "temperature": 0.0},
+                         cycles=0, beam=[valid_model], scenarios=scenarios, safety_properties=safety_properties)
+    
+    # PROCESS 2: Minimize violations through iterative refinement
+    if samples > 1:
+        final_model = minimize_violations_with_beam(
+            model_file,
+            output_model,
+            scenarios,
+            safety_properties,
+            max_iterations=50,
+            samples=samples,
+            beam_width=max(1, samples // 2),
+            edit_mode=edit_mode,
+            run_record=run_record,
+            checkpoint_file=checkpoint_file,
+            resume=resume
+        )
+    elif run_record["pipelined"]:
+        final_model = minimize_violations_pipelined(
+            model_file,
+            output_model,
+            scenarios,
+            safety_properties,
+            max_iterations=50,
+            edit_mode=edit_mode,
+            run_record=run_record,
+            checkpoint_file=checkpoint_file,
+            resume=resume
+        )
+    else:
+        final_model = minimize_violations_with_llm(
+            model_file,
+            output_model,
+            scenarios,
+            safety_properties,
+            max_iterations=50,
+            session_mode=run_record["session_mode"],
+            edit_mode=edit_mode,
+            run_record=run_record,
+            checkpoint_file=checkpoint_file,
+            resume=resume
+        )
+    save_run_record(run_record)
+    phase2 = run_record.get("phase2", [])
+    status = "safe" if phase2 and phase2[-1].get("violations") == 0 else "violations"
+    return valid_model, final_model, status
+
+def resume_case(case):
+    """
+    Continue an interrupted case from checkpoints/<case>.json: restores the token
+    ledger, wall clock, RNG and LLM routing state, then re-runs Process 1 (if it had
+    not finished) or continues Process 2.
+    """
+    checkpoint = load_checkpoint(checkpoint_path(case))
+    if not checkpoint:
+        print(f"❌ No checkpoint found for case {case}")
+        return None
+    if checkpoint["status"] == FINISHED:
+        print(f"✓ Case {case} already finished after {checkpoint['iteration']} iteration(s); nothing to resume")
+        return checkpoint["model"]
+    
+    print(f"↻ Resuming case {case}: {checkpoint['phase']}, {checkpoint['iteration']} iteration(s) done, "
+          f"{sum(checkpoint['tokens'])} tokens, {checkpoint['elapsed']:.0f}s spent")
+    token_ledger.begin_case(case)
+    token_ledger.totals[case] = list(checkpoint["tokens"])
+    run_clock.update(start=time.perf_counter(), offset=checkpoint["elapsed"])
+    restore_rng_state(checkpoint["rng_state"])
+    llm_router.restore(checkpoint["llm_backends"])
+    
+    resume = checkpoint if checkpoint["phase"] == "phase2" else None
+    _, final_model, _ = run_refinement(checkpoint["run_record"], checkpoint["scenarios"],
+                                       checkpoint["safety_properties"], resume=resume)
+    return final_model
+
 def main():
     """
     Main TAPAssure workflow integrating both processes:
@@ -746,17 +2109,22 @@ def main():
         if choice == '1':
             validated_scenarios = scenarios1
             validated_safety_properties = safety_properties1
+            case_name = "1-1"
         elif choice == '2':
             validated_scenarios = scenarios2
             validated_safety_properties = safety_properties2
+            case_name = "2-2"
         elif choice == '3':
             validated_scenarios = scenarios3
             validated_safety_properties = safety_properties3
+            case_name = "3-3"
         else:
             validated_scenarios = scenarios3
             validated_safety_properties = safety_properties4
+            case_name = "3-4"
     else:
         # Interactive mode
+        case_name = "interactive"
         print("\nFetching devices from SmartThings...")
         devices = get_smartthings_devices()
         if not devices:
@@ -776,6 +2144,16 @@ def main():
             print("❌ No valid safety properties provided. Exiting.")
             return
     
+    session_mode = input("Use conversation-session mode for Phase 2? (yes/no, default=no): ").strip().lower() == 'yes'
+    edit_mode = input("Repair with whole models, block edits, or per-spec cone-of-influence blocks? "
+                      "(full/patch/cone, default=full): ").strip().lower()
+    edit_mode = edit_mode if edit_mode in ("patch", "cone") else "full"
+    samples = input("Candidate repairs per Phase 2 iteration (default=1): ").strip()
+    samples = int(samples) if samples.isdigit() and int(samples) > 0 else 1
+    pipelined = samples == 1 and input(
+        "Overlap LLM repairs with NuSMV verification (speculative pipelining)? (yes/no, default=no): "
+    ).strip().lower() == 'yes'
+    
     # Display configuration
     print("\n" + "="*70)
     print("CONFIGURATION SUMMARY")
@@ -788,33 +2166,21 @@ def main():
     for i, p in enumerate(validated_safety_properties, 1):
         print(f"  {i}. {p}")
     
-    # PROCESS 1: Generate syntactically valid NuSMV model
-    model_file = "generated_model.smv"
-    valid_model = generate_valid_nusmv_model(
-        validated_scenarios, 
-        validated_safety_properties, 
-        model_file,
-        max_iterations=10
-    )
+    token_ledger.begin_case(case_name)
+    run_clock.update(start=time.perf_counter(), offset=0.0)
+    run_record = {"case": case_name, "edit_mode": edit_mode, "session_mode": session_mode, "samples": samples,
+                  "pipelined": pipelined}
     
+    model_file = "generated_model.smv"
+    output_model = "final_safe_model.smv"
+    valid_model, final_model, status = run_refinement(run_record, validated_scenarios, validated_safety_properties,
+                                                      model_file, output_model)
     if not valid_model:
-        print("\n❌ Process 1 failed. Cannot proceed to Process 2.")
-        print("The system could not generate a syntactically valid NuSMV model.")
         return
     
-    # PROCESS 2: Minimize violations through iterative refinement
-    output_model = "final_safe_model.smv"
-    final_model = minimize_violations_with_llm(
-        model_file,
-        output_model,
-        validated_scenarios,
-        validated_safety_properties,
-        max_iterations=50
-    )
-    
     # Final summary
     print("\n" + "="*70)
-    if final_model:
+    if status == "safe":
         print("✅ TAPASSURE COMPLETED SUCCESSFULLY")
         print("="*70)
         print(f"\n✓ Syntactically valid model: {model_file}")
@@ -829,6 +2195,13 @@ def main():
         if deploy == 'yes':
             yaml_file = scenarios_to_yaml(validated_scenarios)
             apply_scenarios_to_smartthings(yaml_file)
+    elif status == "stopped":
+        print("⏱ TAPASSURE STOPPED AT THE CASE DEADLINE")
+        print("="*70)
+        print(f"\n✓ Syntactically valid model generated: {model_file}")
+        print(f"⚠ Process 2 was stopped before all safety properties were satisfied")
+        print(f"\nThe last completed iteration's model is saved to: {output_model}")
+        print(f"Continue the case with: python main.py resume {case_name}")
     else:
         print("⚠ TAPASSURE COMPLETED WITH WARNINGS")
         print("="*70)
@@ -842,7 +2215,15 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        if len(sys.argv) == 3 and sys.argv[1] == "resume":
+            resume_case(sys.argv[2])
+        elif len(sys.argv) >= 2 and sys.argv[1] == "schedule":
+            # python main.py schedule [iteration budget] [deadline in minutes]
+            budget = int(sys.argv[2]) if len(sys.argv) > 2 else None
+            deadline_seconds = float(sys.argv[3]) * 60 if len(sys.argv) > 3 else None
+            run_scheduled_batch(list(PREDEFINED_CASES), iteration_budget=budget, deadline_seconds=deadline_seconds)
+        else:
+            main()
     except KeyboardInterrupt:
         print("\n\n⚠ Process interrupted by user.")
     except Exception as e:
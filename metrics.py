@@ -0,0 +1,324 @@
+"""
+Live counters, gauges and histograms for long batch runs, in Prometheus text format.
+
+A manifest run can take a day, and the summary tables only fill in as jobs end.
+This module counts what the pipeline is doing while it does it (LLM calls in
+flight, tokens, NuSMV runs, verdict cache hits, jobs running and queued,
+iterations per case) so throughput can be watched and a stalled backend spotted
+within seconds.
+
+Batch jobs run in pool processes, so each worker writes a snapshot of its
+counts to <output_dir>/.metrics/worker-<pid>.json every METRICS_INTERVAL
+seconds (start_worker), and the batch runner's MetricsExporter sums the
+snapshots with its own counts and serves them on http://127.0.0.1:<port>/metrics
+and/or rewrites a node_exporter textfile. Counters are totals; Prometheus
+derives tokens/s and NuSMV runs/s with rate().
+
+No client library is needed: the exposition format is written directly.
+
+Usage: set metrics_port and/or metrics_file in a batch manifest (see batch_runner.py)
+"""
+
+import glob
+import json
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_INTERVAL = 1.0
+SNAPSHOT_DIR = ".metrics"
+
+COUNTER, GAUGE, HISTOGRAM = "counter", "gauge", "histogram"
+
+
+class Metric:
+    """
+    One metric family; values are kept per label-value tuple. Histograms store
+    per-bucket (non-cumulative) counts followed by the sum and the count.
+    """
+
+    def __init__(self, kind, name, help_text, labels=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0, 0])
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            values = [[list(key), list(value) if isinstance(value, list) else value]
+                      for key, value in self.values.items()]
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels),
+                "buckets": list(self.buckets) if self.buckets else None, "values": values}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Metric(COUNTER, name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Metric(GAUGE, name, help_text, labels))
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self._add(Metric(HISTOGRAM, name, help_text, labels, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+
+# Pipeline metrics (counted in whichever process runs the case)
+LLM_IN_FLIGHT = REGISTRY.gauge("tapassure_llm_calls_in_flight", "LLM requests currently waiting for a response")
+LLM_CALLS = REGISTRY.counter("tapassure_llm_calls_total", "Finished LLM requests", ("backend", "outcome"))
+LLM_TOKENS = REGISTRY.counter("tapassure_llm_tokens_total", "Tokens of finished LLM requests", ("kind",))
+LLM_SECONDS = REGISTRY.histogram("tapassure_llm_call_seconds", "LLM request wall time",
+                                 (1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
+NUSMV_RUNS = REGISTRY.counter("tapassure_nusmv_runs_total", "NuSMV runs", ("check", "outcome"))
+NUSMV_SECONDS = REGISTRY.histogram("tapassure_nusmv_run_seconds", "NuSMV run wall time",
+                                   (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60), ("check",))
+CACHE_LOOKUPS = REGISTRY.counter("tapassure_verdict_cache_lookups_total",
+                                 "Verdict lookups: per-case model fingerprints (phase2) and VerdictCache (persistent)",
+                                 ("cache", "result"))
+JOBS_RUNNING = REGISTRY.gauge("tapassure_jobs_running", "Batch jobs currently running")
+
+# Batch runner metrics (counted in the parent process)
+JOBS_TOTAL = REGISTRY.gauge("tapassure_jobs_total", "Jobs in the manifest")
+JOBS_QUEUED = REGISTRY.gauge("tapassure_jobs_queued", "Jobs waiting for a worker (queue depth)")
+JOBS_COMPLETED = REGISTRY.counter("tapassure_jobs_completed_total", "Finished jobs by final status", ("status",))
+CASE_ITERATIONS = REGISTRY.histogram("tapassure_case_iterations", "Refinement iterations per finished job",
+                                     (0, 1, 2, 3, 5, 8, 13, 20, 30, 50, 80), ("phase",))
+JOB_SECONDS = REGISTRY.histogram("tapassure_job_seconds", "Job wall time (elapsed time of its case)",
+                                 (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+
+
+def merge(snapshots):
+    """
+    Sum metric snapshots from several processes into one snapshot.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for key, value in metric["values"]:
+                key = tuple(key)
+                if isinstance(value, list):
+                    current = target["values"].get(key, [0] * len(value))
+                    target["values"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["values"][key] = target["values"].get(key, 0) + value
+    return merged
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(merged):
+    """
+    Prometheus text exposition (version 0.0.4) of a merged snapshot.
+    """
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] != HISTOGRAM:
+                lines.append(f"{name}{_label_text(metric['labels'], key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-2]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(bound)}"'
+                lines.append(f"{name}_bucket{_label_text(metric['labels'], key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(metric['labels'], key)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_label_text(metric['labels'], key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "w") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+#############################
+# Worker processes
+#############################
+
+_worker_file = None
+
+
+def flush():
+    """Write this worker's snapshot now (no-op outside a batch worker)."""
+    if _worker_file:
+        _write_atomic(_worker_file, json.dumps(REGISTRY.snapshot()))
+
+
+def _flush_loop(stop):
+    while not stop.wait(METRICS_INTERVAL):
+        try:
+            flush()
+        except OSError as e:
+            print(f"Warning: could not write metrics snapshot: {e}")
+
+
+def start_worker(directory):
+    """
+    Pool initializer: snapshot this process's metrics into `directory` every METRICS_INTERVAL seconds.
+    """
+    global _worker_file
+    # Forked workers inherit the parent's counts; only count this process's own work
+    for metric in REGISTRY.metrics.values():
+        with metric.lock:
+            metric.values.clear()
+    os.makedirs(directory, exist_ok=True)
+    _worker_file = os.path.join(directory, f"worker-{os.getpid()}.json")
+    threading.Thread(target=_flush_loop, args=(threading.Event(),), daemon=True, name="metrics-flush").start()
+
+
+def read_snapshots(directory):
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "worker-*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # replaced mid-read; the next scrape sees it
+    return snapshots
+
+
+def collect(directory):
+    """
+    Merged snapshot of this process and every worker in `directory`. The queue depth
+    is derived here: jobs not yet completed and not running in any worker.
+    """
+    merged = merge([REGISTRY.snapshot()] + read_snapshots(directory))
+    total = sum(merged.get(JOBS_TOTAL.name, {}).get("values", {}).values())
+    if total:
+        completed = sum(merged.get(JOBS_COMPLETED.name, {}).get("values", {}).values())
+        running = sum(merged.get(JOBS_RUNNING.name, {}).get("values", {}).values())
+        merged[JOBS_QUEUED.name]["values"] = {(): max(0, total - completed - running)}
+    return merged
+
+
+#############################
+# Exposition (batch runner process)
+#############################
+
+class MetricsExporter:
+    """
+    Serve the batch's metrics on http://127.0.0.1:<port>/metrics and/or rewrite
+    `textfile` (for node_exporter's textfile collector) every METRICS_INTERVAL seconds.
+    Use as a context manager; the textfile gets a final write on exit.
+    """
+
+    def __init__(self, directory, port=None, textfile=None):
+        self.directory = directory
+        self.textfile = textfile
+        self.server = None
+        self.stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        for stale in glob.glob(os.path.join(directory, "worker-*.json")):
+            os.remove(stale)
+
+        if port:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = exporter.text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+            except OSError as e:
+                print(f"Warning: could not serve metrics on port {port}: {e}")
+            else:
+                threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http").start()
+                print(f"✓ Metrics on http://127.0.0.1:{self.server.server_port}/metrics")
+        if textfile:
+            if os.path.dirname(textfile):
+                os.makedirs(os.path.dirname(textfile), exist_ok=True)
+            threading.Thread(target=self._textfile_loop, daemon=True, name="metrics-textfile").start()
+            print(f"✓ Metrics written to {textfile} every {METRICS_INTERVAL:g}s")
+
+    def text(self):
+        return render(collect(self.directory))
+
+    def write_textfile(self):
+        try:
+            _write_atomic(self.textfile, self.text())
+        except OSError as e:
+            print(f"Warning: could not write metrics to {self.textfile}: {e}")
+
+    def _textfile_loop(self):
+        while not self.stop.wait(METRICS_INTERVAL):
+            self.write_textfile()
+
+    def close(self):
+        self.stop.set()
+        if self.textfile:
+            self.write_textfile()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -0,0 +1,248 @@
+"""
+Deterministic repairs for recurring mechanical errors in LLM-generated NuSMV models.
+
+Phase 1 spends most of its LLM round-trips on the same handful of mistakes:
+explanatory prose left in the model, a second `MODULE main`, counters like
+`time + 1` running past their range, enum literals that were never declared,
+and `next(x)` used inside LTLSPEC. Each rule below fixes one of them on the
+parsed model and is tied to the NuSMV error that mistake produces: autofix_model
+only runs the rules whose error NuSMV reported, so a model NuSMV accepts is
+never changed, and only what remains is sent to the LLM.
+"""
+
+import re
+
+from nusmv_model import SECTION_KEYWORDS, ModelEditError, apply_model_edits, identifiers, parse_nusmv_model
+
+NUSMV_KEYWORDS = set(SECTION_KEYWORDS) | {
+    "case", "esac", "next", "init", "TRUE", "FALSE", "boolean", "mod", "union", "in", "self",
+    "X", "G", "F", "U", "V", "Y", "Z", "H", "O", "S", "T", "A", "E", "AG", "AF", "AX", "AU", "EG", "EF", "EX", "EU"
+}
+
+_MODULE_MAIN = re.compile(r"^[ \t]*MODULE[ \t]+main\b", re.M)
+_MARKDOWN_START = re.compile(r"^(```|\*\*|#|\* |- (?!-)|\d+\.\s|>)")
+_SENTENCE = re.compile(r"^[A-Za-z][a-z']*(\s+[A-Za-z][\w',]*){2,}[.:!?]?$")
+_RANGE_TYPE = re.compile(r"^(-?\d+)\s*\.\.\s*(-?\d+)$")
+_ENUM_TYPE = re.compile(r"^\{(.*)\}$")
+
+
+def _is_prose(line):
+    """
+    True for lines that cannot be NuSMV: markdown or plain sentences without NuSMV punctuation.
+    """
+    stripped = line.strip()
+    if not stripped or stripped.startswith("--"):
+        return False
+    if stripped.split()[0] in SECTION_KEYWORDS or ";" in stripped or ":=" in stripped:
+        return False
+    if _MARKDOWN_START.match(stripped):
+        return True
+    return bool(_SENTENCE.match(stripped)) and not re.search(r"[&|!<>=()]|\b(case|esac)\b", stripped)
+
+
+def strip_prose(model_text):
+    """
+    Remove text before the first `MODULE` (except `--` comments) and prose/markdown lines inside the model.
+    """
+    match = re.search(r"^[ \t]*MODULE\b", model_text, re.M)
+    if not match:
+        return model_text, []
+    notes = []
+    # MODULE starts a line, so the text before it ends with a newline (or is empty)
+    kept = model_text[:match.start()].split("\n")[:-1]
+    if any(line.strip() and not line.strip().startswith("--") for line in kept):
+        # Comments before MODULE are kept, anything else is dropped
+        kept = [line for line in kept if line.strip().startswith("--")]
+        notes.append("removed text before MODULE")
+    removed = 0
+    for line in model_text[match.start():].split("\n"):
+        if _is_prose(line):
+            removed += 1
+        else:
+            kept.append(line)
+    if removed:
+        notes.append(f"removed {removed} prose line(s)")
+    if not notes:
+        return model_text, []
+    return "\n".join(kept).strip("\n") + "\n", notes
+
+
+def drop_duplicate_main(model_text):
+    """
+    Keep a single `MODULE main`: the most complete one (most assignments and specs), the last on ties.
+    """
+    starts = [m.start() for m in _MODULE_MAIN.finditer(model_text)]
+    if len(starts) < 2:
+        return model_text, []
+    modules = [model_text[start:end] for start, end in zip(starts, starts[1:] + [len(model_text)])]
+
+    def size(module):
+        model = parse_nusmv_model(module)
+        return len(model["init"]) + len(model["next"]) + len(model["specs"])
+
+    best = max(range(len(modules)), key=lambda i: (size(modules[i]), i))
+    return model_text[:starts[0]] + modules[best], [f"kept 1 of {len(modules)} MODULE main definitions"]
+
+
+def wrap_range_overflow(model_text):
+    """
+    Rewrite `x + n` in next(x) for a range-typed x (e.g. `time : 0..24`) so it wraps
+    around instead of leaving the range. Blocks that already compare x with a
+    number in a guard (`x < 24 : x + 1;`, `x = 24 : 0;`) are left alone.
+    """
+    model = parse_nusmv_model(model_text)
+    edits = []
+    for name, block in model["next"].items():
+        bounds = _RANGE_TYPE.match(model["variables"].get(name, {}).get("type", ""))
+        if not bounds:
+            continue
+        if re.search(r"(?<![\w.])" + re.escape(name) + r"\s*(<=|>=|!=|<|>|=)\s*-?\d", block["text"]):
+            continue
+        low, high = int(bounds.group(1)), int(bounds.group(2))
+        increment = re.compile(r"(?<![\w(])" + re.escape(name) + r"\s*\+\s*(\d+)(?!\s*\)\s*mod)")
+        if low == 0:
+            wrapped = increment.sub(lambda m: f"({name} + {m.group(1)}) mod {high + 1}", block["text"])
+        else:
+            wrapped = increment.sub(lambda m: f"(({name} - {low} + {m.group(1)}) mod {high - low + 1}) + {low}",
+                                    block["text"])
+        if wrapped != block["text"]:
+            edits.append(("REPLACE", "next", name, wrapped))
+    if not edits:
+        return model_text, []
+    return apply_model_edits(model_text, edits), [f"wrapped next({e[2]}) within its range" for e in edits]
+
+
+def declare_enum_literals(model_text):
+    """
+    Add literals that are assigned to, or compared with, an enum variable but missing from its type.
+    Names declared as variables, DEFINE symbols or CONSTANTS are not literals and are left alone.
+    """
+    model = parse_nusmv_model(model_text)
+    declared = set(model["variables"]) | set(model["defines"]) | set(model["constants"])
+    notes = []
+    replacements = []
+    for name, variable in model["variables"].items():
+        enum = _ENUM_TYPE.match(variable["type"])
+        if not enum:
+            continue
+        literals = [literal.strip() for literal in enum.group(1).split(",") if literal.strip()]
+        used = set(re.findall(r"(?<![\w.])" + re.escape(name) + r"\s*!?=\s*([A-Za-z_]\w*)", model_text))
+        for kind in ("init", "next"):
+            block = model[kind].get(name)
+            if block:
+                used |= set(re.findall(r"(?::=|:)\s*([A-Za-z_]\w*)\s*;", block["text"]))
+                for values in re.findall(r"\{([^}]*)\}", block["text"]):
+                    used |= {v.strip() for v in values.split(",")}
+        missing = sorted(v for v in used if v and v not in literals and v not in declared and v not in NUSMV_KEYWORDS)
+        if missing:
+            start, end = variable["span"]
+            line = model_text[start:end]
+            new_type = "{" + ", ".join(literals + missing) + "}"
+            replacements.append((start, end, line.replace(line[line.index("{"):line.rindex("}") + 1], new_type, 1)))
+            notes.append(f"declared {', '.join(missing)} for {name}")
+    for start, end, line in sorted(replacements, reverse=True):
+        model_text = model_text[:start] + line + model_text[end:]
+    return model_text, notes
+
+
+def _replace_next_calls(spec):
+    """
+    Replace each balanced `next(expr)` in an LTL formula with `X (expr)`.
+    """
+    result = []
+    position = 0
+    for match in re.finditer(r"\bnext\s*\(", spec):
+        if match.start() < position:
+            continue
+        depth = 0
+        for i in range(match.end() - 1, len(spec)):
+            depth += {"(": 1, ")": -1}.get(spec[i], 0)
+            if depth == 0:
+                break
+        else:
+            return spec
+        result.append(spec[position:match.start()] + "X (" + _replace_next_calls(spec[match.end():i]) + ")")
+        position = i + 1
+    result.append(spec[position:])
+    return "".join(result)
+
+
+def fix_next_in_ltlspec(model_text):
+    """
+    `next(x)` is only valid in ASSIGN/TRANS; inside LTLSPEC it must be written `X (x)`.
+    """
+    model = parse_nusmv_model(model_text)
+    notes = []
+    for spec in reversed(model["specs"]):
+        if spec["kind"] != "LTLSPEC" or "next" not in identifiers(spec["text"]):
+            continue
+        start, end = spec["span"]
+        model_text = model_text[:start] + _replace_next_calls(model_text[start:end]) + model_text[end:]
+        notes.append("replaced next() with X () in an LTLSPEC")
+    return model_text, notes
+
+
+def terminate_esac(model_text):
+    """
+    `esac` ending an assignment must be followed by `;`.
+    """
+    fixed, count = re.subn(r"^([ \t]*esac)[ \t]*$(?!\n[ \t]*[)&|])", r"\1;", model_text, flags=re.M)
+    return fixed, [f"terminated {count} esac"] if count else []
+
+
+def trans_to_assign(model_text):
+    """
+    A TRANS section holding `init()/next() :=` assignments is really an ASSIGN section.
+    """
+    model = parse_nusmv_model(model_text)
+    notes = []
+    for keyword, start, end in reversed(model["sections"]):
+        if keyword == "TRANS" and ":=" in model_text[start:end]:
+            model_text = model_text[:start] + model_text[start:end].replace("TRANS", "ASSIGN", 1) + model_text[end:]
+            notes.append("renamed TRANS with assignments to ASSIGN")
+    return model_text, notes
+
+
+SYNTAX_ERROR = re.compile(r"syntax error", re.I)
+REDEFINED = re.compile(r"syntax error|redefin|already defined|defined more than once", re.I)
+OUT_OF_RANGE = re.compile(r"cannot assign value|out of range", re.I)
+UNDEFINED = re.compile(r"\bundefined\b", re.I)
+NEXT_NOT_ALLOWED = re.compile(r"\bnext\b.*\b(allowed|unexpected|illegal)\b|\b(allowed|unexpected|illegal)\b.*\bnext\b",
+                              re.I)
+
+# Catalogue of deterministic repairs, applied in order: (name, rule, NuSMV error that triggers it)
+AUTOFIX_RULES = [
+    ("strip-prose", strip_prose, SYNTAX_ERROR),
+    ("duplicate-main", drop_duplicate_main, REDEFINED),
+    ("trans-to-assign", trans_to_assign, SYNTAX_ERROR),
+    ("esac-terminator", terminate_esac, SYNTAX_ERROR),
+    ("range-overflow", wrap_range_overflow, OUT_OF_RANGE),
+    ("enum-literals", declare_enum_literals, UNDEFINED),
+    ("next-in-ltlspec", fix_next_in_ltlspec, NEXT_NOT_ALLOWED),
+]
+
+
+def autofix_model(model_text, nusmv_output, max_passes=3):
+    """
+    Apply the AUTOFIX_RULES whose error appears in `nusmv_output` (NuSMV's output for
+    model_text) until the model stops changing (at most max_passes rounds).
+    Returns (fixed_model, applied) where applied lists "rule: description" strings.
+    A rule that fails on a malformed model is skipped.
+    """
+    applied = []
+    rules = [(name, rule) for name, rule, error in AUTOFIX_RULES if error.search(nusmv_output or "")]
+    for _ in range(max_passes):
+        changed = False
+        for name, rule in rules:
+            try:
+                fixed, notes = rule(model_text)
+            except (ModelEditError, ValueError, IndexError) as e:
+                print(f"⚠ Autofix rule {name} skipped: {e}")
+                continue
+            if fixed != model_text:
+                model_text = fixed
+                applied.extend(f"{name}: {note}" for note in notes)
+                changed = True
+        if not changed:
+            break
+    return model_text, applied
@@ -0,0 +1,305 @@
+"""
+NuSMV micro-benchmark: verification cost per model and engine configuration.
+
+How verification time scales with the models the LLMs write (number of
+variables, range widths, specification count, LTL vs invariant specs) and which
+NuSMV settings pay off was never measured. This benchmark runs every unique
+corpus model (identical copies are measured once) under each configuration in
+ENGINES, through a NuSMV command script ending in print_usage:
+
+    bdd            BDD-based LTL/CTL/invariant checking (NuSMV's default)
+    bdd-coi        the same with cone-of-influence reduction
+    bdd-invar      LTLSPEC G (p) with propositional p promoted to INVARSPEC p
+                   (nusmv_model.promote_invariants), checked by reachability
+    bdd-coi-invar  both
+    bmc            bounded model checking up to BMC_LENGTH (incomplete: "no
+                   counterexample" is not a proof)
+
+and records per run: wall time, NuSMV CPU time and peak RSS (from the process's
+own rusage), BDD nodes allocated and peak live nodes (print_usage), and the
+number of true / false / undecided properties. A configuration "agrees" with bdd
+on a model when it finds the same number of false properties.
+
+It then prints
+- per configuration: geometric-mean and median speedup over bdd, share of models
+  it made faster, median peak-RSS ratio, timeouts and agreement with bdd;
+- per configuration and cost (wall time, peak RSS, BDD nodes): a least-squares
+  fit of log(1 + cost) on the standardized model features (REGRESSORS), so
+  coefficients are the change in log cost per standard deviation of a feature.
+
+Runs are sequential by default so they do not compete for CPU and memory.
+
+Usage: python nusmv_benchmark.py <output.csv> [corpus.sqlite | directory or .smv file ...]
+       (default: every Ground-Truth-NuSMV* directory and NuSMV/)
+"""
+
+import glob
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from corpus_analyzer import write_table
+from nusmv_model import model_fingerprint, parse_nusmv_model, promote_invariants
+from verifier import NUSMV_BINARY, NUSMV_FAILED, NUSMV_NOT_FOUND, is_tool_error
+from workspace import Workspace
+
+DEFAULT_SOURCES = ["Ground-Truth-NuSMV*", "NuSMV"]
+TIMEOUT = 120
+BMC_LENGTH = 10
+BASELINE_ENGINE = "bdd"
+
+_BDD_CHECKS = ["check_ltlspec", "check_ctlspec", "check_invar"]
+# Configuration -> (commands run between reading the model and print_usage, promote invariants)
+ENGINES = {
+    "bdd": (["go"] + _BDD_CHECKS, False),
+    "bdd-coi": (["set cone_of_influence", "go"] + _BDD_CHECKS, False),
+    "bdd-invar": (["go"] + _BDD_CHECKS, True),
+    "bdd-coi-invar": (["set cone_of_influence", "go"] + _BDD_CHECKS, True),
+    "bmc": (["go_bmc", f"check_ltlspec_bmc -k {BMC_LENGTH}", f"check_invar_bmc -k {BMC_LENGTH}"], False),
+}
+
+FEATURES = ["variables", "boolean_vars", "enum_vars", "range_vars", "state_bits", "max_range_width", "assignments",
+            "specs", "ltl_specs", "invariant_shaped_specs", "ctl_specs", "invar_specs", "lines"]
+# Totals (variables, specs) and lines are left out of the fits: they are sums of / proxies for these
+REGRESSORS = ["boolean_vars", "enum_vars", "range_vars", "state_bits", "max_range_width", "assignments", "ltl_specs",
+              "invariant_shaped_specs", "ctl_specs", "invar_specs"]
+COSTS = ["wall", "peak_rss_kb", "bdd_nodes"]
+
+_PROPERTY_RESULT = re.compile(r"^-- (?:specification|invariant)\s+.*?\s+is\s+(true|false)\s*$", re.M)
+_NO_COUNTEREXAMPLE = re.compile(r"^-- no counterexample found with bound", re.M)
+_BDD_NODES = re.compile(r"BDD nodes allocated:\s*(\d+)")
+_PEAK_NODES = re.compile(r"Peak number of live nodes:\s*(\d+)")
+_RANGE = re.compile(r"^(-?\d+)\s*\.\.\s*(-?\d+)$")
+_SYNTAX_ERROR = re.compile(r"syntax error|^file .*: line \d+:", re.M | re.I)
+
+
+def model_features(model_text):
+    """
+    Size features of a model: variable counts by type, state bits (sum of log2 of the
+    domain sizes), widest integer range, assignments, specification counts by kind
+    (invariant_shaped_specs: LTL specs promote_invariants can rewrite) and line count.
+    """
+    model = parse_nusmv_model(model_text)
+    features = dict.fromkeys(FEATURES, 0)
+    for variable in model["variables"].values():
+        var_type = variable["type"]
+        if var_type == "boolean":
+            features["boolean_vars"] += 1
+            size = 2
+        elif var_type.startswith("{"):
+            features["enum_vars"] += 1
+            size = max(1, len([value for value in var_type.strip("{}").split(",") if value.strip()]))
+        elif _RANGE.match(var_type):
+            low, high = map(int, _RANGE.match(var_type).groups())
+            size = max(1, high - low + 1)
+            features["range_vars"] += 1
+            features["max_range_width"] = max(features["max_range_width"], size)
+        else:
+            size = 2
+        features["variables"] += 1
+        features["state_bits"] += math.log2(size) if size > 1 else 0
+    features["assignments"] = len(model["init"]) + len(model["next"])
+    kinds = [spec["kind"] for spec in model["specs"]]
+    features["specs"] = len(kinds)
+    features["ltl_specs"] = kinds.count("LTLSPEC")
+    features["ctl_specs"] = kinds.count("CTLSPEC") + kinds.count("SPEC")
+    features["invar_specs"] = kinds.count("INVARSPEC")
+    features["invariant_shaped_specs"] = promote_invariants(model_text)[1]
+    features["lines"] = len([line for line in model_text.split("\n") if line.strip()])
+    return features
+
+
+def find_unique_models(sources):
+    """
+    {fingerprint: (path or hash, text)} for the models of a corpus store (.sqlite, see
+    corpus_store.py) or of .smv files and directories; copies are listed once.
+    """
+    models = {}
+    for source in sources:
+        if source.endswith(".sqlite"):
+            from corpus_store import CorpusStore
+            store = CorpusStore(source)
+            for digest, text in store.unique_models():
+                models.setdefault(model_fingerprint(text), (digest[:16], text))
+            store.close()
+            continue
+        paths = [source] if os.path.isfile(source) else \
+            sorted(glob.glob(os.path.join(source, "**", "*.smv"), recursive=True))
+        for path in paths:
+            with open(path, 'r', encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            models.setdefault(model_fingerprint(text), (path, text))
+    return models
+
+
+def run_engine(model_file, commands, workspace, timeout=TIMEOUT):
+    """
+    Run a NuSMV command script on a model file; returns (output, wall, cpu, peak_rss_kb, timed_out).
+    CPU time and peak RSS come from the rusage of this NuSMV process alone (os.wait4).
+    If NuSMV cannot be started or dies from a signal other than the timeout, the output
+    starts with NUSMV_NOT_FOUND or NUSMV_FAILED (see verifier.is_tool_error).
+    """
+    script = [f"read_model -i {model_file}"] + commands + ["print_usage", "quit"]
+    script_file = workspace.file(os.path.basename(model_file) + f".{threading.get_ident()}.cmd")
+    with open(script_file, 'w') as f:
+        f.write("set on_failure_script_quits\n" + "\n".join(script) + "\n")
+    killed = threading.Event()
+    with tempfile.TemporaryFile(dir=workspace.path) as output:
+        start = time.perf_counter()
+        try:
+            process = subprocess.Popen([NUSMV_BINARY, "-source", script_file], stdin=subprocess.DEVNULL,
+                                       stdout=output, stderr=subprocess.STDOUT)
+        except FileNotFoundError:
+            return NUSMV_NOT_FOUND, 0.0, 0.0, 0, False
+        except OSError as e:
+            return f"{NUSMV_FAILED}: {e}", 0.0, 0.0, 0, False
+        timer = threading.Timer(timeout, lambda: (killed.set(), process.kill()))
+        timer.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        timer.cancel()
+        output.seek(0)
+        text = output.read().decode("utf-8", errors="replace")
+    os.remove(script_file)
+    if process.returncode < 0 and not killed.is_set():
+        text = f"{NUSMV_FAILED}: killed by signal {-process.returncode}\n" + text
+    return text, wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss, killed.is_set()
+
+
+def measure(name, model_text, engine, workspace, timeout=TIMEOUT):
+    """
+    One table row: model features and the cost and outcome of verifying it with `engine`.
+    """
+    commands, promote = ENGINES[engine]
+    text = promote_invariants(model_text)[0] if promote else model_text
+    model_file = workspace.model_file(text, engine)
+    try:
+        output, wall, cpu, rss, timed_out = run_engine(model_file, commands, workspace, timeout)
+    finally:
+        os.remove(model_file)
+    results = _PROPERTY_RESULT.findall(output)
+    nodes = _BDD_NODES.search(output)
+    peak_nodes = _PEAK_NODES.search(output)
+    return {
+        "model": name,
+        "engine": engine,
+        "wall": wall,
+        "cpu": cpu,
+        "peak_rss_kb": rss,
+        "bdd_nodes": int(nodes.group(1)) if nodes else None,
+        "peak_live_nodes": int(peak_nodes.group(1)) if peak_nodes else None,
+        "true": results.count("true"),
+        "false": results.count("false"),
+        "undecided": len(_NO_COUNTEREXAMPLE.findall(output)),
+        "error": bool(_SYNTAX_ERROR.search(output)),
+        "tool_error": is_tool_error(output),
+        "timed_out": timed_out,
+        **model_features(model_text)
+    }
+
+
+def run_benchmark(sources, engines=None, workers=1, timeout=TIMEOUT):
+    """
+    Measure every unique model of the sources under every engine; returns the table as a DataFrame.
+    """
+    models = find_unique_models(sources)
+    engines = engines or list(ENGINES)
+    jobs = [(name, text, engine) for name, text in models.values() for engine in engines]
+    print(f"Running {len(models)} unique model(s) x {len(engines)} engine configuration(s) with {NUSMV_BINARY}...")
+    start = time.perf_counter()
+    with Workspace(prefix="nusmv-bench-") as workspace, ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(lambda job: measure(*job, workspace, timeout), jobs))
+    table = pd.DataFrame(rows).astype({"bdd_nodes": "Int64", "peak_live_nodes": "Int64"})
+    print(f"✓ {len(rows)} run(s) in {time.perf_counter() - start:.0f}s "
+          f"({int(table['timed_out'].sum())} timed out, {int(table['error'].sum())} with errors)")
+    if table["tool_error"].any():
+        print(f"⚠ NuSMV itself failed on {int(table['tool_error'].sum())} run(s); they are left out of the summaries")
+    return table
+
+
+def engine_summary(table, baseline=BASELINE_ENGINE):
+    """
+    Per engine: speedup over the baseline engine (geometric mean and median over the models
+    both verified without errors), share of models made faster, median peak-RSS ratio,
+    timeouts and agreement with the baseline on the number of false properties.
+    """
+    valid = table[~table["error"] & ~table["tool_error"]]
+    wall = valid.pivot(index="model", columns="engine", values="wall")
+    rss = valid.pivot(index="model", columns="engine", values="peak_rss_kb")
+    false = valid.pivot(index="model", columns="engine", values="false")
+    rows = {}
+    for engine in wall.columns:
+        base = wall[baseline] if baseline in wall else pd.Series(np.nan, index=wall.index)
+        both = base.notna() & wall[engine].notna()
+        speedup = base[both] / wall[engine][both].clip(lower=1e-6)
+        compared = both & false[engine].notna()
+        rows[engine] = {
+            "models": int(wall[engine].notna().sum()),
+            "geomean_speedup": float(np.exp(np.log(speedup).mean())) if len(speedup) else np.nan,
+            "median_speedup": float(speedup.median()) if len(speedup) else np.nan,
+            "faster_share": float((speedup > 1).mean()) if len(speedup) else np.nan,
+            "median_rss_ratio": float((rss[engine][both] / rss[baseline][both]).median()) if both.any() else np.nan,
+            "timeouts": int(table[table["engine"] == engine]["timed_out"].sum()),
+            "agreement": float((false[engine][compared] == false[baseline][compared]).mean())
+            if compared.any() else np.nan,
+        }
+    return pd.DataFrame.from_dict(rows, orient="index").reindex([engine for engine in ENGINES if engine in rows])
+
+
+def fit_costs(table, cost="wall"):
+    """
+    Per engine, least-squares fit of log(1 + cost) on the standardized REGRESSORS.
+    Returns a DataFrame of coefficients (features x engines) with r2 and n rows.
+    """
+    fits = {}
+    for engine, runs in table[~table["error"] & ~table["tool_error"] & table[cost].notna()].groupby("engine"):
+        features = runs[REGRESSORS].astype(float)
+        features = features.loc[:, features.std() > 0]
+        if len(runs) <= len(features.columns) + 1:
+            continue
+        x = ((features - features.mean()) / features.std()).to_numpy()
+        x = np.column_stack([np.ones(len(x)), x])
+        y = np.log1p(runs[cost].astype(float).to_numpy())
+        coefficients, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+        residual = y - x @ coefficients
+        total = ((y - y.mean()) ** 2).sum()
+        fit = dict(zip(features.columns, coefficients[1:]))
+        fit["r2"] = 1 - (residual ** 2).sum() / total if total > 0 else np.nan
+        fit["n"] = len(runs)
+        fits[engine] = fit
+    return pd.DataFrame(fits).reindex(index=REGRESSORS + ["r2", "n"],
+                                      columns=[engine for engine in ENGINES if engine in fits])
+
+
+def report(table):
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format",
+                           "{:.3f}".format):
+        print(f"\n=== Engines vs {BASELINE_ENGINE} ===")
+        print(engine_summary(table).to_string())
+        for cost in COSTS:
+            fits = fit_costs(table, cost)
+            if fits.empty:
+                continue
+            print(f"\n=== log(1 + {cost}) per standard deviation of each feature ===")
+            print(fits.dropna(how="all").to_string())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python nusmv_benchmark.py <output.csv> [corpus.sqlite | directory or .smv file ...]")
+        sys.exit(1)
+    sources = sys.argv[2:] or sorted(path for pattern in DEFAULT_SOURCES for path in glob.glob(pattern)
+                                     if os.path.isdir(path))
+    table = run_benchmark(sources)
+    write_table(table, sys.argv[1])
+    report(table)
@@ -0,0 +1,384 @@
+"""
+Lightweight NuSMV model parsing and block-level editing.
+
+The LLM repair prompts can ask for targeted edits instead of a whole model.
+The edit protocol is line based so that it survives markdown cleaning:
+
+    @@ REPLACE next(Virtual_AC2)
+    next(Virtual_AC2) := case
+        temperature < 65 : FALSE;
+        TRUE : Virtual_AC2;
+    esac;
+    @@ REPLACE LTLSPEC 3
+    LTLSPEC G (temperature < 68 -> !Virtual_Fan3);
+    @@ END
+
+Supported targets are `next(var)`, `init(var)`, `VAR var` and `LTLSPEC n`
+(1-based, in order of appearance); supported operations are REPLACE, ADD and DELETE.
+"""
+
+import hashlib
+import re
+import textwrap
+
+SECTION_KEYWORDS = ["MODULE", "VAR", "IVAR", "FROZENVAR", "DEFINE", "CONSTANTS", "ASSIGN", "TRANS", "INIT",
+                    "INVAR", "FAIRNESS", "JUSTICE", "COMPASSION", "LTLSPEC", "SPEC", "CTLSPEC", "INVARSPEC"]
+
+_ASSIGN_START = re.compile(r"^[ \t]*(init|next)\s*\(\s*([A-Za-z_][\w.\[\]]*)\s*\)\s*:=", re.M)
+_SPEC_LINE = re.compile(r"^[ \t]*(LTLSPEC|INVARSPEC|CTLSPEC|SPEC)\b[^\n]*", re.M)
+_SECTION_LINE = re.compile(r"^[ \t]*(" + "|".join(SECTION_KEYWORDS) + r")\b", re.M)
+_DEFINE_DECL = re.compile(r"^[ \t]*([A-Za-z_][\w.\[\]]*)\s*:=", re.M)
+_VAR_DECL = re.compile(r"^[ \t]*([A-Za-z_][\w.\[\]]*)\s*:\s*([^;:]*?)\s*;[^\n]*", re.M)
+_CASE_TOKEN = re.compile(r"\b(case|esac)\b")
+_IDENTIFIER = re.compile(r"\b[A-Za-z_][\w.]*\b")
+_COMMENT = re.compile(r"--[^\n]*")
+# Single-line LTLSPEC G (...); and the operators that make an expression temporal
+_GLOBALLY_SPEC = re.compile(r"^([ \t]*)LTLSPEC\s+G\s*(\(.*\))\s*;([ \t]*--[^\n]*)?[ \t]*$", re.M)
+_TEMPORAL = re.compile(r"\b(?:X|F|G|U|V|Y|Z|H|O|S|T)\b|\bnext\s*\(")
+
+EDIT_HEADER = re.compile(
+    r"^[ \t]*@@[ \t]*(REPLACE|ADD|DELETE)[ \t]+(next|init|VAR|LTLSPEC)"
+    r"(?:[ \t]*\([ \t]*([\w.\[\]]+)[ \t]*\)|[ \t]+([\w.\[\]]+))?[ \t]*$",
+    re.M | re.I
+)
+EDIT_END = re.compile(r"^[ \t]*@@[ \t]*END[ \t]*$", re.M | re.I)
+
+EDIT_PROTOCOL_INSTRUCTIONS = """
+Do NOT return the whole model. Return only the blocks you change, using this exact format:
+
+@@ REPLACE next(<variable>)
+next(<variable>) := case
+    <condition> : <value>;
+    TRUE : <variable>;
+esac;
+@@ REPLACE LTLSPEC <number>
+LTLSPEC <formula>;
+@@ END
+
+Allowed headers:
+- @@ REPLACE next(<variable>) / @@ ADD next(<variable>) / @@ DELETE next(<variable>)
+- @@ REPLACE init(<variable>) / @@ ADD init(<variable>) / @@ DELETE init(<variable>)
+- @@ REPLACE VAR <variable> / @@ ADD VAR <variable>   (body: `<variable> : <type>;`)
+- @@ REPLACE LTLSPEC <number> / @@ ADD LTLSPEC   (numbers refer to the numbered list of specifications)
+Every block you do not mention is kept unchanged. No explanations, no markdown.
+"""
+
+
+class ModelEditError(ValueError):
+    """Raised when an LLM edit cannot be applied to the model."""
+
+
+def _line_start(text, pos):
+    return text.rfind("\n", 0, pos) + 1
+
+
+def _line_end(text, pos):
+    end = text.find("\n", pos)
+    return len(text) if end == -1 else end
+
+
+def _assignment_end(text, start):
+    """
+    Return the end offset of an init()/next() assignment starting at `start` (just after `:=`).
+    `case ... esac` blocks are matched with nesting; plain assignments end at the first `;`.
+    """
+    rest = text[start:]
+    if re.match(r"\s*case\b", rest):
+        depth = 0
+        for token in _CASE_TOKEN.finditer(text, start):
+            depth += 1 if token.group(1) == "case" else -1
+            if depth == 0:
+                end = token.end()
+                semicolon = re.match(r"\s*;", text[end:])
+                if semicolon:
+                    end += semicolon.end()
+                return _line_end(text, end)
+        return len(text)
+
+    semicolon = text.find(";", start)
+    if semicolon == -1:
+        return _line_end(text, start)
+    return _line_end(text, semicolon)
+
+
+def _sections(text):
+    """
+    Return a list of (keyword, start, end) spans for the top-level sections of the model.
+    """
+    matches = list(_SECTION_LINE.finditer(text))
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections.append((match.group(1), match.start(), end))
+    return sections
+
+
+def parse_nusmv_model(model_text):
+    """
+    Parse a single-module NuSMV model into its editable blocks.
+
+    Returns a dict with:
+    - "variables": {name: {"type": str, "span": (start, end)}}
+    - "init" / "next": {name: {"text": str, "span": (start, end)}}
+    - "specs": [{"kind": str, "text": str, "span": (start, end)}]
+    - "sections": [(keyword, start, end)]
+    - "defines" / "constants": names declared in DEFINE and CONSTANTS sections
+    Spans are character offsets into model_text covering whole lines.
+    """
+    model = {"variables": {}, "init": {}, "next": {}, "specs": [], "sections": _sections(model_text),
+             "defines": [], "constants": []}
+
+    for keyword, start, end in model["sections"]:
+        body_start = start + len(re.match(r"[ \t]*\w+", model_text[start:]).group(0))
+        if keyword == "DEFINE":
+            model["defines"] += [decl.group(1) for decl in _DEFINE_DECL.finditer(model_text, body_start, end)]
+            continue
+        if keyword == "CONSTANTS":
+            body = _COMMENT.sub("", model_text[body_start:end])
+            model["constants"] += [name for name in _IDENTIFIER.findall(body) if name not in model["constants"]]
+            continue
+        if keyword not in ("VAR", "IVAR", "FROZENVAR"):
+            continue
+        for decl in _VAR_DECL.finditer(model_text, body_start, end):
+            name = decl.group(1)
+            if name in SECTION_KEYWORDS:
+                continue
+            model["variables"][name] = {
+                "type": " ".join(decl.group(2).split()),
+                "span": (_line_start(model_text, decl.start(1)), decl.end())
+            }
+
+    for match in _ASSIGN_START.finditer(model_text):
+        kind, name = match.group(1), match.group(2)
+        start = _line_start(model_text, match.start(1))
+        end = _assignment_end(model_text, match.end())
+        model[kind][name] = {"text": model_text[start:end], "span": (start, end)}
+
+    for match in _SPEC_LINE.finditer(model_text):
+        start = _line_start(model_text, match.start(1))
+        model["specs"].append({"kind": match.group(1), "text": match.group(0).strip(), "span": (start, match.end())})
+
+    return model
+
+
+def numbered_specs(model_text):
+    """
+    Render the model's specifications as a numbered list for edit prompts.
+    """
+    specs = parse_nusmv_model(model_text)["specs"]
+    return "\n".join(f"{i}. {spec['text']}" for i, spec in enumerate(specs, 1))
+
+
+def identifiers(expression):
+    """
+    Return the set of identifiers referenced by a NuSMV expression.
+    """
+    return set(_IDENTIFIER.findall(expression))
+
+
+def spec_variables(model, spec_text):
+    """
+    Declared variables referenced by a specification (model from parse_nusmv_model).
+    """
+    return identifiers(spec_text) & set(model["variables"])
+
+
+def cone_of_influence(model, variables, depth=None):
+    """
+    Variables whose init()/next() assignments can influence `variables`, following
+    assignment dependencies for at most `depth` steps (None = full closure).
+    The result includes `variables` themselves (if declared).
+    """
+    declared = set(model["variables"])
+    cone = set(variables) & declared
+    frontier = set(cone)
+    steps = 0
+    while frontier and (depth is None or steps < depth):
+        steps += 1
+        reached = set()
+        for name in frontier:
+            for kind in ("init", "next"):
+                block = model[kind].get(name)
+                if block:
+                    reached |= identifiers(block["text"]) & declared
+        frontier = reached - cone
+        cone |= reached
+    return cone
+
+
+def _parenthesized(expression):
+    """
+    True if the whole expression is enclosed in one pair of parentheses.
+    """
+    depth = 0
+    for i, char in enumerate(expression):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth == 0:
+            return i == len(expression) - 1
+    return False
+
+
+def promote_invariants(model_text):
+    """
+    Rewrite every single-line `LTLSPEC G (p);` whose p is propositional (no temporal
+    operators, no next()) as `INVARSPEC p;`, which NuSMV checks by reachability instead
+    of an LTL tableau. Returns (model_text, number of promoted specifications).
+    """
+    promoted = 0
+
+    def promote(match):
+        nonlocal promoted
+        indent, body, comment = match.group(1), match.group(2), match.group(3) or ""
+        if not _parenthesized(body) or _TEMPORAL.search(body):
+            return match.group(0)
+        promoted += 1
+        return f"{indent}INVARSPEC {body[1:-1].strip()};{comment}"
+
+    return _GLOBALLY_SPEC.sub(promote, model_text), promoted
+
+
+def canonical_model(model_text):
+    """
+    Normalize a model for comparison: comments, blank lines and whitespace differences are dropped.
+    """
+    lines = (" ".join(_COMMENT.sub("", line).split()) for line in model_text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def model_fingerprint(model_text):
+    """
+    Short hash of the canonical model text, used to recognise models the LLM returns to.
+    """
+    return hashlib.sha256(canonical_model(model_text).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_model_edits(response):
+    """
+    Parse an edit-protocol response into a list of (operation, kind, target, body) tuples.
+    Returns an empty list if the response contains no edit headers.
+    """
+    headers = list(EDIT_HEADER.finditer(response))
+    edits = []
+    for i, header in enumerate(headers):
+        body_end = headers[i + 1].start() if i + 1 < len(headers) else len(response)
+        end_marker = EDIT_END.search(response, header.end(), body_end)
+        if end_marker:
+            body_end = end_marker.start()
+        operation = header.group(1).upper()
+        kind = header.group(2)
+        kind = kind.upper() if kind.upper() in ("VAR", "LTLSPEC") else kind.lower()
+        target = header.group(3) or header.group(4)
+        body = response[header.end():body_end].strip("\n")
+        edits.append((operation, kind, target, body))
+    return edits
+
+
+def _reindent(body, indent):
+    lines = textwrap.dedent(body).strip("\n").split("\n")
+    return "\n".join((indent + line) if line.strip() else line for line in lines)
+
+
+def _indent_of(text, pos):
+    line = text[_line_start(text, pos):_line_end(text, pos)]
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _sibling_indent(model_text, model, kind):
+    """
+    Indentation used by existing blocks of the same kind (four spaces if there are none).
+    """
+    if kind == "VAR":
+        blocks = list(model["variables"].values())
+    else:
+        blocks = list(model["init"].values()) + list(model["next"].values())
+    if not blocks:
+        return "    "
+    return _indent_of(model_text, blocks[-1]["span"][0])
+
+
+def _insertion_point(model_text, model, kind):
+    """
+    Offset where a new block of the given kind is inserted (start of a new line).
+    """
+    if kind == "VAR" and model["variables"]:
+        return max(v["span"][1] for v in model["variables"].values()) + 1
+    if kind in ("init", "next"):
+        blocks = list(model["init"].values()) + list(model["next"].values())
+        if kind == "init" and model["init"]:
+            blocks = list(model["init"].values())
+        if blocks:
+            return max(b["span"][1] for b in blocks) + 1
+        for keyword, start, end in model["sections"]:
+            if keyword == "ASSIGN":
+                return _line_end(model_text, start) + 1
+    if kind == "LTLSPEC" and model["specs"]:
+        return model["specs"][-1]["span"][1] + 1
+    return len(model_text) + 1
+
+
+def apply_model_edits(model_text, edits):
+    """
+    Apply parsed edits to the model and return the new model text.
+    Raises ModelEditError when an edit targets a block that does not exist.
+    """
+    model = parse_nusmv_model(model_text)
+    changes = []  # (start, end, replacement)
+
+    for operation, kind, target, body in edits:
+        if kind == "LTLSPEC":
+            if operation == "ADD" or target is None:
+                position = _insertion_point(model_text, model, kind)
+                changes.append((position, position, _reindent(body, "") + "\n"))
+                continue
+            if not target.isdigit() or not 1 <= int(target) <= len(model["specs"]):
+                raise ModelEditError(f"LTLSPEC {target} does not exist (model has {len(model['specs'])})")
+            existing = model["specs"][int(target) - 1]
+        elif kind == "VAR":
+            existing = model["variables"].get(target)
+        else:
+            existing = model[kind].get(target)
+
+        if target is None:
+            raise ModelEditError(f"{operation} {kind} requires a target")
+
+        if operation == "DELETE":
+            if not existing:
+                raise ModelEditError(f"cannot delete missing {kind} {target}")
+            start, end = existing["span"]
+            changes.append((start, min(end + 1, len(model_text)), ""))
+        elif existing:
+            # ADD of an existing block is treated as REPLACE
+            start, end = existing["span"]
+            changes.append((start, end, _reindent(body, _indent_of(model_text, start))))
+        else:
+            # REPLACE of a missing block is treated as ADD
+            position = _insertion_point(model_text, model, kind)
+            changes.append((position, position, _reindent(body, _sibling_indent(model_text, model, kind)) + "\n"))
+
+    changes.sort(key=lambda change: (change[0], change[1]))
+    for previous, current in zip(changes, changes[1:]):
+        if current[0] < previous[1]:
+            raise ModelEditError("overlapping edits")
+
+    padded = model_text if model_text.endswith("\n") else model_text + "\n"
+    for start, end, replacement in reversed(changes):
+        padded = padded[:start] + replacement + padded[end:]
+    return padded.rstrip("\n") + "\n"
+
+
+def apply_llm_edits(model_text, response):
+    """
+    Turn an LLM repair response into a full model.
+
+    Edit-protocol responses are applied to model_text; a response that already contains
+    a complete model (whole-model regeneration fallback) is returned unchanged.
+    Returns None when the response is neither.
+    """
+    if not response:
+        return None
+    edits = parse_model_edits(response)
+    if edits:
+        return apply_model_edits(model_text, edits)
+    if "MODULE" in response:
+        return response
+    return None
@@ -0,0 +1,188 @@
+"""
+Client-side adaptive concurrency limiting (AIMD) for rate-limited LLM endpoints.
+
+When many cases run in parallel, the remote endpoints answer 429/5xx. AIMDLimiter
+bounds the number of in-flight calls to a window that grows additively (about +1
+per window of successful calls) and is halved on throttling. Throttled and
+transient failures are retried inside the limiter, honoring Retry-After, so a
+refinement loop only sees an error once the retries are exhausted.
+"""
+
+import random
+import threading
+import time
+
+from deadline import remaining
+
+RETRYABLE_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
+THROTTLE_STATUS = (429, 503)
+
+
+class RequestCancelled(RuntimeError):
+    """Raised when a call is cancelled (e.g. its hedged twin already answered)."""
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (seconds or HTTP date) into seconds, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_policy(error):
+    """
+    Classify an exception from an LLM call.
+    Returns (retryable, throttled, retry_after_seconds). Works with BackendError,
+    openai.APIStatusError and anything else carrying `status`/`status_code` and `response`.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers is not None:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+
+    if status is None:
+        # Connection failures and timeouts carry no status code
+        transient = isinstance(error, (ConnectionError, TimeoutError)) or hasattr(error, "status") or \
+            type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        return transient, False, retry_after
+    return status in RETRYABLE_STATUS, status in THROTTLE_STATUS, retry_after
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease concurrency window shared by all
+    threads calling one endpoint.
+
+    `window` is the number of calls allowed in flight. Each success adds
+    increase / window (so a full window of successes adds `increase`); a throttled
+    response multiplies the window by `decrease`, at most once per `cooldown`
+    seconds, and blocks new calls until its Retry-After has passed.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, increase=1.0, decrease=0.5, cooldown=1.0,
+                 max_retries=5, base_delay=1.0, max_delay=60.0, name="llm"):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = float("-inf")
+        self.successes = 0
+        self.throttles = 0
+        self.retries = 0
+        self.condition = threading.Condition()
+
+    @property
+    def window(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self, cancel_event=None):
+        """
+        Block until a slot in the window is free (and any Retry-After has passed).
+        Raises RequestCancelled if cancel_event is set while waiting.
+        """
+        with self.condition:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(f"{self.name}: cancelled while waiting for a slot")
+                blocked = self.blocked_until - time.monotonic()
+                if blocked <= 0 and self.in_flight < self.window:
+                    self.in_flight += 1
+                    return
+                # Poll so that cancellation is noticed while waiting
+                self.condition.wait(timeout=min(blocked, 0.5) if blocked > 0 else 0.5)
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            self.limit = min(self.max_limit, self.limit + self.increase / self.window)
+            self.condition.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        with self.condition:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self.last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number `attempt` (0-based): Retry-After if given,
+        otherwise jittered exponential backoff.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def call(self, fn, cancel_event=None):
+        """
+        Run fn() inside the window, retrying throttled and transient failures up to
+        max_retries times. Non-retryable errors and the last failure are re-raised, as is
+        a failure whose backoff would run past the current deadline (deadline.py).
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(cancel_event)
+            try:
+                result = fn()
+            except Exception as e:
+                error = e
+            else:
+                self.on_success()
+                return result
+            finally:
+                self.release()
+
+            retryable, throttled, retry_after = retry_policy(error)
+            if throttled:
+                self.on_throttle(retry_after)
+            if not retryable or attempt == self.max_retries:
+                raise error
+
+            delay = self.backoff(attempt, retry_after)
+            left = remaining()
+            if left is not None and delay >= left:
+                raise error
+            self.retries += 1
+            print(f"⚠ {self.name}: {error} - retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{self.max_retries}, window {self.window})")
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise RequestCancelled(f"{self.name}: cancelled during backoff")
+            else:
+                time.sleep(delay)
+
+    def report(self):
+        return {
+            "window": self.window,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "retries": self.retries
+        }
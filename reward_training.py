@@ -2,6 +2,7 @@ import subprocess
 import re
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from trl import PPOTrainer, PPOConfig
+from workspace import scratch_model_file
 
 # Load the model and tokenizer
 model_name = "meta-llama/LLaMA-7b"
@@ -20,22 +21,21 @@ def generate_candidates(input_prompt, num_samples=5):
     return [tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
 
 # Function to run NuSMV on a candidate
-def run_nusmv(candidate, file_name="temp.smv"):
-    # Write the candidate to a temporary SMV file
-    with open(file_name, "w") as f:
-        f.write(candidate)
-
-    # Run NuSMV on the file
-    try:
-        result = subprocess.run(
-            ["nusmv", file_name],
-            text=True,
-            capture_output=True,
-            check=True
-        )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        return e.stderr
+def run_nusmv(candidate):
+    # Write the candidate to its own temporary SMV file (tmpfs with TAPASSURE_WORKSPACE=tmpfs),
+    # so concurrent candidates never overwrite each other
+    with scratch_model_file(candidate) as file_name:
+        # Run NuSMV on the file
+        try:
+            result = subprocess.run(
+                ["nusmv", file_name],
+                text=True,
+                capture_output=True,
+                check=True
+            )
+            return result.stdout
+        except subprocess.CalledProcessError as e:
+            return e.stderr
 
 # Function to parse NuSMV results
 def parse_nusmv_results(output):
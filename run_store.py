@@ -0,0 +1,309 @@
+"""
+Structured event store for refinement runs.
+
+The result folders (Llama-Violation-Result*/, Gwen-Violation-Result/,
+result-violation/) are UTF-16 console captures full of emoji and reprinted
+models, so every question about a run means regex-scraping hundreds of
+megabytes. Instead, main.py emits one event per step of the refinement loop into
+an append-only SQLite database:
+
+    runs    one row per case run (case, backend, repeat, settings, status)
+    events  iteration_start / iteration_end / llm_call / verifier_call, with
+            phase, iteration, timestamps and a JSON payload (tokens, latency,
+            per-spec verdicts, ...)
+    blobs   model, prompt and response texts, stored once per SHA-256 hash and
+            referenced from events by their hash
+
+Events inherit the phase and iteration of the last iteration_start of their run,
+so LLM and verifier calls deep inside the loop need no extra arguments. Several
+processes (the batch runner's pool) can append to the same file: SQLite runs in
+WAL mode with a busy timeout.
+
+Usage: python run_store.py runs.sqlite [run_id]
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    case_name TEXT,
+    backend TEXT,
+    repeat INTEGER,
+    started REAL,
+    finished REAL,
+    status TEXT,
+    host TEXT,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    phase TEXT,
+    iteration INTEGER,
+    model_hash TEXT,
+    elapsed REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id, seq);
+CREATE INDEX IF NOT EXISTS events_kind ON events (kind, run_id);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    kind TEXT,
+    size INTEGER,
+    text TEXT
+);
+CREATE VIEW IF NOT EXISTS llm_calls AS
+    SELECT run_id, phase, iteration, ts, elapsed AS latency,
+           json_extract(data, '$.label') AS label,
+           json_extract(data, '$.backend') AS backend,
+           json_extract(data, '$.prompt_tokens') AS prompt_tokens,
+           json_extract(data, '$.completion_tokens') AS completion_tokens,
+           json_extract(data, '$.error') AS error,
+           json_extract(data, '$.prompt_hash') AS prompt_hash,
+           json_extract(data, '$.response_hash') AS response_hash
+    FROM events WHERE kind = 'llm_call';
+CREATE VIEW IF NOT EXISTS verifier_calls AS
+    SELECT run_id, phase, iteration, ts, elapsed, model_hash,
+           json_extract(data, '$.syntax_ok') AS syntax_ok,
+           json_extract(data, '$.timed_out') AS timed_out,
+           json_array_length(data, '$.failed') AS failed,
+           json_array_length(data, '$.passed') AS passed
+    FROM events WHERE kind = 'verifier_call';
+"""
+
+# Event kinds
+ITERATION_START = "iteration_start"
+ITERATION_END = "iteration_end"
+LLM_CALL = "llm_call"
+VERIFIER_CALL = "verifier_call"
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def connect(path):
+    """
+    Open a store database (created if needed) for concurrent appends.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class RunStore:
+    """
+    Append-only event store (see module docstring). Runs are keyed by case name
+    while they are active, so callers emit events for "the current case" (e.g.
+    main.token_ledger.case) without carrying run ids around. Thread-safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = connect(path)
+        self.lock = threading.Lock()
+        self.runs = {}  # case -> {"run_id", "seq", "phase", "iteration", "iteration_start"}
+        self.known_blobs = set()
+
+    def begin_run(self, case, backend=None, repeat=None, **settings):
+        """
+        Start a new run of `case` and return its id; later events for the case go to it.
+        """
+        run_id = uuid.uuid4().hex[:16]
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO runs (run_id, case_name, backend, repeat, started, status, host, settings) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, case, backend, repeat, time.time(), "running", socket.gethostname(),
+                 json.dumps(settings, default=str))
+            )
+            self.runs[case] = {"run_id": run_id, "seq": 0, "phase": None, "iteration": None,
+                               "iteration_start": None}
+        return run_id
+
+    def end_run(self, case, status):
+        with self.lock:
+            run = self.runs.pop(case, None)
+            if run:
+                self.connection.execute("UPDATE runs SET finished = ?, status = ? WHERE run_id = ?",
+                                        (time.time(), status, run["run_id"]))
+
+    def _put_blob(self, text, kind):
+        """
+        Store a text once and return its hash (call with the lock held).
+        """
+        digest = text_hash(text)
+        if digest not in self.known_blobs:
+            self.connection.execute("INSERT OR IGNORE INTO blobs (hash, kind, size, text) VALUES (?, ?, ?, ?)",
+                                    (digest, kind, len(text), text))
+            self.known_blobs.add(digest)
+        return digest
+
+    def emit(self, case, kind, model=None, texts=None, elapsed=None, phase=None, iteration=None, **data):
+        """
+        Append an event to the active run of `case` (ignored if the case has no run).
+        `model` is stored as a blob and referenced by hash, as are `texts` ({name: text},
+        e.g. prompt and response), which appear in the payload as <name>_hash. The
+        remaining keyword arguments form the JSON payload. iteration_end events get the
+        time since their iteration_start as `elapsed`.
+        """
+        now = time.time()
+        with self.lock:
+            run = self.runs.get(case)
+            if run is None:
+                return
+            if kind == ITERATION_START:
+                run.update(phase=phase, iteration=iteration, iteration_start=now)
+            elif kind == ITERATION_END and elapsed is None and run["iteration_start"] is not None:
+                elapsed = now - run["iteration_start"]
+            run["seq"] += 1
+            self._insert_event(run["run_id"], run["seq"], now, kind, phase or run["phase"],
+                               iteration if iteration is not None else run["iteration"], model, texts, elapsed, data)
+
+    def _insert_event(self, run_id, seq, ts, kind, phase, iteration, model, texts, elapsed, data):
+        model_hash = self._put_blob(model, "model") if model else None
+        for name, text in (texts or {}).items():
+            data[f"{name}_hash"] = self._put_blob(text, name) if text else None
+        self.connection.execute(
+            "INSERT INTO events (run_id, seq, ts, kind, phase, iteration, model_hash, elapsed, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, seq, ts, kind, phase, iteration, model_hash, elapsed,
+             json.dumps(data, default=str) if data else None)
+        )
+
+    def add_run(self, run_id, case, events, backend=None, repeat=None, status=None, started=None, finished=None,
+                **settings):
+        """
+        Write a complete run (e.g. one imported from a console log, see log_import.py) in a
+        single transaction. `events` are dicts with kind, phase and iteration, and optionally
+        ts (default: started), model, texts, elapsed and data. Returns False without writing
+        anything if a run with this id is already stored.
+        """
+        started = started if started is not None else time.time()
+        with self.lock:
+            if self.connection.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone():
+                return False
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(
+                    "INSERT INTO runs (run_id, case_name, backend, repeat, started, finished, status, host, settings) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, case, backend, repeat, started, finished, status, socket.gethostname(),
+                     json.dumps(settings, default=str))
+                )
+                for seq, event in enumerate(events, 1):
+                    self._insert_event(run_id, seq, event.get("ts", started), event["kind"], event.get("phase"),
+                                       event.get("iteration"), event.get("model"), event.get("texts"),
+                                       event.get("elapsed"), dict(event.get("data") or {}))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                # Blobs written in the rolled-back transaction are gone
+                self.known_blobs.clear()
+                raise
+        return True
+
+    def close(self):
+        self.connection.close()
+
+
+def read_runs(path):
+    """
+    All runs of a store as dicts.
+    """
+    connection = connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in connection.execute("SELECT * FROM runs ORDER BY started")]
+    finally:
+        connection.close()
+
+
+def read_events(path, run_id=None, kind=None):
+    """
+    Events of a store (optionally of one run and/or kind) as dicts with the payload decoded.
+    """
+    query, params = "SELECT * FROM events WHERE 1 = 1", []
+    if run_id:
+        query += " AND run_id = ?"
+        params.append(run_id)
+    if kind:
+        query += " AND kind = ?"
+        params.append(kind)
+    connection = connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        events = []
+        for row in connection.execute(query + " ORDER BY run_id, seq", params):
+            event = dict(row)
+            event["data"] = json.loads(event["data"]) if event["data"] else {}
+            events.append(event)
+        return events
+    finally:
+        connection.close()
+
+
+def read_blob(path, digest):
+    """
+    The text stored under a hash, or None.
+    """
+    connection = connect(path)
+    try:
+        row = connection.execute("SELECT text FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row else None
+    finally:
+        connection.close()
+
+
+def print_summary(path, run_id=None):
+    """
+    One line per run (or per event of `run_id`).
+    """
+    if run_id:
+        for event in read_events(path, run_id):
+            details = ", ".join(f"{k}={v}" for k, v in event["data"].items() if not isinstance(v, (list, dict)))
+            elapsed = f" {event['elapsed']:.2f}s" if event["elapsed"] is not None else ""
+            print(f"{event['seq']:>5} {event['phase'] or '-':<7}{event['iteration'] or 0:>4} "
+                  f"{event['kind']:<16}{elapsed} {details}")
+        return
+    connection = connect(path)
+    try:
+        rows = connection.execute("""
+            SELECT r.run_id, r.case_name, r.backend, r.repeat, r.status,
+                   SUM(e.kind = 'iteration_end'), SUM(e.kind = 'llm_call'),
+                   SUM(CASE WHEN e.kind = 'llm_call'
+                            THEN COALESCE(json_extract(e.data, '$.prompt_tokens'), 0)
+                                 + COALESCE(json_extract(e.data, '$.completion_tokens'), 0)
+                       END),
+                   COALESCE(r.finished, MAX(e.ts)) - r.started
+            FROM runs r LEFT JOIN events e ON e.run_id = r.run_id
+            GROUP BY r.run_id ORDER BY r.started
+        """).fetchall()
+    finally:
+        connection.close()
+    print("Run              Case    Backend   Rep  Status    Iterations  LLM calls  Tokens    Time")
+    for run_id, case, backend, repeat, status, iterations, calls, tokens, elapsed in rows:
+        print(f"{run_id:<17}{case or '-':<8}{backend or '-':<10}{repeat or '-':<5}{status:<10}{iterations or 0:<12}"
+              f"{calls or 0:<11}{tokens or 0:<10}{elapsed or 0:.0f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python run_store.py <runs.sqlite> [run_id]")
+        sys.exit(1)
+    print_summary(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
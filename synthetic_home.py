@@ -0,0 +1,288 @@
+"""
+Synthetic smart homes for scalability testing.
+
+The predefined cases top out at 8 scenarios and about 15 devices (scenarios3 +
+safety_properties4), while real homes have 60-150 devices and hundreds of
+rules. This generator builds homes of any size from the device families of the
+predefined cases (Virtual Light, Virtual A/C, Virtual Fan, Virtual TV, Virtual
+Fridge, motion sensors, time and temperature), spread over numbered rooms, and
+emits for each home:
+
+- scenarios: trigger-action rules in the style of scenarios1..3 ("When motion is
+  detected in the bedroom 2, turn on Virtual Light 7 and set Virtual Fan 3 to
+  low speed.")
+- safety_properties: constraints in the style of safety_properties1..4
+  ("Virtual A/C 4 must not run if the temperature is below 65°F.")
+- a ground-truth NuSMV model in the style of Ground-Truth/: one variable per
+  device, one next() case per actuator with a branch per rule (earlier rules
+  win), free inputs for motion, time, temperature and away mode, and one
+  LTLSPEC per safety property. As in the predefined cases, the rules may
+  violate the properties; that is what Process 2 repairs.
+
+Homes are deterministic for a given (devices, rules, properties, seed). The
+output directory gets <name>.smv per home and manifest.yaml, a batch manifest
+(batch_runner.py) whose cases are the generated homes; add
+`input_model: "{case}.smv"` to it to start Process 2 from the ground truth.
+
+Usage: python synthetic_home.py <output directory> [devices:rules[:properties] ...] [seed]
+       (default sizes: 15:8, 60:100, 100:250, 150:400)
+"""
+
+import os
+import random
+import sys
+
+import yaml
+
+DEFAULT_SIZES = [(15, 8), (60, 100), (100, 250), (150, 400)]
+ROOM_TYPES = ["living room", "bedroom", "kitchen", "dining room", "office", "bathroom", "hallway", "garage"]
+DEVICES_PER_ROOM = 8
+
+# Family -> (label, share of the non-sensor devices, NuSMV type, off value)
+FAMILIES = {
+    "light": ("Virtual Light", 0.40, "boolean", "FALSE"),
+    "ac": ("Virtual A/C", 0.15, "{off, on, eco}", "off"),
+    "fan": ("Virtual Fan", 0.20, "{off, low, medium, high}", "off"),
+    "tv": ("Virtual TV", 0.15, "{off, on, muted}", "off"),
+    "fridge": ("Virtual Fridge", 0.10, "boolean", "FALSE"),
+}
+
+# Family -> [(phrase, value)]; {device} is the device label
+ACTIONS = {
+    "light": [("turn on {device}", "TRUE"), ("turn off {device}", "FALSE")],
+    "ac": [("turn on {device}", "on"), ("turn off {device}", "off"), ("switch {device} to 'eco mode'", "eco")],
+    "fan": [("set {device} to low speed", "low"), ("set {device} to medium speed", "medium"),
+            ("set {device} to high speed", "high"), ("turn off {device}", "off")],
+    "tv": [("turn on {device}", "on"), ("turn off {device}", "off"), ("mute {device}", "muted")],
+    "fridge": [("turn on {device}", "TRUE")],
+}
+
+
+def _hour(hour):
+    if hour == 0:
+        return "midnight"
+    return f"{hour % 12 or 12} {'AM' if hour < 12 else 'PM'}"
+
+
+def _identifier(text):
+    return "".join(c if c.isalnum() else "_" for c in text).strip("_")
+
+
+def _is_on(device):
+    """
+    NuSMV expression that is true while the device is running.
+    """
+    if FAMILIES[device["family"]][2] == "boolean":
+        return device["var"]
+    return f"{device['var']} != off"
+
+
+def make_devices(count, rng):
+    """
+    Rooms and devices of a home with `count` devices: one motion sensor per room, the
+    rest split over the actuator families by FAMILIES share.
+    """
+    room_count = max(2, round(count / DEVICES_PER_ROOM))
+    rooms = []
+    for i in range(room_count):
+        room_type = ROOM_TYPES[i % len(ROOM_TYPES)]
+        rooms.append(room_type if i < len(ROOM_TYPES) else f"{room_type} {i // len(ROOM_TYPES) + 1}")
+    sensors = [{"family": "motion", "label": f"Motion Sensor {i}", "room": room, "var": f"motion_{_identifier(room)}"}
+               for i, room in enumerate(rooms, 1)]
+    actuators = []
+    remaining = max(len(FAMILIES), count - len(sensors))
+    numbers = dict.fromkeys(FAMILIES, 0)
+    for family, (label, share, _, _) in FAMILIES.items():
+        for _ in range(max(1, round(remaining * share))):
+            numbers[family] += 1
+            actuators.append({"family": family, "label": f"{label} {numbers[family]}", "room": rng.choice(rooms),
+                              "var": _identifier(f"{label}{numbers[family]}").replace("A_C", "AC")})
+    return rooms, sensors, actuators
+
+
+def make_trigger(rng, rooms, actuators):
+    """
+    (phrase, NuSMV condition) of a random rule trigger.
+    """
+    kind = rng.choice(["motion", "no motion", "time", "hot", "cold", "away", "device"])
+    room = rng.choice(rooms)
+    if kind == "motion":
+        return f"When motion is detected in the {room}", f"motion_{_identifier(room)}"
+    if kind == "no motion":
+        return f"When no motion is detected in the {room}", f"!motion_{_identifier(room)}"
+    if kind == "time":
+        hour = rng.randrange(24)
+        return f"At {_hour(hour)}", f"time = {hour}"
+    if kind == "hot":
+        degrees = rng.randrange(72, 91)
+        return f"If the temperature exceeds {degrees}°F", f"temperature > {degrees}"
+    if kind == "cold":
+        degrees = rng.randrange(55, 70)
+        return f"If the temperature drops below {degrees}°F", f"temperature < {degrees}"
+    if kind == "away":
+        return "When leaving home", "away_mode"
+    device = rng.choice(actuators)
+    return f"When {device['label']} is turned on", _is_on(device)
+
+
+def make_rules(count, rng, rooms, actuators):
+    """
+    `count` scenarios; each is (sentence, condition, [(device, value)]) with one or two actions.
+    """
+    rules = []
+    seen = set()
+    for _ in range(count * 20):
+        if len(rules) == count:
+            break
+        trigger, condition = make_trigger(rng, rooms, actuators)
+        targets = rng.sample(actuators, min(len(actuators), rng.choice([1, 1, 2])))
+        phrases, actions = [], []
+        for device in targets:
+            phrase, value = rng.choice(ACTIONS[device["family"]])
+            phrases.append(phrase.format(device=device["label"]))
+            actions.append((device, value))
+        sentence = f"{trigger}, {' and '.join(phrases)}."
+        if sentence not in seen:
+            seen.add(sentence)
+            rules.append((sentence, condition, actions))
+    return rules
+
+
+def make_property(rng, rooms, actuators):
+    """
+    (sentence, LTL formula) of a random safety property.
+    """
+    by_family = {family: [d for d in actuators if d["family"] == family] for family in FAMILIES}
+    templates = ["ac-cold", "fan-cold", "tv-night", "light-away", "fan-ac", "light-no-motion", "ac-eco", "fridge-on",
+                 "fans-room"]
+    while True:
+        template = rng.choice(templates)
+        if template == "ac-cold":
+            ac, degrees = rng.choice(by_family["ac"]), rng.randrange(60, 70)
+            return (f"{ac['label']} must not run if the temperature is below {degrees}°F.",
+                    f"G (temperature < {degrees} -> {ac['var']} = off)")
+        if template == "fan-cold":
+            fan, degrees = rng.choice(by_family["fan"]), rng.randrange(60, 70)
+            return (f"{fan['label']} must not run when the room temperature is below {degrees}°F.",
+                    f"G (temperature < {degrees} -> {fan['var']} = off)")
+        if template == "tv-night":
+            tv = rng.choice(by_family["tv"])
+            return (f"{tv['label']} must not turn on between midnight and 6 AM.",
+                    f"G ((time >= 0 & time < 6) -> {tv['var']} != on)")
+        if template == "light-away":
+            light = rng.choice(by_family["light"])
+            return (f"{light['label']} must stay off in 'away mode'.", f"G (away_mode -> !{light['var']})")
+        if template == "fan-ac":
+            fan, ac = rng.choice(by_family["fan"]), rng.choice(by_family["ac"])
+            return (f"{fan['label']} must deactivate when {ac['label']} is running.",
+                    f"G ({ac['var']} != off -> {fan['var']} = off)")
+        if template == "light-no-motion":
+            light = rng.choice(by_family["light"])
+            sensor = f"motion_{_identifier(light['room'])}"
+            return (f"{light['label']} must turn off when no motion is detected in the {light['room']}.",
+                    f"G (!{sensor} -> X (!{light['var']}))")
+        if template == "ac-eco":
+            ac = rng.choice(by_family["ac"])
+            return (f"{ac['label']} must switch to 'eco mode' when no one is home.",
+                    f"G (away_mode -> X ({ac['var']} = eco))")
+        if template == "fridge-on":
+            fridge = rng.choice(by_family["fridge"])
+            return f"{fridge['label']} must never turn off once it is on.", \
+                f"G ({fridge['var']} -> X ({fridge['var']}))"
+        for room in rng.sample(rooms, len(rooms)):
+            fans = [d for d in by_family["fan"] if d["room"] == room]
+            if len(fans) >= 2:
+                first, second = rng.sample(fans, 2)
+                return (f"{first['label']} and {second['label']} must not run in the {room} simultaneously.",
+                        f"G !({_is_on(first)} & {_is_on(second)})")
+        templates.remove("fans-room")
+
+
+def build_model(sensors, actuators, rules, properties):
+    """
+    Ground-truth NuSMV model of a home (see the module docstring).
+    """
+    lines = ["MODULE main", "VAR"]
+    lines += [f"    {sensor['var']} : boolean; -- {sensor['label']} ({sensor['room']})" for sensor in sensors]
+    lines += ["    time : 0..23;", "    temperature : 50..100;", "    away_mode : boolean;", ""]
+    lines += [f"    {device['var']} : {FAMILIES[device['family']][2]}; -- {device['room']}" for device in actuators]
+    lines += ["", "ASSIGN", "    -- Initial states"]
+    lines += [f"    init({device['var']}) := {FAMILIES[device['family']][3]};" for device in actuators]
+    lines += ["", "    -- Scenario rules"]
+    branches = {device["var"]: [] for device in actuators}
+    for number, (_, condition, actions) in enumerate(rules, 1):
+        for device, value in actions:
+            branches[device["var"]].append(f"        {condition} : {value}; -- scenario {number}")
+    for device in actuators:
+        if not branches[device["var"]]:
+            # No rule controls the device: it keeps its initial state
+            lines += [f"    next({device['var']}) := {device['var']};", ""]
+            continue
+        lines.append(f"    next({device['var']}) := case")
+        lines += branches[device["var"]]
+        lines += [f"        TRUE : {device['var']};", "    esac;", ""]
+    lines += [f"LTLSPEC {formula}; -- {sentence}" for sentence, formula in properties]
+    return "\n".join(lines) + "\n"
+
+
+def generate_home(devices=60, rules=100, properties=None, seed=0):
+    """
+    A synthetic home as a case dict: name, scenarios, safety_properties (as in
+    main.PREDEFINED_CASES) and model (ground-truth NuSMV text). properties defaults to
+    one per five rules (at least 5).
+    """
+    properties = properties if properties is not None else max(5, rules // 5)
+    rng = random.Random(f"{devices}:{rules}:{properties}:{seed}")
+    rooms, sensors, actuators = make_devices(devices, rng)
+    scenario_rules = make_rules(rules, rng, rooms, actuators)
+    safety = []
+    seen = set()
+    for _ in range(properties * 20):
+        if len(safety) == properties:
+            break
+        sentence, formula = make_property(rng, rooms, actuators)
+        if sentence not in seen:
+            seen.add(sentence)
+            safety.append((sentence, formula))
+    return {
+        "name": f"home-{devices}-{rules}-s{seed}",
+        "scenarios": [sentence for sentence, _, _ in scenario_rules],
+        "safety_properties": [sentence for sentence, _ in safety],
+        "devices": len(sensors) + len(actuators),
+        "model": build_model(sensors, actuators, scenario_rules, safety)
+    }
+
+
+def write_homes(output_dir, sizes=DEFAULT_SIZES, seed=0):
+    """
+    Generate a home per (devices, rules[, properties]) size; write <name>.smv files and
+    manifest.yaml to output_dir. Returns the homes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    homes = [generate_home(*size, seed=seed) for size in sizes]
+    for home in homes:
+        with open(os.path.join(output_dir, f"{home['name']}.smv"), 'w') as f:
+            f.write(home["model"])
+        print(f"✓ {home['name']}: {home['devices']} devices, {len(home['scenarios'])} scenarios, "
+              f"{len(home['safety_properties'])} safety properties")
+    manifest = {
+        "cases": [{"name": home["name"], "scenarios": home["scenarios"],
+                   "safety_properties": home["safety_properties"]} for home in homes],
+        "backends": ["lambda"],
+        "repeats": 1,
+        "output_dir": "results"
+    }
+    with open(os.path.join(output_dir, "manifest.yaml"), 'w') as f:
+        yaml.safe_dump(manifest, f, sort_keys=False, allow_unicode=True, width=1000)
+    print(f"✓ Models and manifest.yaml saved to {output_dir}")
+    return homes
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python synthetic_home.py <output directory> [devices:rules[:properties] ...] [seed]")
+        sys.exit(1)
+    arguments = sys.argv[2:]
+    seed = int(arguments.pop()) if arguments and arguments[-1].isdigit() else 0
+    sizes = [tuple(int(n) for n in size.split(":")) for size in arguments] or DEFAULT_SIZES
+    write_homes(sys.argv[1], sizes, seed)
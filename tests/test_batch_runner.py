@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from batch_runner import expand_jobs, load_manifest
+
+MANIFEST = """
+cases:
+  - 1-1
+  - name: custom
+    scenarios: ["When motion is detected, turn on the light."]
+    safety_properties: ["The light is never on without motion."]
+backends: [lambda, "lambda,vllm"]
+repeats: 2
+input_model: "models/{case}.smv"
+run_store: runs.sqlite
+edit_mode: patch
+"""
+
+
+def test_expand_jobs_covers_cases_backends_and_repeats(tmp_path):
+    manifest_file = tmp_path / "manifest.yaml"
+    manifest_file.write_text(MANIFEST)
+    output_dir, jobs = expand_jobs(load_manifest(str(manifest_file)), str(tmp_path))
+
+    assert output_dir == os.path.join(str(tmp_path), "results")
+    assert len(jobs) == 2 * 2 * 2
+    assert len({job["dir"] for job in jobs}) == len(jobs)
+
+    job = jobs[0]
+    assert job["job"] == "lambda/1-1/rep-1"
+    assert (job["scenarios"], job["safety_properties"]) == main.PREDEFINED_CASES["1-1"]
+    assert job["input_model"] == os.path.join(str(tmp_path), "models", "1-1.smv")
+    assert job["run_store"] == os.path.join(output_dir, "runs.sqlite")
+    assert job["edit_mode"] == "patch"
+
+    hedged = [job for job in jobs if job["backend"] == "lambda,vllm"]
+    assert hedged[-1]["job"] == "lambda+vllm/custom/rep-2"
+    assert hedged[-1]["dir"] == os.path.join(output_dir, "lambda+vllm", "custom", "rep-2")
+
+
+def test_manifest_errors(tmp_path):
+    manifest_file = tmp_path / "manifest.yaml"
+    manifest_file.write_text("cases: [1-1]\n")
+    with pytest.raises(ValueError, match="no backends"):
+        load_manifest(str(manifest_file))
+    with pytest.raises(ValueError, match="Unknown case"):
+        expand_jobs({"cases": ["9-9"], "backends": ["lambda"]})
+
+
+def test_batch_runner_imports_without_pandas():
+    # analytics (and pandas) is only loaded for the end-of-batch report
+    code = "import sys; sys.modules['pandas'] = None; import batch_runner"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,77 @@
+import main
+from nusmv_model import model_fingerprint
+
+MODEL = """MODULE main
+VAR
+    light : boolean;
+ASSIGN
+    init(light) := FALSE;
+LTLSPEC G !light;
+"""
+
+
+def test_fingerprint_ignores_comments_and_whitespace():
+    reformatted = "-- regenerated\n" + MODEL.replace("    ", "\t").replace(":= FALSE;", ":=   FALSE;  -- off") + "\n\n"
+    assert model_fingerprint(reformatted) == model_fingerprint(MODEL)
+    assert model_fingerprint(MODEL.replace("FALSE", "TRUE")) != model_fingerprint(MODEL)
+
+
+def test_cycle_strategy_escalates_one_step_per_cycle(monkeypatch):
+    switches = []
+    monkeypatch.setattr(main.llm_router, "switch_backend", lambda: switches.append(1) or "backup")
+    strategy = {"level": 0, "hint": "", "temperature": 0.0}
+
+    main.escalate_cycle_strategy(strategy)
+    assert strategy == {"level": 1, "hint": main.CYCLE_HINT, "temperature": 0.0}
+
+    main.escalate_cycle_strategy(strategy)
+    assert strategy["temperature"] == main.CYCLE_TEMPERATURE
+    assert not switches
+
+    main.escalate_cycle_strategy(strategy)
+    main.escalate_cycle_strategy(strategy)
+    assert len(switches) == 2  # keeps rotating once backend switching is reached
+
+
+def run_phase2(monkeypatch, tmp_path, verdicts, replies):
+    """Run Process 2 with scripted NuSMV outputs (per model text, in order) and LLM replies."""
+    checked = []
+
+    def validate(model_file):
+        with open(model_file) as f:
+            model = f.read()
+        checked.append(model)
+        return verdicts[model].pop(0)
+
+    monkeypatch.setattr(main, "validate_nusmv_model", validate)
+    monkeypatch.setattr(main, "regenerate_model_from_violations", lambda *args, **kwargs: replies.pop(0))
+    input_model = tmp_path / "model.smv"
+    input_model.write_text("A")
+    run_record = {"case": "1-1"}
+    for _ in main.minimize_violations_steps(str(input_model), str(tmp_path / "out.smv"), ["s"], ["p"],
+                                            max_iterations=10, run_record=run_record):
+        pass
+    return checked, run_record
+
+
+def violations(count):
+    return True, [f"-- specification G p{i}  is false" for i in range(count)], "is false"
+
+
+def test_failed_nusmv_runs_are_not_reused_as_verdicts(monkeypatch, tmp_path):
+    # Regression: a timeout was cached by fingerprint and replayed when the model came back
+    timeout = (True, ["Timeout during verification"], main.VERIFICATION_TIMEOUT)
+    crashed = (True, ["Error: killed"], f"{main.NUSMV_FAILED}: killed by signal 9\n")
+    safe = (False, [], "-- specification G p0  is true")
+    checked, _ = run_phase2(monkeypatch, tmp_path, {"A": [timeout, crashed, safe]}, ["A", "A"])
+    assert checked == ["A", "A", "A"]
+    assert not main.is_model_verdict(main.NUSMV_NOT_FOUND)
+    assert main.is_model_verdict(safe[2])
+
+
+def test_cycle_strategy_resets_after_progress(monkeypatch, tmp_path):
+    verdicts = {"A": [violations(3)], "B": [violations(4)], "C": [violations(2)], "D": [violations(2)],
+                "E": [(False, [], "")]}
+    # A -> B -> A (cycle, cached verdict) -> C (new best) -> D -> E (safe)
+    _, run_record = run_phase2(monkeypatch, tmp_path, verdicts, ["B", "A", "C", "D", "E"])
+    assert [entry.get("strategy_level") for entry in run_record["phase2"]] == [0, 0, 1, 0, 0, None]
@@ -0,0 +1,64 @@
+import os
+
+from log_import import find_logs, import_logs, parse_log
+from run_store import ITERATION_START, LLM_CALL, VERIFIER_CALL
+
+CAPTURE = """Starting iterative violation minimization...
+=== Iteration 1 ===
+**Detected 2 failing LTL properties.**
+**Violations:** ['-- specification  G (motion -> F light = on)  is false', '-- specification  G !fan  is false']
+LLM Response:
+MODULE main
+VAR
+    light : boolean;
+Model successfully regenerated and saved to `model.smv`.
+=== Iteration 2 ===
+No violations detected
+"""
+
+
+def write_capture(directory, name="llama-violation-result-3-2-1.txt"):
+    # PowerShell captures: UTF-16 LE with a BOM and CRLF line endings
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-16", newline="\r\n") as f:
+        f.write(CAPTURE)
+    return path
+
+
+def test_parse_utf16_capture(tmp_path):
+    path = write_capture(tmp_path)
+    with open(path, "rb") as f:
+        assert f.read(2) == b"\xff\xfe"
+
+    [run] = parse_log(path)
+    assert run["status"] == "finished"
+    assert run["iterations"] == 2
+    kinds = [event["kind"] for event in run["events"]]
+    assert kinds.count(ITERATION_START) == 2
+
+    verifier = [event for event in run["events"] if event["kind"] == VERIFIER_CALL]
+    assert verifier[0]["model"] is None
+    assert verifier[0]["data"]["failed"] == ["G (motion -> F light = on)", "G !fan"]
+    # The second iteration verifies the model returned in the first
+    [response] = [event for event in run["events"] if event["kind"] == LLM_CALL]
+    assert response["texts"]["response"] == "MODULE main\nVAR\n    light : boolean;"
+    assert verifier[1]["model"] == response["texts"]["response"]
+    assert "\r" not in verifier[1]["model"]
+
+
+def test_parse_utf8_log_and_appended_runs(tmp_path):
+    path = tmp_path / "gwen-violation-result-1-1.txt"
+    path.write_text(CAPTURE + CAPTURE, encoding="utf-8")
+    runs = parse_log(str(path))
+    assert [run["attempt"] for run in runs] == [1, 2]
+
+
+def test_import_is_idempotent(tmp_path):
+    write_capture(tmp_path)
+    (tmp_path / "notes.txt").write_text("not a log")
+    assert find_logs([str(tmp_path)]) == [str(tmp_path / "llama-violation-result-3-2-1.txt")]
+
+    store = str(tmp_path / "runs.sqlite")
+    assert import_logs(store, [str(tmp_path)], workers=1)["runs"] == 1
+    again = import_logs(store, [str(tmp_path)], workers=1)
+    assert (again["runs"], again["skipped"]) == (0, 1)
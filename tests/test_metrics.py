@@ -0,0 +1,61 @@
+import json
+import os
+
+import metrics
+from metrics import Registry, collect, merge, render
+
+
+def test_render_counters_and_histograms():
+    registry = Registry()
+    calls = registry.counter("demo_calls_total", "Calls", ("outcome",))
+    seconds = registry.histogram("demo_seconds", "Wall time", (1, 2.5))
+    calls.inc(outcome="ok")
+    calls.inc(2, outcome="ok")
+    calls.inc(outcome="error")
+    for value in (0.5, 2, 2.5, 9):
+        seconds.observe(value)
+
+    text = render(merge([registry.snapshot()]))
+    assert text.splitlines() == [
+        "# HELP demo_calls_total Calls",
+        "# TYPE demo_calls_total counter",
+        'demo_calls_total{outcome="error"} 1',
+        'demo_calls_total{outcome="ok"} 3',
+        "# HELP demo_seconds Wall time",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{le="1"} 1',
+        'demo_seconds_bucket{le="2.5"} 3',
+        'demo_seconds_bucket{le="+Inf"} 4',
+        "demo_seconds_sum 14",
+        "demo_seconds_count 4",
+    ]
+
+
+def test_merge_sums_worker_snapshots():
+    first, second = Registry(), Registry()
+    for registry, amount in ((first, 2), (second, 5)):
+        registry.counter("demo_tokens_total", "Tokens", ("kind",)).inc(amount, kind="prompt")
+        registry.histogram("demo_seconds", "Wall time", (1,)).observe(amount / 10)
+    # Snapshots travel between processes as JSON
+    merged = merge(json.loads(json.dumps(snapshot)) for snapshot in (first.snapshot(), second.snapshot()))
+    assert merged["demo_tokens_total"]["values"] == {("prompt",): 7}
+    assert merged["demo_seconds"]["values"][()] == [2, 0, 0.7, 2]
+
+
+def test_collect_derives_queue_depth(tmp_path, monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    total = registry.gauge(metrics.JOBS_TOTAL.name, "Jobs")
+    registry.gauge(metrics.JOBS_QUEUED.name, "Queued")
+    completed = registry.counter(metrics.JOBS_COMPLETED.name, "Done", ("status",))
+    total.set(5)
+    completed.inc(status="safe")
+
+    worker = Registry()
+    worker.gauge(metrics.JOBS_RUNNING.name, "Running").set(2)
+    with open(os.path.join(tmp_path, "worker-1.json"), "w") as f:
+        json.dump(worker.snapshot(), f)
+    (tmp_path / "worker-2.json").write_text("{truncated")
+
+    merged = collect(str(tmp_path))
+    assert merged[metrics.JOBS_QUEUED.name]["values"] == {(): 2}
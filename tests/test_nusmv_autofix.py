@@ -0,0 +1,123 @@
+from nusmv_autofix import (autofix_model, declare_enum_literals, drop_duplicate_main,
+                           fix_next_in_ltlspec, strip_prose, terminate_esac, trans_to_assign, wrap_range_overflow)
+from nusmv_model import parse_nusmv_model
+
+MODEL = """MODULE main
+VAR
+    motion : boolean;
+    light : {off, on};
+ASSIGN
+    init(light) := off;
+    next(light) := case
+        motion : on;
+        TRUE : light;
+    esac;
+LTLSPEC G (motion -> F light = on);
+"""
+
+
+SYNTAX_ERROR = 'file generated_model.smv: line 5: at token "esac": syntax error\n'
+
+
+def test_clean_model_is_left_unchanged():
+    assert autofix_model(MODEL, SYNTAX_ERROR) == (MODEL, [])
+
+
+def test_model_nusmv_accepts_is_returned_unchanged():
+    # Regression: next() without init() is valid NuSMV (any initial value), and a counter
+    # that overflows is only an error once NuSMV reports it; neither may be rewritten
+    text = MODEL.replace("    init(light) := off;\n", "").replace(
+        "    motion : boolean;\n", "    motion : boolean;\n    time : 0..23;\n") + "ASSIGN\n    next(time) := time + 1;\n"
+    accepted = "*** This is NuSMV 2.6.0\n-- specification G (motion -> F light = on)  is true\n"
+    assert autofix_model(text, accepted) == (text, [])
+    assert autofix_model(text, "") == (text, [])
+
+
+def test_rules_run_only_on_their_error():
+    text = "MODULE main\nVAR\n    time : 0..23;\nASSIGN\n    init(time) := 0;\n    next(time) := time + 1;\n"
+    assert autofix_model(text, SYNTAX_ERROR) == (text, [])
+    fixed, applied = autofix_model(text, 'file m.smv: line 6: cannot assign value 24 to variable time\n')
+    assert applied == ["range-overflow: wrapped next(time) within its range"]
+
+
+def test_strip_prose_removes_preamble_and_sentences():
+    text = "Here is the corrected model:\n" + MODEL.replace("ASSIGN\n", "ASSIGN\nThe light follows the motion sensor.\n")
+    fixed, notes = strip_prose(text)
+    assert fixed == MODEL
+    assert notes == ["removed text before MODULE", "removed 1 prose line(s)"]
+
+
+def test_strip_prose_keeps_comments_before_module():
+    header = "-- Smart home model\n-- generated for case 1-1\n"
+    fixed, notes = strip_prose("Here is the model:\n" + header + MODEL)
+    assert fixed == header + MODEL
+    assert notes == ["removed text before MODULE"]
+    assert strip_prose(header + MODEL) == (header + MODEL, [])
+
+
+def test_drop_duplicate_main_keeps_most_complete_module():
+    partial = "MODULE main\nVAR\n    motion : boolean;\n"
+    fixed, notes = drop_duplicate_main(partial + MODEL)
+    assert fixed == MODEL
+    assert notes == ["kept 1 of 2 MODULE main definitions"]
+
+
+def test_wrap_range_overflow():
+    text = "MODULE main\nVAR\n    time : 0..23;\nASSIGN\n    init(time) := 0;\n    next(time) := time + 1;\n"
+    fixed, notes = wrap_range_overflow(text)
+    assert "next(time) := (time + 1) mod 24;" in fixed
+    assert notes == ["wrapped next(time) within its range"]
+    for guard in ("time < 23 : time + 1; TRUE : 0;", "time = 23 : 0; TRUE : time + 1;",
+                  "time >= 23 : 0; TRUE : time + 1;", "time > 22 : 0; TRUE : time + 1;"):
+        guarded = text.replace("time + 1;", f"case {guard} esac;")
+        assert wrap_range_overflow(guarded) == (guarded, [])
+
+
+def test_declare_enum_literals_adds_undeclared_values():
+    text = MODEL.replace("        TRUE : light;", "        !motion : dimmed;\n        TRUE : light;")
+    fixed, notes = declare_enum_literals(text)
+    assert "light : {off, on, dimmed};" in fixed
+    assert notes == ["declared dimmed for light"]
+
+
+def test_declare_enum_literals_ignores_define_symbols_and_constants():
+    # Regression: a DEFINE symbol used as a value was declared as a literal, creating a name clash
+    text = MODEL.replace("ASSIGN\n", "DEFINE\n    fallback := off;\nCONSTANTS standby;\nASSIGN\n").replace(
+        "        TRUE : light;", "        !motion : fallback;\n        light = standby : on;\n        TRUE : light;")
+    assert declare_enum_literals(text) == (text, [])
+
+
+def test_fix_next_in_ltlspec():
+    text = MODEL.replace("LTLSPEC G (motion -> F light = on);", "LTLSPEC G (motion -> next(light = on));")
+    fixed, notes = fix_next_in_ltlspec(text)
+    assert "LTLSPEC G (motion -> X (light = on));" in fixed
+    assert notes == ["replaced next() with X () in an LTLSPEC"]
+
+
+def test_terminate_esac_and_trans_to_assign():
+    text = MODEL.replace("    esac;", "    esac").replace("ASSIGN", "TRANS")
+    fixed, applied = autofix_model(text, SYNTAX_ERROR)
+    assert fixed == MODEL
+    assert applied == ["trans-to-assign: renamed TRANS with assignments to ASSIGN", "esac-terminator: terminated 1 esac"]
+    assert terminate_esac(MODEL) == (MODEL, [])
+    assert trans_to_assign(MODEL) == (MODEL, [])
+
+
+def test_phase1_only_autofixes_models_nusmv_rejects(monkeypatch, tmp_path):
+    import main
+
+    unpinned = MODEL.replace("    init(light) := off;\n", "")
+    broken = "Here is the model:\n" + unpinned
+    checked = []
+
+    def validate(model_file):
+        with open(model_file) as f:
+            checked.append(f.read())
+        return (False, SYNTAX_ERROR) if checked[-1].startswith("Here") else (True, "Model is syntactically valid")
+
+    monkeypatch.setattr(main, "validate_nusmv_syntax", validate)
+    output_file = str(tmp_path / "model.smv")
+    for reply in (unpinned, broken):
+        monkeypatch.setattr(main, "generate_nusmv_model", lambda scenarios, properties: reply)
+        assert main.generate_valid_nusmv_model(["s"], ["p"], output_file=output_file) == unpinned
+    assert checked == [unpinned, broken, unpinned]
@@ -0,0 +1,92 @@
+import pytest
+
+from nusmv_model import (ModelEditError, apply_llm_edits, apply_model_edits, cone_of_influence, numbered_specs,
+                         parse_model_edits, parse_nusmv_model, promote_invariants)
+
+MODEL = """MODULE main
+VAR
+    motion : boolean;
+    light : {off, on};
+    fan : {off, on};
+ASSIGN
+    init(light) := off;
+    next(light) := case
+        motion : on;
+        TRUE : light;
+    esac;
+    next(fan) := case
+        light = on : on;
+        TRUE : fan;
+    esac;
+LTLSPEC G (motion -> F light = on);
+LTLSPEC G (fan = on -> light = on);
+"""
+
+
+def test_parse_nusmv_model_blocks():
+    model = parse_nusmv_model(MODEL)
+    assert list(model["variables"]) == ["motion", "light", "fan"]
+    assert model["variables"]["light"]["type"] == "{off, on}"
+    assert list(model["init"]) == ["light"]
+    assert model["next"]["fan"]["text"].strip().endswith("esac;")
+    assert [spec["kind"] for spec in model["specs"]] == ["LTLSPEC", "LTLSPEC"]
+    assert numbered_specs(MODEL).splitlines()[1] == "2. LTLSPEC G (fan = on -> light = on);"
+
+
+def test_parse_model_edits():
+    response = ("@@ REPLACE next(light)\nnext(light) := on;\n@@ END\n"
+                "@@ DELETE LTLSPEC 2\n@@ END\n@@ ADD VAR door\ndoor : boolean;\n@@ END")
+    assert parse_model_edits(response) == [
+        ("REPLACE", "next", "light", "next(light) := on;"),
+        ("DELETE", "LTLSPEC", "2", ""),
+        ("ADD", "VAR", "door", "door : boolean;"),
+    ]
+    assert parse_model_edits("MODULE main\nVAR\n") == []
+
+
+def test_apply_model_edits_replaces_adds_and_deletes():
+    edits = [
+        ("REPLACE", "next", "fan", "next(fan) := case\n    motion : on;\n    TRUE : off;\nesac;"),
+        ("ADD", "init", "fan", "init(fan) := off;"),
+        ("ADD", "VAR", "door", "door : boolean;"),
+        ("DELETE", "LTLSPEC", "1", ""),
+    ]
+    model = parse_nusmv_model(apply_model_edits(MODEL, edits))
+    assert model["variables"]["door"]["type"] == "boolean"
+    assert model["init"]["fan"]["text"] == "    init(fan) := off;"
+    assert "        motion : on;" in model["next"]["fan"]["text"]
+    assert [spec["text"] for spec in model["specs"]] == ["LTLSPEC G (fan = on -> light = on);"]
+    # Untouched blocks keep their text
+    assert model["next"]["light"]["text"] == parse_nusmv_model(MODEL)["next"]["light"]["text"]
+
+
+def test_apply_model_edits_rejects_missing_targets():
+    with pytest.raises(ModelEditError):
+        apply_model_edits(MODEL, [("REPLACE", "LTLSPEC", "3", "LTLSPEC G TRUE;")])
+    with pytest.raises(ModelEditError):
+        apply_model_edits(MODEL, [("DELETE", "next", "door", "")])
+
+
+def test_apply_llm_edits_accepts_whole_models_and_rejects_prose():
+    assert apply_llm_edits(MODEL, MODEL) == MODEL
+    assert apply_llm_edits(MODEL, "I could not fix this model.") is None
+    assert apply_llm_edits(MODEL, "") is None
+    fixed = apply_llm_edits(MODEL, "@@ REPLACE LTLSPEC 1\nLTLSPEC G (motion -> light = on);\n@@ END")
+    assert "LTLSPEC G (motion -> light = on);" in fixed
+
+
+def test_cone_of_influence_follows_assignment_guards():
+    model = parse_nusmv_model(MODEL)
+    assert cone_of_influence(model, {"fan"}, depth=1) == {"fan", "light"}
+    assert cone_of_influence(model, {"fan"}) == {"fan", "light", "motion"}
+
+
+def test_promote_invariants_rewrites_propositional_globally_specs():
+    text = MODEL + "LTLSPEC G (light = off | motion);  -- lights\nLTLSPEC G ((fan = on) & X (fan = on));\n"
+    promoted, count = promote_invariants(text)
+    assert count == 2
+    assert "INVARSPEC light = off | motion;  -- lights" in promoted
+    # Temporal bodies and G (p) -> (q) (not one parenthesized body) are kept as LTL
+    assert "LTLSPEC G ((fan = on) & X (fan = on));" in promoted
+    assert "LTLSPEC G (motion -> F light = on);" in promoted
+    assert promote_invariants("LTLSPEC G (a) -> (b);\n") == ("LTLSPEC G (a) -> (b);\n", 0)
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+import main
+from llm_backends import BackendRouter
+from rate_limit import RequestCancelled
+
+
+def verdict(failed):
+    return {"syntax_ok": True, "failed": list(failed), "passed": ["G safe"],
+            "violations": [f"-- specification {spec}  is false" for spec in failed], "elapsed": 0.01}
+
+
+class FullVerdict:
+    """Full verification that finishes once the speculative repair of its model is running."""
+
+    def __init__(self, model, failed):
+        self.model = model
+        self.failed = failed
+
+    def result(self):
+        FakePool.repairing[self.model].wait(5)
+        return verdict(self.failed)
+
+
+class FakePool:
+    """Falsifier and full verdicts per model text, in place of NuSMV."""
+
+    verdicts = {}
+    repairing = {}
+
+    def __init__(self, **options):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def verify(self, model, options=()):
+        return verdict(self.verdicts[model][0])
+
+    def submit(self, model):
+        return FullVerdict(model, self.verdicts[model][1])
+
+
+class BlockingBackend:
+    """Answers only after `release` is set; records whether the call was cancelled."""
+
+    name = "blocking"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+
+    def complete(self, messages, max_tokens=5000, temperature=0.0, cancel_event=None, timeout=None):
+        while not self.release.wait(0.01):
+            if cancel_event.is_set():
+                self.cancelled.set()
+                raise RequestCancelled("cancelled")
+        return {"text": "MODULE main", "prompt_tokens": 1, "completion_tokens": 1}
+
+
+def test_router_cancels_in_flight_call():
+    backend = BlockingBackend()
+    router = BackendRouter([backend])
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    began = time.perf_counter()
+    with pytest.raises(RequestCancelled):
+        router.complete([{"role": "user", "content": "fix"}], cancel_event=cancel)
+    assert time.perf_counter() - began < 2
+    assert backend.cancelled.wait(2)
+
+
+def test_discarded_speculative_repairs_are_cancelled(monkeypatch, tmp_path):
+    # Iteration 1: the falsifier misses a violation (miss); iteration 2: the repaired model is safe (skipped)
+    FakePool.verdicts = {"model-1": (["G a"], ["G a", "G b"]), "model-2": (["G a"], [])}
+    FakePool.repairing = {model: threading.Event() for model in FakePool.verdicts}
+    monkeypatch.setattr(main, "VerifierPool", FakePool)
+    started = []
+
+    def regenerate(model, violations, scenarios, properties, edit_mode="full", cancel_event=None):
+        if cancel_event is None:
+            return "model-2"
+        started.append(model)
+        FakePool.repairing[model].set()
+        # A speculative repair only ends when it is cancelled
+        if not cancel_event.wait(5):
+            raise AssertionError("speculative repair was not cancelled")
+        raise RequestCancelled("cancelled")
+
+    monkeypatch.setattr(main, "regenerate_model_from_violations", regenerate)
+    input_model = tmp_path / "model.smv"
+    input_model.write_text("model-1")
+    run_record = {"case": "1-1"}
+
+    final = main.minimize_violations_pipelined(str(input_model), str(tmp_path / "out.smv"), ["s"], ["p"],
+                                               max_iterations=3, run_record=run_record)
+    assert final == "model-2"
+    assert started == ["model-1", "model-2"]
+    stats = run_record["speculation"]
+    assert (stats["hits"], stats["misses"], stats["skipped"]) == (0, 1, 1)
+    assert (stats["cancelled"], stats["wasted"]) == (2, 0)
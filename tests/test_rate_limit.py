@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from rate_limit import AIMDLimiter, RequestCancelled, parse_retry_after, retry_policy
+
+
+class StatusError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def test_window_grows_additively_and_halves_on_throttle():
+    limiter = AIMDLimiter(initial_limit=4, cooldown=0.0)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.window == 5
+    limiter.on_throttle()
+    assert limiter.window == 2
+    for _ in range(10):
+        limiter.on_throttle()
+    assert limiter.window == limiter.min_limit
+
+
+def test_throttles_within_cooldown_decrease_once():
+    limiter = AIMDLimiter(initial_limit=8, cooldown=60.0)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.window == 4
+    assert limiter.throttles == 2
+
+
+def test_call_retries_throttled_failures_then_succeeds():
+    limiter = AIMDLimiter(initial_limit=4, max_retries=3, cooldown=0.0)
+    failures = [StatusError(429, retry_after=0), StatusError(503, retry_after=0)]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert limiter.report() == {"window": 2, "in_flight": 0, "successes": 1, "throttles": 2, "retries": 2}
+
+
+def test_call_raises_non_retryable_errors_immediately():
+    limiter = AIMDLimiter(max_retries=3)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        limiter.call(bad_request)
+    assert len(calls) == 1
+    assert limiter.in_flight == 0
+
+
+def test_acquire_is_cancelled_while_the_window_is_full():
+    limiter = AIMDLimiter(initial_limit=1)
+    limiter.acquire()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(RequestCancelled):
+        limiter.acquire(cancel)
+
+
+def test_retry_policy_and_retry_after_parsing():
+    assert retry_policy(StatusError(429, retry_after=2.0)) == (True, True, 2.0)
+    assert retry_policy(StatusError(502)) == (True, False, None)
+    assert retry_policy(ConnectionError("reset")) == (True, False, None)
+    assert retry_policy(ValueError("bad")) == (False, False, None)
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0.0
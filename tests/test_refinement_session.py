@@ -0,0 +1,86 @@
+import main
+
+MODEL = """MODULE main
+VAR
+    light : boolean;
+ASSIGN
+    init(light) := FALSE;
+    next(light) := case
+        TRUE : !light;
+    esac;
+LTLSPEC G !light;
+"""
+
+FIXED = MODEL.replace("TRUE : !light;", "TRUE : FALSE;")
+
+# Refers to a specification the model does not have, so it cannot be applied
+BROKEN_EDIT = "@@ REPLACE LTLSPEC 7\nLTLSPEC G TRUE;\n@@ END"
+
+VIOLATIONS = ["-- specification G !light  is false\n  -> State: 1.2 <-\n    light = TRUE"]
+
+
+def fake_llm(replies, calls):
+    def invoke(messages, max_tokens=5000, label="", temperature=0.0):
+        calls.append({"messages": messages, "max_tokens": max_tokens, "label": label})
+        return replies.pop(0)
+    return invoke
+
+
+def test_patch_session_applies_edits(monkeypatch):
+    calls = []
+    edit = "@@ REPLACE next(light)\nnext(light) := case\n    TRUE : FALSE;\nesac;\n@@ END"
+    monkeypatch.setattr(main, "invoke_vllm_chat", fake_llm([edit], calls))
+    session = main.RefinementSession(["s"], ["p"], edit_mode="patch")
+    assert "TRUE : FALSE;" in session.request_repair(MODEL, VIOLATIONS)
+    assert len(calls) == 1
+
+
+def test_patch_session_falls_back_to_whole_model(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "invoke_vllm_chat", fake_llm([BROKEN_EDIT, FIXED], calls))
+    session = main.RefinementSession(["s"], ["p"], edit_mode="patch")
+
+    assert session.request_repair(MODEL, VIOLATIONS) == FIXED.strip()
+    assert len(calls) == 2
+    retry = calls[1]
+    assert retry["max_tokens"] > main.PATCH_MAX_TOKENS
+    assert retry["messages"][-2] == {"role": "assistant", "content": BROKEN_EDIT}
+    assert "complete revised NuSMV model" in retry["messages"][-1]["content"]
+    # The conversation continues from the whole model the LLM returned
+    assert session.turns[-1]["reply"] == FIXED.strip()
+
+
+def test_patch_session_gives_up_when_fallback_fails(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "invoke_vllm_chat", fake_llm([BROKEN_EDIT, None], calls))
+    session = main.RefinementSession(["s"], ["p"], edit_mode="patch")
+    assert session.request_repair(MODEL, VIOLATIONS) is None
+    assert len(calls) == 2
+    assert not session.turns
+
+
+def test_session_history_is_an_append_only_prefix(monkeypatch):
+    calls = []
+    second = FIXED.replace("init(light) := FALSE;", "init(light) := TRUE;")
+    monkeypatch.setattr(main, "invoke_vllm_chat", fake_llm([FIXED, second], calls))
+    session = main.RefinementSession(["s"], ["p"])
+
+    session.request_repair(MODEL, VIOLATIONS)
+    session.request_repair(FIXED, VIOLATIONS)
+    first, later = calls[0]["messages"], calls[1]["messages"]
+    assert later[:len(first)] == first
+    assert later[len(first)] == {"role": "assistant", "content": FIXED.strip()}
+    # Follow-up turns send only the violations, not the model again
+    assert "MODULE main" not in later[-1]["content"]
+
+
+def test_session_drops_oldest_turns_beyond_max_turns(monkeypatch):
+    monkeypatch.setattr(main, "invoke_vllm_chat", fake_llm([FIXED] * 3, []))
+    session = main.RefinementSession(["s"], ["p"], max_turns=1)
+    for _ in range(3):
+        session.request_repair(MODEL, VIOLATIONS)
+    messages, _ = session.build_messages(MODEL, VIOLATIONS)
+
+    assert len(session.turns) == 1
+    assert len(session.dropped_counts) == 2
+    assert "Earlier repair turns omitted; violation counts were 1 -> 1" in messages[1]["content"]
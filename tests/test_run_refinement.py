@@ -0,0 +1,38 @@
+import main
+from checkpoint import RUNNING, checkpoint_path, save_checkpoint
+from deadline import DeadlineExceeded
+
+MODEL = "MODULE main\nVAR\n    light : boolean;\n"
+
+
+def new_record():
+    return {"case": "1-1", "edit_mode": "full", "session_mode": False, "samples": 1, "pipelined": False}
+
+
+def test_deadline_stop_is_reported_as_stopped(monkeypatch, tmp_path):
+    # Regression: the partial model came back like a finished one and was reported as a success
+    monkeypatch.chdir(tmp_path)
+
+    def refine_until_deadline(run_record, *args):
+        save_checkpoint({"case": "1-1", "status": RUNNING, "phase": "phase2", "iteration": 3, "model": MODEL},
+                        checkpoint_path("1-1"))
+        raise DeadlineExceeded("deadline reached before LLM call")
+
+    monkeypatch.setattr(main, "refine_case", refine_until_deadline)
+    valid_model, final_model, status = main.run_refinement(new_record(), ["s"], ["p"], output_model="final.smv")
+    assert (valid_model, final_model, status) == (MODEL, MODEL, "stopped")
+    assert (tmp_path / "final.smv").read_text() == MODEL
+
+
+def test_status_reflects_the_last_phase2_iteration(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    input_model = tmp_path / "input.smv"
+    input_model.write_text(MODEL)
+    for violations, expected in ((0, "safe"), (2, "violations")):
+        def minimize(*args, run_record=None, **kwargs):
+            run_record.setdefault("phase2", []).append({"iteration": 1, "violations": violations})
+            return MODEL
+
+        monkeypatch.setattr(main, "minimize_violations_with_llm", minimize)
+        assert main.run_refinement(new_record(), ["s"], ["p"], input_model=str(input_model)) == \
+            (MODEL, MODEL, expected)
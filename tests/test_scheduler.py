@@ -0,0 +1,59 @@
+from scheduler import CaseProgress, IterationScheduler
+
+
+def case_steps(counts, model):
+    """A step generator yielding the given violation counts; done when a count reaches 0."""
+    for count in counts:
+        yield {"violations": count, "model": f"{model}-{count}", "done": count == 0}
+    return f"{model}-final"
+
+
+def test_expected_gain_prefers_improving_cases():
+    scheduler = IterationScheduler(min_iterations=2)
+    improving, stuck = CaseProgress("a", None), CaseProgress("b", None)
+    improving.history, improving.iterations = [8, 6, 4], 3
+    stuck.history, stuck.iterations = [8, 8, 8], 3
+    assert scheduler.expected_gain(improving) > scheduler.expected_gain(stuck)
+    assert scheduler.expected_gain(CaseProgress("new", None)) == float("inf")
+
+
+def test_run_finishes_cases_and_reports_results():
+    scheduler = IterationScheduler()
+    scheduler.add("quick", case_steps([2, 0], "quick"))
+    scheduler.add("slow", case_steps([5, 4, 3, 0], "slow"))
+    report = scheduler.run()
+    assert report["quick"]["status"] == "finished"
+    assert report["quick"]["model"] == "quick-final"
+    assert report["slow"]["iterations"] == 4
+    assert report["slow"]["violations"] == 0
+
+
+def test_budget_stops_unfinished_cases_with_their_last_model():
+    scheduler = IterationScheduler(iteration_budget=3, min_iterations=1)
+    scheduler.add("stuck", case_steps([5] * 10, "stuck"))
+    report = scheduler.run()
+    assert report["stuck"] == {"status": "stopped", "iterations": 3, "violations": 5, "elapsed": report["stuck"]["elapsed"],
+                               "model": "stuck-5"}
+
+
+def test_starved_case_is_picked_despite_lower_gain():
+    scheduler = IterationScheduler(min_iterations=1, max_wait=3)
+    scheduler.add("improving", None)
+    scheduler.add("stuck", None)
+    improving, stuck = scheduler.cases["improving"], scheduler.cases["stuck"]
+    improving.history, improving.iterations, improving.last_run = [8, 4, 2], 3, 5
+    stuck.history, stuck.iterations, stuck.last_run = [8, 8], 2, 2
+    scheduler.tick = 4
+    assert scheduler.pick() is improving
+    scheduler.tick = 5
+    assert scheduler.pick() is stuck
+
+
+def test_failing_case_is_marked_as_error():
+    def broken():
+        yield {"violations": 3}
+        raise RuntimeError("backend down")
+
+    scheduler = IterationScheduler()
+    scheduler.add("broken", broken())
+    assert scheduler.run()["broken"]["status"] == "error"
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+import token_budget
+from token_budget import (COMPACTION_STEPS, TokenBudgetExceeded, TokenLedger, count_tokens, fit_prompt,
+                          truncate_trace)
+
+TRACE = "\n".join(f"    line {i}" for i in range(40))
+
+
+def build(trace_lines, max_violations):
+    violations = [f"Violation {i}:\n{truncate_trace(TRACE, trace_lines)}" for i in range(max_violations)]
+    return "Repair this model.\n" + "\n\n".join(violations)
+
+
+def test_truncate_trace_keeps_first_lines():
+    assert truncate_trace("a\n\nb\nc", 5) == "a\nb\nc"
+    assert truncate_trace(TRACE, 2).splitlines() == ["    line 0", "    line 1",
+                                                    "-- ... (38 more lines omitted)"]
+
+
+def test_every_compaction_step_shrinks_the_prompt():
+    # A step that builds the same prompt as the one before it is wasted work
+    sizes = [count_tokens(build(*step)) for step in COMPACTION_STEPS]
+    assert sizes == sorted(sizes, reverse=True)
+    assert len(set(sizes)) == len(sizes)
+
+
+def test_fit_prompt_returns_first_step_that_fits():
+    sizes = [count_tokens(build(*step)) for step in COMPACTION_STEPS]
+    prompt, tokens, step = fit_prompt(build, sizes[0])
+    assert step == 0 and tokens == sizes[0]
+    prompt, tokens, step = fit_prompt(build, sizes[2])
+    assert step == 2 and prompt == build(*COMPACTION_STEPS[2])
+
+
+def test_fit_prompt_returns_most_compact_prompt_when_nothing_fits():
+    prompt, tokens, step = fit_prompt(build, 1)
+    assert step == len(COMPACTION_STEPS) - 1
+    assert prompt == build(*COMPACTION_STEPS[-1])
+    assert tokens > 1
+
+
+def test_ledger_caps_max_tokens_by_remaining_budget():
+    ledger = TokenLedger(run_budget=400, case_budget=300)
+    ledger.begin_case("1-1")
+    assert ledger.reserve(100, 5000) == 200
+    ledger.record(100, 150, "generate")
+    ledger.release(100, 200)
+    assert ledger.case_tokens() == 250
+    with pytest.raises(TokenBudgetExceeded):
+        ledger.reserve(60, 5000)
+
+    # The run budget still applies after switching cases
+    ledger.begin_case("1-2")
+    assert ledger.case_tokens() == 0
+    assert ledger.remaining() == 150
+    assert ledger.reserve(100, 5000) == 50
+
+
+def test_ledger_usage_since_marker():
+    ledger = TokenLedger()
+    ledger.begin_case("1-1")
+    ledger.record(10, 5)
+    marker = ledger.snapshot()
+    ledger.record(20, 7, "regenerate")
+    ledger.record(30, 9, "regenerate")
+    assert ledger.usage_since(marker) == {"llm_calls": 2, "prompt_tokens": 50, "completion_tokens": 16}
+    assert ledger.reserve(10**6, 5000) == 5000  # unlimited
+
+
+def test_concurrent_reservations_share_the_budget():
+    # Regression: reserve() only checked the budget, so calls in flight together could overshoot it
+    ledger = TokenLedger(case_budget=1000)
+    ledger.begin_case("1-1")
+    barrier = threading.Barrier(8)
+    granted = []
+    lock = threading.Lock()
+
+    def call():
+        barrier.wait()
+        try:
+            max_tokens = ledger.reserve(100, 300)
+        except TokenBudgetExceeded:
+            return
+        with lock:
+            granted.append(100 + max_tokens)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(granted) <= 1000
+    assert ledger.remaining() == 1000 - sum(granted)
+
+    ledger.release(100, 300)
+    assert ledger.remaining() == 1400 - sum(granted)
+
+
+def test_count_tokens_falls_back_to_characters(monkeypatch):
+    monkeypatch.setattr(token_budget, "_token_encoding", False)
+    assert count_tokens("x" * 40) == 10
+    assert count_tokens(None) == 0
@@ -0,0 +1,78 @@
+import json
+
+import nusmv_benchmark
+import verifier
+from verifier import NUSMV_FAILED, NUSMV_NOT_FOUND, VerdictCache, VerifierPool, is_tool_error, verdict_from_output
+from workspace import Workspace
+
+MODEL = """MODULE main
+VAR
+    x : boolean;
+ASSIGN
+    init(x) := FALSE;
+LTLSPEC G !x;
+"""
+
+OUTPUT = """-- specification  G !x  is true
+-- specification  G x  is false
+-- as demonstrated by the following execution sequence
+Trace Type: Counterexample
+  -> State: 1.1 <-
+    x = FALSE
+"""
+
+
+def test_verdict_from_output_counts_specs():
+    verdict = verdict_from_output(OUTPUT, elapsed=0.5)
+    assert verdict["syntax_ok"]
+    assert not verdict["tool_error"]
+    assert verdict["passed"] == ["G !x"]
+    assert verdict["failed"] == ["G x"]
+    assert verdict["violations"][0].startswith("-- specification  G x  is false")
+
+
+def test_missing_binary_is_a_tool_error():
+    verdict = verdict_from_output(NUSMV_NOT_FOUND)
+    assert verdict["tool_error"]
+    assert not verdict["syntax_ok"]
+    assert is_tool_error(f"{NUSMV_FAILED}: killed by signal 9\n")
+    assert not is_tool_error(OUTPUT)
+
+
+def test_cache_skips_tool_errors_and_timeouts(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache.sqlite"))
+    cache.put(MODEL, verdict_from_output(NUSMV_NOT_FOUND))
+    cache.put(MODEL, verdict_from_output("", timed_out=True), options=("-bmc",))
+    assert cache.get(MODEL) is None
+    assert cache.get(MODEL, ("-bmc",)) is None
+    cache.put(MODEL, verdict_from_output(OUTPUT))
+    assert cache.get(MODEL)["failed"] == ["G x"]
+    cache.close()
+
+
+def test_cache_drops_tool_errors_stored_by_older_versions(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache.sqlite"))
+    legacy = {k: v for k, v in verdict_from_output(NUSMV_NOT_FOUND).items() if k not in ("output", "tool_error")}
+    cache.connection.execute("INSERT INTO verdicts (key, verdict) VALUES (?, ?)",
+                             (cache.key(MODEL), json.dumps(legacy)))
+    assert cache.get(MODEL) is None
+    assert cache.connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] == 0
+    cache.close()
+
+
+def test_pool_without_nusmv_caches_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(verifier, "NUSMV_BINARY", str(tmp_path / "no-such-nusmv"))
+    cache = VerdictCache(str(tmp_path / "cache.sqlite"))
+    with VerifierPool(workers=1, workdir=str(tmp_path), cache=cache) as pool:
+        verdict = pool.verify(MODEL)
+    assert verdict["tool_error"]
+    assert cache.connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] == 0
+    cache.close()
+
+
+def test_benchmark_marks_missing_binary_as_tool_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(nusmv_benchmark, "NUSMV_BINARY", str(tmp_path / "no-such-nusmv"))
+    with Workspace(prefix="test-", root=str(tmp_path)) as workspace:
+        row = nusmv_benchmark.measure("m", MODEL, "bdd", workspace)
+    assert row["tool_error"]
+    assert not row["error"]
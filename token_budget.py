@@ -0,0 +1,191 @@
+"""
+Token accounting and budgets for LLM calls.
+
+Every LLM call is recorded in a TokenLedger with its prompt and completion tokens,
+attributed to the case (scenario/property combination) being refined. Per-case and
+per-run budgets are enforced before a request is sent, and oversize prompts are
+compacted deterministically (shorter counterexample traces, then fewer violations)
+instead of being truncated by the server.
+"""
+
+import threading
+
+import tiktoken
+
+_token_encoding = None
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised when a call would exceed the per-case or per-run token budget."""
+
+
+def count_tokens(text):
+    """
+    Count prompt tokens with tiktoken's cl100k_base encoding.
+    This is an approximation for Llama/Qwen tokenizers, but it is consistent across runs.
+    Falls back to ~4 characters per token when the encoding cannot be loaded (offline hosts).
+    """
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Warning: tiktoken encoding unavailable ({e}). Estimating tokens from characters.")
+            _token_encoding = False
+    if not _token_encoding:
+        return len(text or "") // 4
+    return len(_token_encoding.encode(text or ""))
+
+
+def count_message_tokens(messages):
+    """
+    Count tokens of a chat history, including a small per-message overhead.
+    """
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+def truncate_trace(text, max_lines):
+    """
+    Keep the first max_lines non-empty lines of a NuSMV output block.
+    """
+    lines = [line.rstrip() for line in text.split("\n") if line.strip()]
+    if len(lines) <= max_lines:
+        return "\n".join(lines)
+    return "\n".join(lines[:max_lines] + [f"-- ... ({len(lines) - max_lines} more lines omitted)"])
+
+
+# Compaction ladder: each step is (max trace lines per violation, max violations).
+# Steps are tried in order until the prompt fits, so the result only depends on the inputs.
+COMPACTION_STEPS = [
+    (17, 3),
+    (8, 3),
+    (4, 3),
+    (2, 2),
+    (1, 1),
+]
+
+
+def fit_prompt(build_prompt, max_prompt_tokens):
+    """
+    Build a prompt that fits max_prompt_tokens.
+
+    build_prompt(trace_lines, max_violations) must return the prompt text.
+    Returns (prompt, prompt_tokens, step_index); if even the most compact step does not fit,
+    the most compact prompt is returned and the caller's budget check decides.
+    """
+    for step, (trace_lines, max_violations) in enumerate(COMPACTION_STEPS):
+        prompt = build_prompt(trace_lines, max_violations)
+        tokens = count_tokens(prompt)
+        if tokens <= max_prompt_tokens:
+            if step:
+                print(f"Prompt compacted to {tokens} tokens (step {step}: {trace_lines} trace lines, "
+                      f"{max_violations} violation(s))")
+            return prompt, tokens, step
+    print(f"Warning: prompt still {tokens} tokens after compaction (limit {max_prompt_tokens})")
+    return prompt, tokens, len(COMPACTION_STEPS) - 1
+
+
+class TokenLedger:
+    """
+    Records prompt/completion tokens per call and enforces per-case and per-run budgets.
+
+    Calls are attributed to the current case (set with begin_case). A budget of None
+    means unlimited. Calls in flight hold a reservation (reserve/release), so concurrent
+    calls (beam samples, cone repairs) cannot overshoot a budget together.
+    """
+
+    def __init__(self, run_budget=None, case_budget=None):
+        self.run_budget = run_budget
+        self.case_budget = case_budget
+        self.case = None
+        self.calls = []  # dicts: case, label, prompt_tokens, completion_tokens
+        self.totals = {}  # case -> [prompt_tokens, completion_tokens]
+        self.reserved = {}  # case -> tokens reserved by calls in flight
+        self.lock = threading.Lock()  # calls may be reserved and recorded from several threads
+
+    def begin_case(self, case, case_budget=None):
+        """
+        Attribute subsequent calls to `case`, optionally overriding the default case budget.
+        """
+        self.case = case
+        self.totals.setdefault(case, [0, 0])
+        if case_budget is not None:
+            self.case_budget = case_budget
+
+    def case_tokens(self, case=None):
+        prompt_tokens, completion_tokens = self.totals.get(self.case if case is None else case, [0, 0])
+        return prompt_tokens + completion_tokens
+
+    def run_tokens(self):
+        return sum(p + c for p, c in self.totals.values())
+
+    def remaining(self):
+        """
+        Tokens left for the current case, taking both budgets and reservations into account
+        (None if unlimited).
+        """
+        limits = []
+        if self.case_budget is not None:
+            limits.append(self.case_budget - self.case_tokens() - self.reserved.get(self.case, 0))
+        if self.run_budget is not None:
+            limits.append(self.run_budget - self.run_tokens() - sum(self.reserved.values()))
+        return min(limits) if limits else None
+
+    def reserve(self, prompt_tokens, max_tokens):
+        """
+        Check a call before it is sent and return the max_tokens it may use.
+        Raises TokenBudgetExceeded if the prompt alone does not fit the remaining budget.
+        The prompt and the returned max_tokens stay reserved until release() is called
+        with the same prompt_tokens and the returned max_tokens.
+        """
+        with self.lock:
+            remaining = self.remaining()
+            if remaining is not None:
+                if prompt_tokens >= remaining:
+                    raise TokenBudgetExceeded(
+                        f"prompt of {prompt_tokens} tokens exceeds remaining budget of {remaining} tokens "
+                        f"(case {self.case!r}: {self.case_tokens()} used, run: {self.run_tokens()} used)"
+                    )
+                max_tokens = min(max_tokens, remaining - prompt_tokens)
+            self.reserved[self.case] = self.reserved.get(self.case, 0) + prompt_tokens + max_tokens
+            return max_tokens
+
+    def release(self, prompt_tokens, max_tokens):
+        """
+        Drop the reservation of a call once it has been recorded (or has failed).
+        """
+        with self.lock:
+            left = self.reserved.get(self.case, 0) - prompt_tokens - max_tokens
+            if left > 0:
+                self.reserved[self.case] = left
+            else:
+                self.reserved.pop(self.case, None)
+
+    def record(self, prompt_tokens, completion_tokens, label=""):
+        with self.lock:
+            self.totals.setdefault(self.case, [0, 0])
+            self.totals[self.case][0] += prompt_tokens
+            self.totals[self.case][1] += completion_tokens
+            self.calls.append({
+                "case": self.case,
+                "label": label,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens
+            })
+
+    def snapshot(self):
+        """
+        Position marker for usage_since().
+        """
+        return len(self.calls)
+
+    def usage_since(self, marker):
+        """
+        Aggregate the calls recorded after `marker` (from snapshot()).
+        """
+        calls = self.calls[marker:]
+        return {
+            "llm_calls": len(calls),
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in calls)
+        }
@@ -0,0 +1,251 @@
+"""
+Stage-level tracing for the refinement pipeline.
+
+The pipeline only prints progress, so there is no record of where a case's
+minutes go. This module records nested, timed spans (one case → its phases →
+LLM calls, prompt building, cleaning, model writes, NuSMV runs, output parsing)
+with attributes such as token counts, model hashes and specification counts,
+and exports them as:
+- Chrome trace-event JSON (open in chrome://tracing or https://ui.perfetto.dev)
+- folded stacks ("case;phase2;llm 5120000", self time in microseconds) for
+  flamegraph.pl, speedscope or inferno
+
+Tracing is off unless enable() is called (main.py does so when TAPASSURE_TRACE
+is set). While off, span() returns a shared no-op object and traced() functions
+pay one global lookup per call. The null span is falsy, so attributes that are
+expensive to compute can be guarded with `if sp: sp.set(...)`.
+
+Spans opened in worker threads (verifier pools, speculative repairs) start their
+own stacks; the Chrome trace shows them on their own thread tracks.
+
+Usage: TAPASSURE_TRACE=traces/run python main.py   (writes traces/run.json and traces/run.folded)
+       python tracing.py traces/run.json           (per-stage summary of a saved trace)
+"""
+
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+_tracer = None
+
+
+class _NullSpan:
+    """Returned by span() while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+        self.child_time = 0
+
+    def __enter__(self):
+        self.stack = self.tracer._stack()
+        self.stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter_ns() - self.start
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1].child_time += duration
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        path = ";".join([span.name for span in self.stack] + [self.name])
+        self.tracer._record(self, path, duration)
+        return False
+
+    def __bool__(self):
+        return True
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    """
+    Collects finished spans from all threads. Events are kept in memory until exported.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.self_time = defaultdict(int)  # folded stack path -> exclusive nanoseconds
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _record(self, span, path, duration):
+        event = {"name": span.name, "cat": "tapassure", "ph": "X", "pid": os.getpid(),
+                 "tid": threading.get_ident(), "ts": (span.start - self.origin) / 1000, "dur": duration / 1000,
+                 "args": span.attributes}
+        with self.lock:
+            self.events.append(event)
+            self.self_time[path] += duration - span.child_time
+
+    def chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+        threads = {event["tid"]: None for event in events}
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                     "args": {"name": names.get(tid, f"thread-{tid}")}} for tid in threads]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def folded(self):
+        with self.lock:
+            totals = dict(self.self_time)
+        return "".join(f"{path} {round(ns / 1000)}\n" for path, ns in sorted(totals.items()) if ns >= 1000)
+
+
+def enable():
+    """Start recording spans (a fresh tracer each call). Returns the tracer."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    """Stop recording. Returns the tracer that was active (or None), so it can still be exported."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **attributes):
+    """
+    Context manager timing the enclosed block as a span called `name`:
+        with span("nusmv", options="-bmc") as sp:
+            ...
+            sp.set(timed_out=False)
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, attributes)
+
+
+def traced(name):
+    """
+    Decorator: run every call of the function inside span(name).
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return function(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def text_hash(text):
+    """Short content hash for span attributes (model texts, prompts)."""
+    return hashlib.sha256(text.encode()).hexdigest()[:12] if text else None
+
+
+def export(prefix, tracer=None):
+    """
+    Write <prefix>.json (Chrome trace events) and <prefix>.folded (folded stacks, self time
+    in microseconds) for the active tracer, or `tracer`. Returns the two paths, or None if
+    there is nothing to export.
+    """
+    tracer = tracer or _tracer
+    if tracer is None or not tracer.events:
+        return None
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    chrome_file, folded_file = f"{prefix}.json", f"{prefix}.folded"
+    with open(chrome_file, "w") as f:
+        json.dump(tracer.chrome_trace(), f, default=str)
+    with open(folded_file, "w") as f:
+        f.write(tracer.folded())
+    print(f"✓ Trace saved to {chrome_file} and {folded_file} ({len(tracer.events)} spans)")
+    return chrome_file, folded_file
+
+
+def summarize(trace_file):
+    """
+    Per-span-name totals of a saved Chrome trace:
+    {name: {"calls", "total", "self", "max"}}, times in seconds.
+    "self" excludes time spent in nested spans on the same thread.
+    """
+    try:
+        with open(trace_file) as f:
+            events = [event for event in json.load(f)["traceEvents"] if event.get("ph") == "X"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Could not read trace {trace_file}: {e}")
+        return None
+
+    summary = defaultdict(lambda: {"calls": 0, "total": 0.0, "self": 0.0, "max": 0.0})
+    by_thread = defaultdict(list)
+    for event in events:
+        by_thread[event["tid"]].append(event)
+    for thread_events in by_thread.values():
+        # Parents start first (and outlast their children); walk with an open-span stack
+        thread_events.sort(key=lambda event: (event["ts"], -event["dur"]))
+        stack = []
+        for event in thread_events:
+            while stack and stack[-1]["ts"] + stack[-1]["dur"] <= event["ts"]:
+                stack.pop()
+            entry = summary[event["name"]]
+            seconds = event["dur"] / 1e6
+            entry["calls"] += 1
+            entry["total"] += seconds
+            entry["self"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            if stack:
+                summary[stack[-1]["name"]]["self"] -= seconds
+            stack.append(event)
+    return dict(summary)
+
+
+def print_summary(summary):
+    print(f"{'span':<16} {'calls':>7} {'total s':>10} {'self s':>10} {'max s':>9}")
+    for name, entry in sorted(summary.items(), key=lambda item: -item[1]["self"]):
+        print(f"{name:<16} {entry['calls']:>7} {entry['total']:>10.3f} {entry['self']:>10.3f} {entry['max']:>9.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python tracing.py <trace.json>")
+        sys.exit(1)
+    result = summarize(sys.argv[1])
+    if result is None:
+        sys.exit(1)
+    print_summary(result)
@@ -0,0 +1,315 @@
+"""
+NuSMV verification of model texts, with per-specification verdicts and a
+concurrent verifier pool.
+
+ranking.py and reward_training.py score candidates by the number of satisfied
+specifications; this module does the same for the refinement loop in main.py,
+so several LLM candidates can be model-checked at once and ranked.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from deadline import check, time_limit
+from token_budget import truncate_trace
+from metrics import CACHE_LOOKUPS, NUSMV_RUNS, NUSMV_SECONDS
+from tracing import span, text_hash, traced
+from workspace import workspace_root
+
+NUSMV_BINARY = os.getenv("NUSMV", "NuSMV")
+
+# Cheap falsifier: bounded model checking only finds counterexamples up to this depth,
+# but answers much faster than full BDD-based verification on large models
+FALSIFIER_OPTIONS = ("-bmc", "-bmc_length", "10")
+
+# Output of runs where NuSMV itself could not run (missing binary, crash). These say nothing
+# about the model, so their verdicts carry "tool_error" and are never cached.
+NUSMV_NOT_FOUND = "NuSMV not found. Please install NuSMV and add it to PATH."
+NUSMV_FAILED = "NuSMV could not be run"
+
+_SPEC_RESULT = re.compile(r"-- specification\s+(.*?)\s+is\s+(true|false)")
+# NuSMV error lines name the model file ("file /tmp/job-x/model-3.smv: line 12: ..."); match any path
+_ERROR_LINE = re.compile(r"file (.*?): line (\d+): (.+)")
+
+
+def extract_nusmv_violations(nusmv_output, max_trace_lines=15):
+    """
+    Extract violation information and counterexamples from NuSMV output.
+    Each violation is the failing specification line followed by (at most
+    max_trace_lines lines of) its counterexample trace.
+    """
+    violations = []
+    lines = nusmv_output.split('\n')
+
+    for i, line in enumerate(lines):
+        if "is false" in line.lower():
+            # The trace runs until the next specification verdict
+            context_end = i + 1
+            while context_end < len(lines) and "-- specification" not in lines[context_end]:
+                context_end += 1
+            violation_context = '\n'.join(lines[i:context_end])
+            violations.append(truncate_trace(violation_context, max_trace_lines + 1))
+
+    return violations if violations else ["Violation detected but could not extract details"]
+
+
+def parse_spec_results(nusmv_output):
+    """
+    Parse NuSMV output into a list of {"specification", "status"} dicts (as in ranking.py).
+    """
+    return [{"specification": spec.strip(), "status": status}
+            for spec, status in _SPEC_RESULT.findall(nusmv_output)]
+
+
+def parse_error_lines(nusmv_output):
+    """
+    (line_number, message) for each NuSMV error line, whatever the model file was called.
+    """
+    return [(int(line), message.strip()) for _, line, message in _ERROR_LINE.findall(nusmv_output)]
+
+
+def has_syntax_errors(nusmv_output):
+    """
+    Same test as main.validate_nusmv_syntax.
+    """
+    lowered = nusmv_output.lower()
+    return "syntax error" in lowered or ("error:" in lowered and "line" in lowered)
+
+
+def _check_name(options):
+    return "falsifier" if tuple(options) == FALSIFIER_OPTIONS else "verification"
+
+
+def run_nusmv(model_file, timeout=60, options=()):
+    """
+    Run NuSMV on a model file with extra command-line options.
+    Returns (output, elapsed_seconds, timed_out). The timeout is capped by the current
+    deadline (see deadline.py); NuSMV is killed when it expires, and DeadlineExceeded is
+    raised if it was the deadline that ran out. If NuSMV cannot be started or dies from a
+    signal, the output starts with NUSMV_NOT_FOUND or NUSMV_FAILED (see is_tool_error).
+    """
+    start = time.perf_counter()
+    limit = time_limit(timeout, "NuSMV run")
+    try:
+        with span("nusmv", options=" ".join(options)):
+            result = subprocess.run([NUSMV_BINARY, *options, model_file], capture_output=True, text=True,
+                                    timeout=limit)
+        elapsed = time.perf_counter() - start
+        if result.returncode < 0:
+            NUSMV_RUNS.inc(check=_check_name(options), outcome="error")
+            return (f"{NUSMV_FAILED}: killed by signal {-result.returncode}\n" + result.stdout + result.stderr,
+                    elapsed, False)
+        NUSMV_RUNS.inc(check=_check_name(options), outcome="ok")
+        NUSMV_SECONDS.observe(elapsed, check=_check_name(options))
+        return result.stdout + result.stderr, elapsed, False
+    except subprocess.TimeoutExpired:
+        NUSMV_RUNS.inc(check=_check_name(options), outcome="timeout")
+        NUSMV_SECONDS.observe(time.perf_counter() - start, check=_check_name(options))
+        check("NuSMV finished")
+        return "Timeout during verification", time.perf_counter() - start, True
+    except FileNotFoundError:
+        NUSMV_RUNS.inc(check=_check_name(options), outcome="error")
+        return NUSMV_NOT_FOUND, 0.0, False
+    except OSError as e:
+        NUSMV_RUNS.inc(check=_check_name(options), outcome="error")
+        return f"{NUSMV_FAILED}: {e}", 0.0, False
+
+
+def is_tool_error(output):
+    """
+    True if a run_nusmv output reports that NuSMV itself failed, rather than anything about the model.
+    """
+    return output.startswith((NUSMV_NOT_FOUND, NUSMV_FAILED))
+
+
+@traced("parse")
+def verdict_from_output(output, timed_out=False, elapsed=0.0):
+    """
+    Build a verdict dict from NuSMV output:
+    - "syntax_ok": bool
+    - "passed" / "failed": lists of specification texts
+    - "specs": {"specification", "status"} dicts in NuSMV's output order
+    - "violations": counterexamples of failed specs (or error lines for invalid models)
+    - "elapsed", "timed_out", "output"
+    - "tool_error": NuSMV could not run (see is_tool_error); the verdict says nothing about the model
+    """
+    specs = parse_spec_results(output)
+    tool_error = is_tool_error(output)
+    syntax_ok = not timed_out and not tool_error and not has_syntax_errors(output)
+    failed = [s["specification"] for s in specs if s["status"] == "false"]
+    if failed:
+        violations = extract_nusmv_violations(output)
+    elif not syntax_ok:
+        violations = [line.strip() for line in output.split("\n") if "error" in line.lower()][:5] or [output[:500]]
+    else:
+        violations = []
+    return {
+        "syntax_ok": syntax_ok,
+        "passed": [s["specification"] for s in specs if s["status"] == "true"],
+        "failed": failed,
+        "specs": specs,
+        "violations": violations,
+        "elapsed": elapsed,
+        "timed_out": timed_out,
+        "tool_error": tool_error,
+        "output": output
+    }
+
+
+def rank_key(verdict):
+    """
+    Sort key for candidates, best first: syntactically valid, fewest failed specs,
+    most passed specs.
+    """
+    return (0 if verdict["syntax_ok"] else 1, len(verdict["failed"]), -len(verdict["passed"]))
+
+
+def is_safe(verdict):
+    return verdict["syntax_ok"] and not verdict["failed"] and bool(verdict["passed"])
+
+
+def _stored_tool_error(verdict):
+    return verdict.get("tool_error") or any(is_tool_error(violation) for violation in verdict["violations"])
+
+
+class VerdictCache:
+    """
+    Persistent NuSMV verdicts (SQLite), keyed by the model text, the NuSMV options and
+    the NuSMV binary. Editing a specification changes the model text, so re-scoring a
+    corpus only re-runs NuSMV on the models that changed. Timeouts and runs where NuSMV
+    itself failed ("tool_error") are not cached.
+    """
+
+    def __init__(self, path="verdict_cache.sqlite"):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict TEXT)")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_text, options=()):
+        text = "\0".join([NUSMV_BINARY, *options, model_text])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, model_text, options=()):
+        """
+        The cached verdict (with "cached": True and no raw output), or None.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT verdict FROM verdicts WHERE key = ?",
+                                          (self.key(model_text, options),)).fetchone()
+            verdict = json.loads(row[0]) if row else None
+            if verdict is not None and _stored_tool_error(verdict):
+                # Written before tool errors were excluded; drop it so the model is re-verified
+                self.connection.execute("DELETE FROM verdicts WHERE key = ?", (self.key(model_text, options),))
+                self.connection.commit()
+                verdict = None
+            if verdict is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="persistent", result="miss")
+                return None
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="persistent", result="hit")
+        return {**verdict, "output": "", "cached": True}
+
+    def put(self, model_text, verdict, options=()):
+        if verdict["timed_out"] or verdict.get("tool_error"):
+            return
+        stored = {k: v for k, v in verdict.items() if k not in ("output", "cached")}
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO verdicts (key, verdict) VALUES (?, ?)",
+                                    (self.key(model_text, options), json.dumps(stored)))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class VerifierPool:
+    """
+    Run NuSMV on several model texts concurrently.
+
+    Each model is written to its own file in a private working directory (created
+    under workspace.workspace_root(workdir), so on tmpfs with workdir="tmpfs"), so
+    concurrent runs never share a file. Use as a context manager to clean up.
+    on_verdict(model_text, verdict, options), if given, is called after every run
+    (main.py records it in the run store). With a VerdictCache, models verified
+    before are answered from the cache without running NuSMV.
+    """
+
+    def __init__(self, workers=None, timeout=60, workdir=None, on_verdict=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.on_verdict = on_verdict
+        self.cache = cache
+        self.workdir = tempfile.mkdtemp(prefix="nusmv-", dir=workspace_root(workdir))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="nusmv")
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def _model_file(self):
+        with self.lock:
+            self.counter += 1
+            return os.path.join(self.workdir, f"candidate-{self.counter}.smv")
+
+    def verify(self, model_text, options=()):
+        """
+        Model-check one model text and return its verdict (see verdict_from_output).
+        Pass options=FALSIFIER_OPTIONS for a quick bounded search for counterexamples.
+        """
+        with span("verify", options=" ".join(options)) as sp:
+            if sp:
+                sp.set(model_hash=text_hash(model_text))
+            if self.cache:
+                verdict = self.cache.get(model_text, options)
+                if verdict is not None:
+                    sp.set(cached=True, passed=len(verdict["passed"]), failed=len(verdict["failed"]))
+                    return verdict
+            model_file = self._model_file()
+            with span("write"):
+                with open(model_file, "w") as f:
+                    f.write(model_text)
+            try:
+                output, elapsed, timed_out = run_nusmv(model_file, self.timeout, options)
+            finally:
+                os.remove(model_file)
+            verdict = verdict_from_output(output, timed_out, elapsed)
+            sp.set(cached=False, passed=len(verdict["passed"]), failed=len(verdict["failed"]), timed_out=timed_out)
+        if self.cache:
+            self.cache.put(model_text, verdict, options)
+        if self.on_verdict:
+            self.on_verdict(model_text, verdict, options)
+        return verdict
+
+    def submit(self, model_text, options=()):
+        """
+        Start verifying a model text in the background; returns a Future of its verdict.
+        """
+        return self.executor.submit(self.verify, model_text, options)
+
+    def verify_many(self, model_texts):
+        """
+        Verify model texts concurrently; verdicts are returned in input order.
+        """
+        return list(self.executor.map(self.verify, model_texts))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,105 @@
+"""
+Per-job working directories for model files.
+
+The drivers write fixed paths (generated_model.smv, final_safe_model.smv,
+temp.smv), so two concurrent runs overwrite each other's models. A Workspace is a
+unique directory per job, optionally on tmpfs (/dev/shm) so the model files that
+NuSMV reads every iteration never touch the disk. When the job ends its files
+are archived to a results directory and the workspace is removed.
+
+TAPASSURE_WORKSPACE selects where workspaces are created: a directory, "tmpfs",
+or unset for the system temporary directory.
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+TMPFS_DIR = "/dev/shm"
+WORKSPACE_ROOT = os.getenv("TAPASSURE_WORKSPACE")
+
+
+def workspace_root(root=None):
+    """
+    Directory to create workspaces in: `root` (or WORKSPACE_ROOT), where "tmpfs" means
+    /dev/shm if it is available. None means the system temporary directory.
+    """
+    root = root if root is not None else WORKSPACE_ROOT
+    if root == "tmpfs":
+        return TMPFS_DIR if os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK) else None
+    if root:
+        os.makedirs(root, exist_ok=True)
+    return root or None
+
+
+class Workspace:
+    """
+    A unique working directory for one job; use as a context manager.
+
+    On close, the files matching archive_patterns are copied to archive_to (if
+    given), then the directory is removed unless keep=True.
+    """
+
+    def __init__(self, prefix="job-", root=None, archive_to=None, archive_patterns=("*",), keep=False):
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=workspace_root(root))
+        self.archive_to = archive_to
+        self.archive_patterns = archive_patterns
+        self.keep = keep
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def model_file(self, model_text, prefix="model"):
+        """
+        Write a model text to a new, uniquely named .smv file and return its path.
+        """
+        with self.lock:
+            self.counter += 1
+            path = self.file(f"{prefix}-{self.counter}.smv")
+        with open(path, 'w') as f:
+            f.write(model_text)
+        return path
+
+    def archive(self, destination):
+        """
+        Copy the workspace's files (and directories) matching archive_patterns to destination.
+        """
+        os.makedirs(destination, exist_ok=True)
+        for pattern in self.archive_patterns:
+            for source in glob.glob(os.path.join(self.path, pattern)):
+                target = os.path.join(destination, os.path.basename(source))
+                if os.path.isdir(source):
+                    shutil.copytree(source, target, dirs_exist_ok=True)
+                else:
+                    shutil.copy2(source, target)
+
+    def close(self):
+        if self.archive_to:
+            self.archive(self.archive_to)
+        if not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def scratch_model_file(model_text, root=None):
+    """
+    Write a model text to a uniquely named temporary .smv file for the duration of the block.
+    """
+    handle, path = tempfile.mkstemp(prefix="model-", suffix=".smv", dir=workspace_root(root))
+    try:
+        with os.fdopen(handle, 'w') as f:
+            f.write(model_text)
+        yield path
+    finally:
+        os.remove(path)